@@ -0,0 +1,88 @@
+// 账户导入/导出（NDJSON）：在扩展页面中直接通过connectNative端口与原生主机流式交换数据
+// 导出的分块逐个放入Blob再下载，导入从File按字节切片读取，全程不在内存中拼接完整文本
+const AccountTransfer = {
+  NATIVE_HOST_NAME: 'com.cursor.client.manage',
+  CHUNK_BYTES: 256 * 1024,
+
+  // 打开端口并发送流式action；中间的chunk/progress/ready消息交给onEvent处理
+  run(action, params, onEvent) {
+    return new Promise((resolve, reject) => {
+      let settled = false;
+      let port;
+      try {
+        port = chrome.runtime.connectNative(this.NATIVE_HOST_NAME);
+      } catch (error) {
+        reject(new Error(`连接原生主机失败: ${error.message}`));
+        return;
+      }
+
+      port.onMessage.addListener((message) => {
+        if (message.type === 'result' || message.error) {
+          settled = true;
+          port.disconnect();
+          resolve(message);
+          return;
+        }
+        Promise.resolve(onEvent?.(message, port)).catch((error) => {
+          settled = true;
+          port.disconnect();
+          reject(error);
+        });
+      });
+      port.onDisconnect.addListener(() => {
+        if (!settled) {
+          reject(new Error(chrome.runtime.lastError?.message || '原生主机连接已断开'));
+        }
+      });
+      port.postMessage({ action, params });
+    });
+  },
+
+  // 导出全部账户并下载为NDJSON文件
+  async exportToFile(filename = `cursor_accounts_${new Date().toISOString().slice(0, 10)}.ndjson`, onProgress) {
+    const parts = [];
+    const result = await this.run('exportAccounts', {}, (message) => {
+      if (message.type === 'chunk') {
+        // 每块单独转成Blob，交给浏览器的Blob存储，不保留字符串
+        parts.push(new Blob([message.data]));
+      } else if (message.type === 'progress') {
+        onProgress?.(message);
+      }
+    });
+    if (!result.success) {
+      return { success: false, error: result.error };
+    }
+
+    const url = URL.createObjectURL(new Blob(parts, { type: 'application/x-ndjson' }));
+    try {
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = filename;
+      link.click();
+    } finally {
+      setTimeout(() => URL.revokeObjectURL(url), 60 * 1000);
+    }
+    return { success: true, exported: result.exported, filename };
+  },
+
+  // 从File按切片导入；每收到一次ready/progress回复再读取并发送下一片
+  async importFromFile(file, { dryRun = false, chunkBytes = this.CHUNK_BYTES, onProgress } = {}) {
+    // 流式解码，切片边界落在多字节字符中间时留到下一片
+    const decoder = new TextDecoder('utf-8');
+    let offset = 0;
+    let done = false;
+    return await this.run('importAccounts', { stream: true, dryRun }, async (message, port) => {
+      if (message.type === 'progress') {
+        onProgress?.({ ...message, processedBytes: offset, totalBytes: file.size });
+      }
+      if (done || (message.type !== 'ready' && message.type !== 'progress')) {
+        return;
+      }
+      const end = Math.min(offset + chunkBytes, file.size);
+      const buffer = await file.slice(offset, end).arrayBuffer();
+      offset = end;
+      done = offset >= file.size;
+      port.postMessage({ chunk: decoder.decode(buffer, { stream: !done }), done });
+    });
+  }
+};
@@ -1,6 +1,25 @@
 // 原生消息主机配置
 const NATIVE_HOST_NAME = 'com.cursor.client.manage';
 
+// Cursor API基础地址（可通过 chrome.storage.local 中的 apiBaseUrlOverride 指向本地替身服务器）
+const DEFAULT_API_BASE_URL = 'https://api2.cursor.sh';
+
+// 获取当前生效的API基础地址
+async function getApiBaseUrl(explicitBaseUrl) {
+  if (explicitBaseUrl) {
+    return explicitBaseUrl.replace(/\/+$/, '');
+  }
+  try {
+    const { apiBaseUrlOverride } = await chrome.storage.local.get(['apiBaseUrlOverride']);
+    if (apiBaseUrlOverride) {
+      return apiBaseUrlOverride.replace(/\/+$/, '');
+    }
+  } catch (error) {
+    console.warn('⚠️ 读取API地址覆盖配置失败，使用默认地址:', error);
+  }
+  return DEFAULT_API_BASE_URL;
+}
+
 // JWT解码工具函数
 const JWTDecoder = {
   /**
@@ -163,7 +182,16 @@ const messageHandlers = {
   'validateCurrentAccountStatus': validateCurrentAccountStatus,
   'getDeepToken': (data) => getDeepToken(data),
   'pollDeepToken': (data) => pollDeepToken(data),
-  'getAccountList': () => chrome.storage.local.get(['accountList']).then(result => ({ accountList: result.accountList || [] })),
+  'getAccountList': getAccountList,
+  'removeAccount': (data) => removeAccount(data),
+  'clearAccountStore': clearAccountStore,
+  'getAccountUsage': (data) => getAccountUsage(data),
+  'enableVault': enableVault,
+  'setClientAuth': (data) => setClientAuth(data),
+  'rollbackClientAuth': rollbackClientAuth,
+  'getMetrics': (data) => NativeAccountStore.call('getMetrics', data).catch(error => ({ success: false, error: error.message })),
+  'getRecentTraces': () => ({ success: true, traces: NativeTraces.recent }),
+  'getTokenHistory': (data) => NativeAccountStore.call('getTokenHistory', data).catch(error => ({ success: false, error: error.message })),
   'getCurrentAccount': () => chrome.storage.local.get(['currentAccount']).then(result => ({ currentAccount: result.currentAccount || null })),
   'switchAccount': (data) => switchAccount(data),
   'parseFileContent': (data) => parseFileContent(data.content, data.fileType)
@@ -290,9 +318,41 @@ async function autoReadCursorData() {
   }
 }
 
+// 最近的原生消息追踪（span树），供调试页面绘制瀑布图
+const NativeTraces = {
+  MAX_ENTRIES: 20,
+  recent: [],
+
+  // 追踪ID：时间戳 + 随机数，足以在一个浏览器会话内区分请求
+  create() {
+    const random = crypto.getRandomValues(new Uint32Array(2));
+    return {
+      id: `${Date.now().toString(36)}-${random[0].toString(16)}${random[1].toString(16)}`,
+      sentAt: Date.now()
+    };
+  },
+
+  // 记录主机返回的span树，并补上扩展侧收到响应的总耗时
+  record(action, trace, response) {
+    if (!response?.trace) {
+      return;
+    }
+    this.recent.unshift({
+      action,
+      id: trace.id,
+      sentAt: trace.sentAt,
+      roundTripMs: Date.now() - trace.sentAt,
+      spans: response.trace.spans
+    });
+    this.recent.length = Math.min(this.recent.length, this.MAX_ENTRIES);
+  }
+};
+
 // 发送原生消息
 function sendNativeMessage(message) {
   return new Promise((resolve, reject) => {
+    const trace = NativeTraces.create();
+    message = { ...message, trace };
     console.log('发送原生消息:', message);
     
     // 检查原生消息传递权限
@@ -337,6 +397,7 @@ function sendNativeMessage(message) {
           reject(new Error(JSON.stringify(errorInfo, null, 2)));
         } else {
           console.log('原生消息响应:', response);
+          NativeTraces.record(message.action, trace, response);
           resolve(response);
         }
       });
@@ -408,6 +469,210 @@ async function getCursorAuthData() {
   }
 }
 
+// 原生账户存储（原生主机中的SQLite）：每次保存只写一行；不可用时回退到chrome.storage中的accountList数组
+const NativeAccountStore = {
+  available: null,
+  SECRET_FIELDS: ['accessToken', 'refreshToken', 'WorkosCursorSessionToken'],
+
+  // 保险库启用后，chrome.storage中只保留账户的非敏感元数据
+  stripSecrets(account) {
+    const metadata = { ...account, sealed: true };
+    this.SECRET_FIELDS.forEach(field => delete metadata[field]);
+    return metadata;
+  },
+
+  async call(action, params = {}) {
+    const response = await sendNativeMessage({ action, params });
+    if (!response || response.success === false || response.error) {
+      throw new Error(response?.error || `${action} 失败`);
+    }
+    return response;
+  },
+
+  // 检测可用性；可用时每次都把chrome.storage中残留的accountList（包括主机短暂不可用时回退写入的账户）迁移过去
+  async isAvailable() {
+    if (this.available === false) {
+      return false;
+    }
+    if (this.available === null) {
+      try {
+        await this.call('listAccounts', { limit: 1 });
+        this.available = true;
+      } catch (error) {
+        console.warn('⚠️ 原生账户存储不可用，使用chrome.storage:', error.message);
+        this.available = false;
+        return false;
+      }
+    }
+    try {
+      await this.migrateLeftovers();
+    } catch (error) {
+      // 残留账户留在accountList中，下次调用时再迁移
+      console.warn('⚠️ 迁移chrome.storage中的账户失败:', error.message);
+    }
+    return true;
+  },
+
+  // 把accountList写入原生账户存储；主机拒绝的条目（如缺少email）继续保留，其余从chrome.storage删除
+  async migrateLeftovers() {
+    const { accountList } = await chrome.storage.local.get(['accountList']);
+    if (!accountList || accountList.length === 0) {
+      return;
+    }
+    const result = await this.call('upsertAccount', { accounts: accountList });
+    console.log('📦 已将账户列表迁移到原生账户存储:', result.count);
+    const rejected = result.rejected || [];
+    if (rejected.length > 0) {
+      console.warn('⚠️ 以下账户未能迁移，仍保留在chrome.storage中:', rejected);
+      await chrome.storage.local.set({ accountList: rejected.map(item => accountList[item.index]) });
+    } else {
+      // 迁移成功后不在chrome.storage中保留明文令牌的副本
+      await chrome.storage.local.remove(['accountList']);
+    }
+  },
+
+  // 按紧急程度读取全部账户（当前账户置顶，附带原生主机预计算的expiryInfo）
+  async listAll(currentEmail, pageSize = 500) {
+    const accounts = [];
+    let offset = 0;
+    let hasMore = true;
+    while (hasMore) {
+      const page = await this.call('listAccountsByUrgency', { offset, limit: pageSize, currentEmail });
+      accounts.push(...page.accounts);
+      offset += page.accounts.length;
+      hasMore = page.hasMore && page.accounts.length > 0;
+    }
+    return accounts;
+  }
+};
+
+// 获取账户列表
+async function getAccountList() {
+  if (await NativeAccountStore.isAvailable()) {
+    try {
+      const { currentAccount } = await chrome.storage.local.get(['currentAccount']);
+      return { accountList: await NativeAccountStore.listAll(currentAccount?.email) };
+    } catch (error) {
+      console.warn('⚠️ 从原生账户存储读取失败，回退到chrome.storage:', error);
+    }
+  }
+  const result = await chrome.storage.local.get(['accountList']);
+  return { accountList: result.accountList || [] };
+}
+
+// 删除账户
+async function removeAccount({ email, userid }) {
+  try {
+    if (await NativeAccountStore.isAvailable()) {
+      await NativeAccountStore.call('deleteAccount', { email, userid });
+    } else {
+      const result = await chrome.storage.local.get(['accountList']);
+      const accountList = (result.accountList || []).filter(acc =>
+        !(acc.email === email && acc.userid === userid)
+      );
+      await chrome.storage.local.set({ accountList });
+    }
+
+    // 如果删除的是当前账户，清除当前账户状态
+    const { currentAccount } = await chrome.storage.local.get(['currentAccount']);
+    if (currentAccount && currentAccount.email === email && currentAccount.userid === userid) {
+      await chrome.storage.local.remove(['currentAccount']);
+    }
+    return { success: true };
+  } catch (error) {
+    console.error('❌ 删除账户失败:', error);
+    return { success: false, error: error.message };
+  }
+}
+
+// 清空原生账户存储（清空全部数据时调用）
+async function clearAccountStore() {
+  try {
+    if (await NativeAccountStore.isAvailable()) {
+      await NativeAccountStore.call('deleteAccount', { all: true });
+    }
+    NativeAccountStore.available = null;
+    return { success: true };
+  } catch (error) {
+    return { success: false, error: error.message };
+  }
+}
+
+// 启用原生保险库：已有账户逐条加密，并清除chrome.storage中的明文副本
+async function enableVault() {
+  try {
+    const result = await NativeAccountStore.call('enableVault');
+    await chrome.storage.local.remove(['accountList']);
+    const { currentAccount } = await chrome.storage.local.get(['currentAccount']);
+    if (currentAccount) {
+      await chrome.storage.local.set({ currentAccount: NativeAccountStore.stripSecrets(currentAccount) });
+    }
+    return result;
+  } catch (error) {
+    console.error('❌ 启用保险库失败:', error);
+    return { success: false, error: error.message };
+  }
+}
+
+// 把账户写入Cursor客户端（state.vscdb），旧值由原生主机备份，可用rollbackClientAuth撤销
+async function setClientAuth({ email, userid }) {
+  try {
+    const result = await NativeAccountStore.call('setClientAuth', { email, userid });
+    console.log('🖥️ 已写入客户端登录状态:', email, `持锁 ${result.lockHeldMs}ms`);
+    return result;
+  } catch (error) {
+    console.error('❌ 写入客户端登录状态失败:', error);
+    return { success: false, error: error.message };
+  }
+}
+
+// 撤销最近一次客户端登录状态写入
+async function rollbackClientAuth() {
+  try {
+    return await NativeAccountStore.call('rollbackClientAuth');
+  } catch (error) {
+    return { success: false, error: error.message };
+  }
+}
+
+// 查询账户用量/会员信息（原生主机带磁盘缓存，过期数据在refreshWait内刷新，超时先返回旧数据）
+async function getAccountUsage(options = {}) {
+  try {
+    const params = {
+      maxAge: options.maxAge,
+      refreshWait: options.refreshWait,
+      concurrency: options.concurrency,
+      forceRefresh: !!options.forceRefresh
+    };
+    if (!(await NativeAccountStore.isAvailable())) {
+      const { accountList } = await chrome.storage.local.get(['accountList']);
+      params.accounts = accountList || [];
+      return await NativeAccountStore.call('getAccountUsage', params);
+    }
+
+    // 账户存储按offset分页读取，逐页合并结果
+    const merged = { success: true, results: [], sources: {}, elapsedMs: 0 };
+    let offset = 0;
+    let hasMore = true;
+    while (hasMore) {
+      const page = await NativeAccountStore.call('getAccountUsage', { ...params, offset, limit: options.pageSize || 200 });
+      merged.results.push(...page.results);
+      Object.entries(page.sources).forEach(([source, count]) => {
+        merged.sources[source] = (merged.sources[source] || 0) + count;
+      });
+      merged.elapsedMs += page.elapsedMs;
+      merged.total = page.total;
+      merged.backgroundRefreshes = page.backgroundRefreshes;
+      offset += page.results.length;
+      hasMore = page.hasMore && page.results.length > 0;
+    }
+    return merged;
+  } catch (error) {
+    console.error('❌ 查询账户用量失败:', error);
+    return { success: false, error: error.message };
+  }
+}
+
 // 保存到localStorage
 async function saveToLocalStorage(data) {
   try {
@@ -418,28 +683,45 @@ async function saveToLocalStorage(data) {
       accessTokenLength: data.accessToken ? data.accessToken.length : 0
     });
 
-    // 获取现有的账户列表
-    const result = await chrome.storage.local.get(['accountList']);
-    let accountList = result.accountList || [];
-    
-    // 检查是否已存在相同email的账户
-    const existingIndex = accountList.findIndex(account => account.email === data.email);
-    
-    if (existingIndex >= 0) {
-      // 更新现有账户
-      console.log('🔄 更新现有账户:', data.email);
-      accountList[existingIndex] = data;
-    } else {
-      // 添加新账户
-      console.log('➕ 添加新账户:', data.email);
-      accountList.push(data);
+    let savedToNativeStore = false;
+    if (await NativeAccountStore.isAvailable()) {
+      try {
+        // 原生账户存储只写入这一行
+        const upsertResult = await NativeAccountStore.call('upsertAccount', { account: data });
+        console.log(upsertResult.created ? '➕ 添加新账户:' : '🔄 更新现有账户:', data.email);
+        await chrome.storage.local.set({
+          currentAccount: upsertResult.sealed ? NativeAccountStore.stripSecrets(data) : data
+        });
+        savedToNativeStore = true;
+      } catch (error) {
+        console.warn('⚠️ 写入原生账户存储失败，回退到chrome.storage:', error);
+      }
+    }
+
+    if (!savedToNativeStore) {
+      // 获取现有的账户列表
+      const result = await chrome.storage.local.get(['accountList']);
+      let accountList = result.accountList || [];
+      
+      // 检查是否已存在相同email的账户
+      const existingIndex = accountList.findIndex(account => account.email === data.email);
+      
+      if (existingIndex >= 0) {
+        // 更新现有账户
+        console.log('🔄 更新现有账户:', data.email);
+        accountList[existingIndex] = data;
+      } else {
+        // 添加新账户
+        console.log('➕ 添加新账户:', data.email);
+        accountList.push(data);
+      }
+      
+      // 保存到chrome.storage
+      await chrome.storage.local.set({ 
+        accountList: accountList,
+        currentAccount: data
+      });
     }
-    
-    // 保存到chrome.storage
-    await chrome.storage.local.set({ 
-      accountList: accountList,
-      currentAccount: data
-    });
     console.log('✅ 账户数据已保存到Storage');
 
     // 统一在这里设置Cookie，确保Storage和Cookie同步
@@ -680,6 +962,13 @@ async function switchAccount(accountData) {
       throw new Error('账户数据为空，无法切换账户');
     }
 
+    // 加密存储的账户列表只含元数据，切换时才从原生保险库解密这一条记录；currentAccount仍只保存元数据
+    const storedAccount = accountData;
+    if (accountData.sealed && !accountData.accessToken && !accountData.WorkosCursorSessionToken) {
+      const { account } = await NativeAccountStore.call('getAccount', { email: accountData.email, reveal: true });
+      accountData = account;
+    }
+
     // 提取accessToken，支持两种格式
     let accessToken;
     if (accountData.accessToken) {
@@ -704,7 +993,7 @@ async function switchAccount(accountData) {
       accessToken: accessToken
     });
     
-    await chrome.storage.local.set({ currentAccount: accountData });
+    await chrome.storage.local.set({ currentAccount: storedAccount });
     
     return { success: true, message: '账户切换成功' };
   } catch (error) {
@@ -1052,15 +1341,16 @@ async function validateCurrentAccountStatus() {
 
 // 轮询深度Token（在background中处理，避免CORS问题）
 async function pollDeepToken(params) {
-  const { uuid, verifier, maxAttempts = 30, pollInterval = 2000 } = params;
+  const { uuid, verifier, maxAttempts = 30, pollInterval = 2000, apiBaseUrl } = params;
+  const baseUrl = await getApiBaseUrl(apiBaseUrl);
   
-  console.log('🔄 Background开始轮询深度Token...', { uuid: uuid.substring(0, 8) + '...', maxAttempts });
+  console.log('🔄 Background开始轮询深度Token...', { uuid: uuid.substring(0, 8) + '...', maxAttempts, baseUrl });
   
   for (let attempt = 1; attempt <= maxAttempts; attempt++) {
     try {
       console.log(`🔄 Background轮询尝试 ${attempt}/${maxAttempts}...`);
       
-      const pollUrl = `https://api2.cursor.sh/auth/poll?uuid=${uuid}&verifier=${verifier}`;
+      const pollUrl = `${baseUrl}/auth/poll?uuid=${uuid}&verifier=${verifier}`;
       
       const response = await fetch(pollUrl, {
         headers: {
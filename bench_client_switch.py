@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+客户端账户切换延迟压测
+在合成的 state.vscdb（gen_cursor_profile生成）上对比两种切换方式:
+  - direct:   SetClientAuth 传入账户，现场生成cursorAuth键值
+  - snapshot: 使用账户存储中预生成的cursorAuth快照，省去解密账户和生成键值
+两种方式的写入路径相同：加锁前读取旧值并暂存备份，写锁内重新读取旧值后一次批量upsert，
+COMMIT后才替换正式备份。
+
+分别测量客户端空闲时和另一个进程持续写入（模拟Cursor自身写入）时的延迟。
+
+用法:
+  python3 bench_client_switch.py [--switches 300] [--accounts 50] [--filler-rows 2000]
+                                 [--writer-interval-ms 5] [--writer-batch 20]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+# 避免在扩展目录下生成__pycache__导致Chrome扩展加载失败
+sys.dont_write_bytecode = True
+
+from fake_cursor_server import make_fake_jwt, percentile  # noqa: E402
+from gen_cursor_profile import create_state_db  # noqa: E402
+
+
+def prepare_state_db(path: str, filler_rows: int, journal_mode: str) -> None:
+    """生成state.vscdb（生成器固定为WAL模式），再切换到要测的日志模式"""
+    create_state_db(path, filler_rows, make_fake_jwt("user_original", 30), email="original@example.com")
+    if journal_mode != "wal":
+        conn = sqlite3.connect(path)
+        conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        conn.close()
+
+
+def background_writer(path: str, filler_rows: int, batch: int, interval_ms: float, stop_event: Any) -> None:
+    """模拟Cursor自身的写入：反复用写事务更新一批键"""
+    rng = random.Random()
+    conn = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+    while not stop_event.is_set():
+        conn.execute("BEGIN IMMEDIATE")
+        for _ in range(batch):
+            conn.execute("INSERT OR REPLACE INTO ItemTable (key, value) VALUES (?, ?)",
+                         (f"workbench.state.{rng.randrange(filler_rows)}", "y" * rng.randint(64, 4096)))
+        conn.execute("COMMIT")
+        if interval_ms > 0:
+            time.sleep(interval_ms / 1000.0)
+    conn.close()
+
+
+def run_switches(mode: str, switches: int, accounts: List[Dict[str, Any]], store: Any, writer: Any) -> Dict[str, Any]:
+    from native_host import SetClientAuthHandler
+
+    handler = SetClientAuthHandler(store, writer)
+    latencies: List[float] = []
+    waited: List[float] = []
+    held: List[float] = []
+    failures = 0
+    for i in range(switches):
+        account = accounts[i % len(accounts)]
+        params = {"account": account} if mode == "direct" else {"email": account["email"]}
+        start = time.perf_counter()
+        result = handler.handle(params)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        if not result.get("success"):
+            failures += 1
+            continue
+        latencies.append(elapsed)
+        waited.append(result["waitedMs"])
+        held.append(result["lockHeldMs"])
+
+    latencies.sort()
+    held.sort()
+    return {
+        "switches": switches,
+        "failures": failures,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0
+        },
+        "lock_wait_ms_mean": round(sum(waited) / len(waited), 3) if waited else 0.0,
+        "lock_held_ms": {
+            "p50": round(percentile(held, 50), 3),
+            "p99": round(percentile(held, 99), 3)
+        }
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    work_dir = tempfile.mkdtemp(prefix="cursor_switch_bench_")
+    os.environ["CURSOR_HOST_DATA_DIR"] = work_dir
+    from native_host import AccountStore, ClientAuthWriter
+
+    db_path = os.path.join(work_dir, "state.vscdb")
+    prepare_state_db(db_path, args.filler_rows, args.journal_mode)
+
+    store = AccountStore()
+    accounts = []
+    for i in range(args.accounts):
+        account = {
+            "email": f"bench{i:04d}@example.com",
+            "userid": f"user_bench{i:04d}",
+            "accessToken": make_fake_jwt(f"user_bench{i:04d}", 30),
+            "tokenType": "deep"
+        }
+        store.upsert(account)
+        accounts.append(account)
+    writer = ClientAuthWriter(db_path=db_path, lock_timeout=args.lock_timeout)
+
+    report: Dict[str, Any] = {
+        "config": {
+            "accounts": args.accounts,
+            "filler_rows": args.filler_rows,
+            "journal_mode": args.journal_mode,
+            "writer_interval_ms": args.writer_interval_ms,
+            "writer_batch": args.writer_batch,
+            "lock_timeout": args.lock_timeout
+        }
+    }
+    for mode in ("direct", "snapshot"):
+        report.setdefault("idle", {})[mode] = run_switches(mode, args.switches, accounts, store, writer)
+
+    stop_event = multiprocessing.Event()
+    process = multiprocessing.Process(
+        target=background_writer,
+        args=(db_path, args.filler_rows, args.writer_batch, args.writer_interval_ms, stop_event),
+        daemon=True
+    )
+    process.start()
+    try:
+        time.sleep(0.2)  # 等待写入进程进入稳定状态
+        for mode in ("direct", "snapshot"):
+            report.setdefault("under_write_load", {})[mode] = run_switches(
+                mode, args.switches, accounts, store, writer
+            )
+    finally:
+        stop_event.set()
+        process.join(timeout=10)
+        store.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="客户端账户切换延迟压测（合成state.vscdb）")
+    parser.add_argument("--switches", type=int, default=300, help="每种场景的切换次数")
+    parser.add_argument("--accounts", type=int, default=50, help="账户数量")
+    parser.add_argument("--filler-rows", type=int, default=2000, help="state.vscdb中的无关键值数量")
+    parser.add_argument("--journal-mode", default="wal", choices=["wal", "delete"], help="合成数据库的日志模式")
+    parser.add_argument("--writer-interval-ms", type=float, default=5.0, help="模拟写入的事务间隔(毫秒)")
+    parser.add_argument("--writer-batch", type=int, default=20, help="模拟写入每个事务更新的键数")
+    parser.add_argument("--lock-timeout", type=float, default=2.0, help="等待写锁的上限(秒)")
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+原生主机冷启动回归测试
+spawn模式（chrome.runtime.sendNativeMessage）下每条消息都启动一个新进程，真正影响体验的是
+从启动进程到读到第一个响应字节的时间。本脚本按原生消息格式反复启动 native_host.py，
+借助响应中的trace把每次启动拆分为:
+  interpreter  启动进程到 native_host 模块开始执行（进程创建 + 解释器初始化 + 编译主机脚本）
+  compile      interpreter 减去空解释器（python -c pass）的启动耗时，即编译/加载主机代码的开销
+  imports      模块导入与模块级初始化
+  serverInit   NativeHostServer 构造（注册处理器、打开账户库等）
+  awaitMessage 构造完成到读到消息首字节
+  decode       读取并解析消息
+  handler      处理器执行
+  respond      处理完成到客户端读到首字节（编码、写管道）
+
+可同时测多个Python版本，并按预算门禁（超出时退出码为1），结果可追加到历史文件按版本跟踪。
+--layout installed 按 install_native_host.py 的安装方式（启动器 + 可缓存字节码的主机模块）启动，
+用来对比直接运行脚本时每次重新编译的开销。
+
+用法:
+  python3 bench_cold_start.py [--runs 20] [--warmup 2] [--action testConnection]
+                              [--python python3.9 --python python3.12]
+                              [--budget-ms 400] [--budget-percentile 95]
+                              [--phase-budget imports=150 ...] [--history cold_start.jsonl]
+                              [--importtime 10] [--layout script|installed]
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# 避免在扩展目录下生成__pycache__导致Chrome扩展加载失败
+sys.dont_write_bytecode = True
+
+from debug_native_messaging import frame_message  # noqa: E402
+from fake_cursor_server import percentile  # noqa: E402
+from install_native_host import write_host_files  # noqa: E402
+
+HOST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "native_host.py")
+PHASES = ("interpreter", "compile", "imports", "serverInit", "awaitMessage", "decode", "handler", "respond")
+# trace中的span名 -> 阶段名
+SPAN_PHASES = {"processSpawn": "interpreter", "imports": "imports", "serverInit": "serverInit",
+               "awaitMessage": "awaitMessage", "decode": "decode", "handler": "handler"}
+
+
+def python_version(python: str) -> str:
+    output = subprocess.run([python, "-c", "import platform; print(platform.python_version())"],
+                            capture_output=True, text=True, check=True)
+    return output.stdout.strip()
+
+
+def extract_phases(trace: Dict[str, Any]) -> Dict[str, float]:
+    """从首条消息的span树中取出各阶段耗时"""
+    phases: Dict[str, float] = {}
+    stack = [trace.get("spans", {})]
+    while stack:
+        span = stack.pop()
+        phase = SPAN_PHASES.get(span.get("name"))
+        if phase and span.get("durationMs") is not None:
+            phases[phase] = span["durationMs"]
+        stack.extend(span.get("children", []))
+    return phases
+
+
+def host_command(python: str, host_path: str) -> List[str]:
+    # 直接运行扩展目录中的脚本时禁止写字节码；安装布局的启动器自己把缓存写到数据目录
+    return [python, "-B", host_path] if host_path == HOST_PATH else [python, host_path]
+
+
+def launch_once(python: str, action: str, env: Dict[str, str], timeout: float,
+                host_path: str = HOST_PATH) -> Dict[str, Any]:
+    """启动一次主机进程并发送一条带trace的消息，返回首字节时间和各阶段耗时"""
+    sent_at = time.time()
+    started = time.perf_counter()
+    process = subprocess.Popen(host_command(python, host_path), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, env=env)
+    try:
+        process.stdin.write(frame_message({"action": action, "trace": {"id": "cold-start", "sentAt": sent_at * 1000}}))
+        process.stdin.flush()
+        first = process.stdout.read(1)
+        first_byte_ms = (time.perf_counter() - started) * 1000.0
+        if not first:
+            return {"error": "no_response"}
+        header = first + process.stdout.read(3)
+        body = process.stdout.read(struct.unpack('@I', header)[0])
+        response = json.loads(body.decode('utf-8'))
+    finally:
+        process.stdin.close()
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    exit_ms = (time.perf_counter() - started) * 1000.0
+
+    result: Dict[str, Any] = {"firstByteMs": first_byte_ms, "exitMs": exit_ms, "exitCode": process.returncode}
+    if "error" in response and "trace" not in response:
+        result["error"] = response["error"]
+    trace = response.get("trace")
+    if isinstance(trace, dict):
+        phases = extract_phases(trace)
+        host_ms = trace.get("spans", {}).get("durationMs")
+        if host_ms is not None:
+            phases["respond"] = max(0.0, first_byte_ms - host_ms)
+        result["phases"] = phases
+    return result
+
+
+def measure_python_baseline(python: str, runs: int) -> float:
+    """空解释器（python -c pass）的启动耗时中位数，用于区分解释器本身和主机代码的开销"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([python, "-B", "-c", "pass"], check=True)
+        samples.append((time.perf_counter() - started) * 1000.0)
+    samples.sort()
+    return round(percentile(samples, 50), 3)
+
+
+def import_profile(python: str, env: Dict[str, str], top: int, host_path: str = HOST_PATH) -> List[Dict[str, Any]]:
+    """用 -X importtime 启动一次，返回累计导入耗时最高的模块（顶层包）"""
+    command = host_command(python, host_path)
+    process = subprocess.run(command[:1] + ["-X", "importtime"] + command[1:] + ["help"],
+                             capture_output=True, text=True, env=env)
+    rows = []
+    pattern = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+    for line in process.stderr.splitlines():
+        match = pattern.match(line)
+        # 缩进为1的是被直接导入的顶层模块，cumulative包含其依赖
+        if match and len(match.group(3)) == 1:
+            rows.append({"module": match.group(4), "cumulativeMs": round(int(match.group(2)) / 1000.0, 3),
+                         "selfMs": round(int(match.group(1)) / 1000.0, 3)})
+    rows.sort(key=lambda row: row["cumulativeMs"], reverse=True)
+    return rows[:top]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(values)
+    if not values:
+        return {"p50": None, "p95": None, "mean": None, "max": None}
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(values[-1], 3)
+    }
+
+
+def run_for_python(python: str, args: argparse.Namespace, env: Dict[str, str], host_path: str) -> Dict[str, Any]:
+    for _ in range(args.warmup):
+        launch_once(python, args.action, env, args.timeout, host_path)
+
+    baseline_ms = measure_python_baseline(python, min(args.runs, 10))
+    runs = [launch_once(python, args.action, env, args.timeout, host_path) for _ in range(args.runs)]
+    ok = [run for run in runs if "phases" in run]
+    for run in ok:
+        if "interpreter" in run["phases"]:
+            run["phases"]["compile"] = max(0.0, run["phases"]["interpreter"] - baseline_ms)
+    report: Dict[str, Any] = {
+        "python": python,
+        "version": python_version(python),
+        "layout": args.layout,
+        "runs": args.runs,
+        "failures": len(runs) - len(ok),
+        "errors": sorted({run["error"] for run in runs if "error" in run}),
+        "emptyInterpreterMs": baseline_ms,
+        "firstByteMs": summarize([run["firstByteMs"] for run in ok]),
+        "exitMs": summarize([run["exitMs"] for run in ok]),
+        "phasesMs": {phase: summarize([run["phases"][phase] for run in ok if phase in run["phases"]])
+                     for phase in PHASES}
+    }
+    if args.importtime:
+        report["topImports"] = import_profile(python, env, args.importtime, host_path)
+    return report
+
+
+def check_budgets(report: Dict[str, Any], args: argparse.Namespace) -> List[str]:
+    """返回超出预算的说明，为空表示通过"""
+    key = f"p{args.budget_percentile}"
+    violations = []
+    if report["failures"]:
+        violations.append(f"{report['failures']} 次启动没有得到带trace的响应")
+    value = report["firstByteMs"][key]
+    if args.budget_ms is not None and value is not None and value > args.budget_ms:
+        violations.append(f"首字节 {key} {value}ms > 预算 {args.budget_ms}ms")
+    for spec in args.phase_budget:
+        phase, _, limit = spec.partition("=")
+        if phase not in PHASES:
+            violations.append(f"未知阶段: {phase}（可选 {', '.join(PHASES)}）")
+            continue
+        phase_value = report["phasesMs"][phase][key]
+        if phase_value is not None and phase_value > float(limit):
+            violations.append(f"{phase} {key} {phase_value}ms > 预算 {limit}ms")
+    return violations
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(HOST_PATH), check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="原生主机冷启动（启动进程到首个响应字节）回归测试")
+    parser.add_argument("--runs", type=int, default=20, help="每个解释器的启动次数")
+    parser.add_argument("--warmup", type=int, default=2, help="不计入统计的预热启动次数")
+    parser.add_argument("--action", default="testConnection", help="发送的action")
+    parser.add_argument("--python", action="append", help="要测试的解释器，可重复；默认当前解释器")
+    parser.add_argument("--budget-ms", type=float, help="首字节耗时预算（毫秒）")
+    parser.add_argument("--budget-percentile", type=int, default=50, choices=[50, 95], help="预算对比的分位数")
+    parser.add_argument("--phase-budget", action="append", default=[], help="阶段预算 阶段=毫秒，可重复")
+    parser.add_argument("--history", help="把结果追加到该JSONL文件，按Python版本跟踪")
+    parser.add_argument("--importtime", type=int, default=0, help="附带 -X importtime 耗时最高的N个顶层模块")
+    parser.add_argument("--timeout", type=float, default=10.0, help="单次启动超时（秒）")
+    parser.add_argument("--layout", choices=["script", "installed"], default="script",
+                        help="script: 直接运行native_host.py；installed: 按安装后的启动器+模块布局运行")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="cursor_cold_start_")
+    env = os.environ.copy()
+    env["CURSOR_HOST_DATA_DIR"] = os.path.join(work_dir, "data")
+    host_path = HOST_PATH
+    if args.layout == "installed":
+        host_dir = os.path.join(work_dir, "host")
+        os.makedirs(host_dir)
+        host_path = write_host_files(host_dir, HOST_PATH)
+    else:
+        env["PYTHONDONTWRITEBYTECODE"] = "1"
+
+    results = []
+    failed = False
+    try:
+        for python in args.python or [sys.executable]:
+            report = run_for_python(python, args, env, host_path)
+            report["violations"] = check_budgets(report, args)
+            failed = failed or bool(report["violations"])
+            results.append(report)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = {
+        "timestamp": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "platform": f"{platform.system()} {platform.release()} {platform.machine()}",
+        "action": args.action,
+        "budget": {"firstByteMs": args.budget_ms, "percentile": args.budget_percentile,
+                   "phases": args.phase_budget},
+        "passed": not failed,
+        "results": results
+    }
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary, ensure_ascii=False, separators=(",", ":")) + "\n")
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,13 @@
 """
 Chrome原生消息传递调试工具
 模拟Chrome与原生主机的完整通信过程
+
+用法:
+  python3 debug_native_messaging.py [--json] [--no-cache] [--jobs 8]
+  # 检查环境并发送测试消息（打印十六进制）；检查项并行执行，--json 输出含每项耗时的报告
+  python3 debug_native_messaging.py load [--clients 8] [--mode spawn|persistent]
+                                         [--requests 50 | --duration 10] [--mix 动作=权重,...]
+  # 模拟多个Chrome客户端并发访问原生主机，输出延迟分位数、吞吐量和错误率（JSON）
 """
 
 import sys
@@ -10,13 +17,28 @@ import struct
 import subprocess
 import os
 import time
+import random
+import shutil
+import tempfile
+import threading
+import argparse
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# 避免在扩展目录下生成__pycache__导致Chrome扩展加载失败
+sys.dont_write_bytecode = True
+
+from diagnostics import (  # noqa: E402
+    DiagnosticCheck, DiagnosticsEngine, add_engine_arguments,
+    manifest_fingerprint_paths, run_engine
+)
+from fake_cursor_server import percentile  # noqa: E402
 
-def send_native_message(host_path, message):
-    """模拟Chrome发送原生消息的完整过程"""
-    print(f"🚀 模拟Chrome向原生主机发送消息...")
-    print(f"📍 主机路径: {host_path}")
-    print(f"📨 消息内容: {json.dumps(message, indent=2)}")
+def send_native_message(host_path, message, log=print):
+    """模拟Chrome发送原生消息的完整过程，输出通过log写出（诊断引擎并行执行时写入各自的检查项）"""
+    log(f"🚀 模拟Chrome向原生主机发送消息...")
+    log(f"📍 主机路径: {host_path}")
+    log(f"📨 消息内容: {json.dumps(message, indent=2)}")
     
     try:
         # 启动原生主机进程
@@ -32,13 +54,13 @@ def send_native_message(host_path, message):
         message_bytes = message_json.encode('utf-8')
         message_length = len(message_bytes)
         
-        print(f"📏 消息长度: {message_length} 字节")
+        log(f"📏 消息长度: {message_length} 字节")
         
         # 按Chrome原生消息格式发送
         length_bytes = struct.pack('@I', message_length)
         
-        print(f"🔢 发送长度头: {length_bytes.hex()}")
-        print(f"📝 发送消息体: {message_json}")
+        log(f"🔢 发送长度头: {length_bytes.hex()}")
+        log(f"📝 发送消息体: {message_json}")
         
         # 发送长度头和消息体
         process.stdin.write(length_bytes)
@@ -46,148 +68,438 @@ def send_native_message(host_path, message):
         process.stdin.flush()
         
         # 等待响应
-        print("⏳ 等待原生主机响应...")
+        log("⏳ 等待原生主机响应...")
         
         # 设置超时
         try:
             stdout, stderr = process.communicate(timeout=10)
             
-            print(f"📤 进程退出码: {process.returncode}")
+            log(f"📤 进程退出码: {process.returncode}")
             
             if stderr:
-                print(f"⚠️ 错误输出: {stderr.decode('utf-8', errors='ignore')}")
+                log(f"⚠️ 错误输出: {stderr.decode('utf-8', errors='ignore')}")
             
             if stdout:
-                print(f"📥 原始输出: {stdout}")
-                print(f"📥 原始输出(hex): {stdout.hex()}")
+                log(f"📥 原始输出: {stdout}")
+                log(f"📥 原始输出(hex): {stdout.hex()}")
                 
                 # 尝试解析响应
                 if len(stdout) >= 4:
                     response_length = struct.unpack('@I', stdout[:4])[0]
-                    print(f"📏 响应长度: {response_length}")
+                    log(f"📏 响应长度: {response_length}")
                     
                     if len(stdout) >= 4 + response_length:
                         response_data = stdout[4:4+response_length]
-                        print(f"📨 响应数据: {response_data.decode('utf-8', errors='ignore')}")
+                        log(f"📨 响应数据: {response_data.decode('utf-8', errors='ignore')}")
                         
                         try:
                             response_json = json.loads(response_data.decode('utf-8'))
-                            print(f"✅ 解析成功: {json.dumps(response_json, indent=2)}")
+                            log(f"✅ 解析成功: {json.dumps(response_json, indent=2)}")
                             return response_json
                         except json.JSONDecodeError as e:
-                            print(f"❌ JSON解析失败: {e}")
+                            log(f"❌ JSON解析失败: {e}")
                     else:
-                        print(f"❌ 响应数据不完整: 期望{response_length}字节，实际{len(stdout)-4}字节")
+                        log(f"❌ 响应数据不完整: 期望{response_length}字节，实际{len(stdout)-4}字节")
                 else:
-                    print("❌ 响应太短，无法读取长度头")
+                    log("❌ 响应太短，无法读取长度头")
             else:
-                print("❌ 无输出数据")
+                log("❌ 无输出数据")
                 
         except subprocess.TimeoutExpired:
-            print("⏰ 进程超时，强制终止")
+            log("⏰ 进程超时，强制终止")
             process.kill()
             stdout, stderr = process.communicate()
             
         return None
         
     except Exception as e:
-        print(f"❌ 调试过程中发生错误: {e}")
+        log(f"❌ 调试过程中发生错误: {e}")
         import traceback
-        traceback.print_exc()
+        log(traceback.format_exc())
         return None
 
-def check_native_host_environment():
-    """检查原生主机环境"""
-    print("🔍 检查原生主机环境...")
-    
+MANIFEST_PATH = os.path.expanduser("~/Library/Application Support/Google/Chrome/NativeMessagingHosts/com.cursor.client.manage.json")
+REQUIRED_MODULES = ['json', 'struct', 'sqlite3', 'base64', 'jwt']
+TEST_MESSAGES = [
+    {"action": "test_connection"},
+    {"action": "getClientCurrentData"},
+    {"action": "ping"}
+]
+
+def check_native_host_environment(ctx):
+    """检查原生主机环境，details中返回主机脚本路径"""
     # 检查配置文件
-    config_path = os.path.expanduser("~/Library/Application Support/Google/Chrome/NativeMessagingHosts/com.cursor.client.manage.json")
-    if os.path.exists(config_path):
-        print(f"✅ 配置文件存在: {config_path}")
-        with open(config_path, 'r') as f:
-            config = json.load(f)
-            print(f"📋 配置内容: {json.dumps(config, indent=2)}")
-            
-            host_path = config.get('path')
-            if os.path.exists(host_path):
-                print(f"✅ 主机脚本存在: {host_path}")
-                
-                # 检查权限
-                stat_info = os.stat(host_path)
-                permissions = oct(stat_info.st_mode)[-3:]
-                print(f"🔐 脚本权限: {permissions}")
-                
-                # 检查shebang
-                with open(host_path, 'r') as f:
-                    first_line = f.readline().strip()
-                    print(f"🔧 Shebang: {first_line}")
-                
-                return host_path, config
-            else:
-                print(f"❌ 主机脚本不存在: {host_path}")
-                return None, None
-    else:
-        print(f"❌ 配置文件不存在: {config_path}")
-        return None, None
-
-def test_python_environment():
-    """测试Python环境"""
-    print("\n🐍 测试Python环境...")
+    if not os.path.exists(MANIFEST_PATH):
+        ctx.issue(f"配置文件不存在: {MANIFEST_PATH}")
+        return None
+    ctx.log(f"✅ 配置文件存在: {MANIFEST_PATH}")
+    with open(MANIFEST_PATH, 'r') as f:
+        config = json.load(f)
+    ctx.log(f"📋 配置内容: {json.dumps(config, indent=2)}")
+    
+    host_path = config.get('path')
+    if not host_path or not os.path.exists(host_path):
+        ctx.issue(f"主机脚本不存在: {host_path}")
+        return None
+    ctx.log(f"✅ 主机脚本存在: {host_path}")
+    
+    # 检查权限
+    stat_info = os.stat(host_path)
+    permissions = oct(stat_info.st_mode)[-3:]
+    ctx.log(f"🔐 脚本权限: {permissions}")
+    
+    # 检查shebang
+    with open(host_path, 'r') as f:
+        first_line = f.readline().strip()
+        ctx.log(f"🔧 Shebang: {first_line}")
     
-    # 检查python3可用性
+    return {"host_path": host_path}
+
+def test_python_environment(ctx):
+    """测试python3可用性"""
     try:
         result = subprocess.run(['python3', '--version'], capture_output=True, text=True)
-        print(f"✅ Python版本: {result.stdout.strip()}")
-        print(f"📍 Python路径: {subprocess.check_output(['which', 'python3'], text=True).strip()}")
+        ctx.log(f"✅ Python版本: {result.stdout.strip()}")
+        ctx.log(f"📍 Python路径: {subprocess.check_output(['which', 'python3'], text=True).strip()}")
     except Exception as e:
-        print(f"❌ Python3不可用: {e}")
-        return False
-    
-    # 检查必要的Python模块
-    required_modules = ['json', 'struct', 'sqlite3', 'base64', 'jwt']
-    for module in required_modules:
+        ctx.issue(f"Python3不可用: {e}")
+
+def python_module_check(module):
+    """检查python3能否导入指定模块"""
+    def check(ctx):
         try:
             subprocess.check_call(['python3', '-c', f'import {module}'], 
                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            print(f"✅ 模块 {module}: 可用")
+            ctx.log(f"✅ 模块 {module}: 可用")
         except subprocess.CalledProcessError:
-            print(f"❌ 模块 {module}: 不可用")
-            return False
-    
-    return True
+            ctx.issue(f"模块 {module}: 不可用")
+    return check
+
+def message_check(message):
+    """向主机发送一条测试消息；details只保留状态和耗时，不保留响应内容（可能含token）"""
+    def check(ctx):
+        started = time.perf_counter()
+        response = send_native_message(ctx.details("environment")["host_path"], message, log=ctx.log)
+        latency_ms = round((time.perf_counter() - started) * 1000.0, 3)
+        if response:
+            ctx.log("✅ 消息传递成功")
+        else:
+            ctx.issue("消息传递失败")
+        success = isinstance(response, dict) and response.get("success") is not False and "error" not in response
+        return {"responded": bool(response), "success": success, "latencyMs": latency_ms}
+    return check
+
+def build_diagnostics():
+    """
+    声明检查项：环境与Python检查并行，全部通过后并行发送各条测试消息
+    （主机每条消息一个进程，不再逐条间隔1秒）；消息测试会启动主机，每次都重新执行
+    """
+    engine = DiagnosticsEngine("debug_native_messaging", manifest_fingerprint_paths(MANIFEST_PATH))
+    engine.add(DiagnosticCheck("environment", check_native_host_environment, title="原生主机环境"))
+    engine.add(DiagnosticCheck("python", test_python_environment, title="Python环境"))
+    module_checks = []
+    for module in REQUIRED_MODULES:
+        module_checks.append(f"module_{module}")
+        engine.add(DiagnosticCheck(f"module_{module}", python_module_check(module), depends=["python"],
+                                   title=f"Python模块 {module}"))
+    for message in TEST_MESSAGES:
+        engine.add(DiagnosticCheck(f"message_{message['action']}", message_check(message),
+                                   depends=["environment"] + module_checks,
+                                   title=f"测试消息 {message['action']}"))
+    return engine
+
+def frame_message(message: Dict[str, Any]) -> bytes:
+    """按Chrome原生消息格式编码：4字节本机字节序长度头 + UTF-8 JSON"""
+    content = json.dumps(message).encode('utf-8')
+    return struct.pack('@I', len(content)) + content
+
+
+def read_framed(stream) -> Optional[Dict[str, Any]]:
+    """读取一条带长度头的消息，流结束时返回None"""
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    length = struct.unpack('@I', header)[0]
+    body = stream.read(length)
+    if len(body) < length:
+        return None
+    return json.loads(body.decode('utf-8'))
+
+
+def host_command(host_path: str) -> List[str]:
+    """.py脚本用当前解释器启动（-B避免写字节码），其他按可执行文件启动"""
+    if host_path.endswith(".py"):
+        return [sys.executable, "-B", host_path]
+    return [host_path]
+
+
+class SimulatedChromeClient:
+    """
+    模拟一个Chrome客户端
+
+    - spawn:      与 chrome.runtime.sendNativeMessage 一致，每条消息启动一个主机进程，读到响应后结束进程；
+    - persistent: 与 chrome.runtime.connectNative 一致，一个主机进程连续处理多条消息。
+    延迟从启动进程（spawn）或写入消息（persistent）开始，到完整读到响应为止。
+    """
+
+    def __init__(self, command: List[str], mode: str = "spawn", timeout: float = 10.0,
+                 env: Optional[Dict[str, str]] = None):
+        self.command = command
+        self.mode = mode
+        self.timeout = timeout
+        self.env = env
+        self._process: Optional[subprocess.Popen] = None
+
+    def _start(self) -> subprocess.Popen:
+        return subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, env=self.env)
+
+    def request(self, message: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], float, Optional[str]]:
+        """发送一条消息，返回 (响应, 延迟毫秒, 传输错误)"""
+        started = time.perf_counter()
+        if self.mode == "spawn" or self._process is None or self._process.poll() is not None:
+            self._process = self._start()
+        process = self._process
+        # 超时后结束进程，阻塞中的读取随之返回
+        timed_out = threading.Event()
+
+        def on_timeout() -> None:
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(self.timeout, on_timeout)
+        timer.start()
+        try:
+            process.stdin.write(frame_message(message))
+            process.stdin.flush()
+            response = read_framed(process.stdout)
+        except (BrokenPipeError, OSError, ValueError):
+            response = None
+        finally:
+            timer.cancel()
+        elapsed = (time.perf_counter() - started) * 1000.0
+
+        error = None
+        if timed_out.is_set():
+            error = "timeout"
+        elif response is None:
+            error = "no_response"
+        if self.mode == "spawn" or error:
+            self.close()
+        return response, elapsed, error
+
+    def close(self) -> None:
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            process.wait(timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+
+
+DEFAULT_MIX = "testConnection=4,getClientCurrentData=3,listAccounts=2,getMetrics=1"
+
+
+def parse_mix(spec: str) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    解析动作组合
+
+    spec为 动作=权重,... 或JSON文件路径，文件内容为 [{"message": {...}, "weight": 2}, ...]
+    （用于带params的消息）
+    """
+    if os.path.isfile(spec):
+        with open(spec, 'r', encoding='utf-8') as f:
+            return [(entry["message"], float(entry.get("weight", 1))) for entry in json.load(f)]
+    mix = []
+    for part in spec.split(","):
+        action, _, weight = part.strip().partition("=")
+        if action:
+            mix.append(({"action": action}, float(weight or 1)))
+    return mix
+
+
+def summarize_latencies(values: List[float]) -> Dict[str, Any]:
+    values = sorted(values)
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(values[-1], 3)
+    }
+
+
+def run_load(command: List[str], clients: int, mode: str, mix: List[Tuple[Dict[str, Any], float]],
+             requests_per_client: Optional[int] = None, duration: Optional[float] = None,
+             warmup: int = 1, timeout: float = 10.0, env: Optional[Dict[str, str]] = None,
+             seed: Optional[int] = None) -> Dict[str, Any]:
+    """
+    以N个并发客户端按动作组合压测原生主机
+
+    每个客户端在自己的线程中串行发送消息（Chrome对同一个端口也是串行的）；
+    指定duration时按时间运行，否则每个客户端发送requests_per_client条。
+    每个客户端的前warmup条不计入统计（persistent模式下包含进程启动）；
+    计时和duration截止时间都从所有客户端预热完成后开始。
+    """
+    messages = [message for message, _ in mix]
+    weights = [weight for _, weight in mix]
+    lock = threading.Lock()
+    samples: List[Tuple[str, float, Optional[str]]] = []
+    host_handler_ms: List[float] = []
+    clock: Dict[str, float] = {}
+    finished: List[float] = []
+
+    def start_clock() -> None:
+        # 最后一个客户端预热完成时由Barrier调用，此后才开始计时
+        clock["started"] = time.perf_counter()
+        if duration is not None:
+            clock["deadline"] = clock["started"] + duration
+
+    start_barrier = threading.Barrier(clients, action=start_clock)
+
+    def worker(index: int) -> None:
+        rng = random.Random(None if seed is None else seed + index)
+        client = SimulatedChromeClient(command, mode, timeout, env)
+        try:
+            try:
+                for _ in range(warmup):
+                    client.request(rng.choices(messages, weights)[0])
+                start_barrier.wait()
+            except threading.BrokenBarrierError:
+                return
+            except BaseException:
+                # 预热失败时放开其他客户端，避免它们永远等在Barrier上
+                start_barrier.abort()
+                raise
+            sent = 0
+            while True:
+                if duration is not None:
+                    if time.perf_counter() >= clock["deadline"]:
+                        break
+                elif sent >= (requests_per_client or 0):
+                    break
+                message = dict(rng.choices(messages, weights)[0])
+                message["trace"] = {"id": f"load-{index}-{sent}", "sentAt": time.time() * 1000}
+                response, elapsed, error = client.request(message)
+                if error is None and (not isinstance(response, dict) or "error" in response
+                                      or response.get("success") is False):
+                    error = "error_response"
+                handler_ms = None
+                if isinstance(response, dict) and isinstance(response.get("trace"), dict):
+                    for span in response["trace"].get("spans", {}).get("children", []):
+                        if span.get("name") == "handler":
+                            handler_ms = span.get("durationMs")
+                with lock:
+                    samples.append((message.get("action", "?"), elapsed, error))
+                    if handler_ms is not None:
+                        host_handler_ms.append(handler_ms)
+                sent += 1
+            with lock:
+                finished.append(time.perf_counter())
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 不含预热和关闭连接的时间
+    wall = max(finished) - clock["started"] if finished and "started" in clock else 0.0
+
+    per_action: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, int] = {}
+    for action, elapsed, error in samples:
+        entry = per_action.setdefault(action, {"latencies": [], "errors": 0})
+        entry["latencies"].append(elapsed)
+        if error:
+            entry["errors"] += 1
+            errors[error] = errors.get(error, 0) + 1
+
+    total = len(samples)
+    return {
+        "config": {
+            "command": command,
+            "mode": mode,
+            "clients": clients,
+            "requestsPerClient": requests_per_client,
+            "durationSeconds": duration,
+            "warmup": warmup,
+            "mix": [{"message": message, "weight": weight} for message, weight in mix]
+        },
+        "totalRequests": total,
+        "wallSeconds": round(wall, 3),
+        "throughputRps": round(total / wall, 2) if wall > 0 else None,
+        "errorRate": round(sum(errors.values()) / total, 4) if total else None,
+        "errors": errors,
+        "latencyMs": summarize_latencies([elapsed for _, elapsed, _ in samples]),
+        "hostHandlerMs": summarize_latencies(host_handler_ms),
+        "perAction": {
+            action: {
+                "count": len(entry["latencies"]),
+                "errors": entry["errors"],
+                "latencyMs": summarize_latencies(entry["latencies"])
+            }
+            for action, entry in sorted(per_action.items())
+        }
+    }
+
+
+def load_main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog="debug_native_messaging.py load",
+                                     description="模拟多个Chrome客户端并发访问原生主机")
+    parser.add_argument("--host", default=str(Path(__file__).with_name("native_host.py")),
+                        help="原生主机路径（.py用当前解释器启动），默认同目录下的native_host.py")
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端数")
+    parser.add_argument("--mode", choices=["spawn", "persistent"], default="spawn",
+                        help="spawn: 每条消息一个进程(sendNativeMessage)；persistent: 长连接(connectNative)")
+    parser.add_argument("--requests", type=int, default=20, help="每个客户端发送的消息数")
+    parser.add_argument("--duration", type=float, help="按时间运行（秒），优先于--requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="动作=权重,... 或JSON文件路径")
+    parser.add_argument("--warmup", type=int, default=1, help="每个客户端不计入统计的预热消息数")
+    parser.add_argument("--timeout", type=float, default=10.0, help="单条消息超时（秒）")
+    parser.add_argument("--isolate", action="store_true",
+                        help="主机使用临时数据目录（CURSOR_HOST_DATA_DIR），不读写真实账户库")
+    parser.add_argument("--seed", type=int, help="动作选择的随机种子")
+    args = parser.parse_args(argv)
+
+    env = os.environ.copy()
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    data_dir = tempfile.mkdtemp(prefix="cursor_host_load_") if args.isolate else None
+    if data_dir:
+        env["CURSOR_HOST_DATA_DIR"] = data_dir
+    try:
+        report = run_load(host_command(args.host), max(1, args.clients), args.mode, parse_mix(args.mix),
+                          requests_per_client=args.requests, duration=args.duration, warmup=args.warmup,
+                          timeout=args.timeout, env=env, seed=args.seed)
+    finally:
+        if data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
 
 def main():
-    print("🔧 Chrome原生消息传递调试工具")
-    print("=" * 50)
-    
-    # 1. 检查环境
-    host_path, config = check_native_host_environment()
-    if not host_path:
+    if len(sys.argv) > 1 and sys.argv[1] == "load":
+        load_main(sys.argv[2:])
         return
+
+    parser = argparse.ArgumentParser(description="Chrome原生消息传递调试")
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.json:
+        print("🔧 Chrome原生消息传递调试工具")
+        print("=" * 50)
     
-    # 2. 测试Python环境
-    if not test_python_environment():
-        return
-    
-    # 3. 测试消息传递
-    print("\n📡 测试原生消息传递...")
-    
-    test_messages = [
-        {"action": "test_connection"},
-        {"action": "getClientCurrentData"},
-        {"action": "ping"}
-    ]
-    
-    for i, message in enumerate(test_messages, 1):
-        print(f"\n--- 测试 {i}: {message['action']} ---")
-        response = send_native_message(host_path, message)
-        
-        if response:
-            print("✅ 消息传递成功")
-        else:
-            print("❌ 消息传递失败")
-            
-        time.sleep(1)  # 避免进程冲突
+    # 检查环境、Python环境并测试消息传递
+    report = run_engine(build_diagnostics(), args)
+    if args.json:
+        sys.exit(0 if report["passed"] else 1)
     
     print("\n🎯 调试建议:")
     print("1. 如果所有测试都成功，问题可能在Chrome端")
@@ -3,17 +3,28 @@
 专门诊断 "Native host has exited" 错误的工具
 """
 
-import json
+import argparse
 import os
 import subprocess
 import sys
-import time
-import struct
 
-def check_chrome_native_host_logs():
+# 避免在扩展目录下生成__pycache__导致Chrome扩展加载失败
+sys.dont_write_bytecode = True
+
+from debug_native_messaging import frame_message  # noqa: E402
+from diagnostics import (  # noqa: E402
+    DiagnosticCheck, DiagnosticsEngine, add_engine_arguments,
+    manifest_fingerprint_paths, run_engine
+)
+
+HOST_DIR = os.path.expanduser("~/Library/Application Support/Google/Chrome/NativeMessagingHosts")
+HOST_PATH = os.path.join(HOST_DIR, "native_host.py")
+MANIFEST_PATH = os.path.join(HOST_DIR, "com.cursor.client.manage.json")
+CURSOR_DB = os.path.expanduser("~/Library/Application Support/Cursor/User/globalStorage/state.vscdb")
+
+
+def check_chrome_native_host_logs(ctx):
     """检查Chrome的原生主机日志"""
-    print("🔍 检查Chrome原生主机日志...")
-    
     # Chrome日志可能的位置
     possible_log_paths = [
         "~/Library/Application Support/Google/Chrome/chrome_debug.log",
@@ -24,136 +35,138 @@ def check_chrome_native_host_logs():
     for log_path in possible_log_paths:
         expanded_path = os.path.expanduser(log_path)
         if os.path.exists(expanded_path):
-            print(f"📄 找到日志文件: {expanded_path}")
+            ctx.log(f"📄 找到日志文件: {expanded_path}")
             try:
                 with open(expanded_path, 'r') as f:
                     lines = f.readlines()[-20:]  # 最后20行
                     for line in lines:
                         if 'native' in line.lower() or 'host' in line.lower():
-                            print(f"  {line.strip()}")
+                            ctx.log(f"  {line.strip()}")
             except Exception as e:
-                print(f"  ❌ 无法读取日志: {e}")
+                ctx.warn(f"无法读取日志: {e}")
         else:
-            print(f"  ❌ 日志文件不存在: {expanded_path}")
+            ctx.log(f"❌ 日志文件不存在: {expanded_path}")
 
-def test_script_lifecycle():
-    """测试脚本的生命周期"""
-    print("\n🔄 测试原生主机脚本生命周期...")
-    
-    host_path = os.path.expanduser("~/Library/Application Support/Google/Chrome/NativeMessagingHosts/native_host.py")
-    
-    # 测试1: 脚本是否能正常启动和退出
-    print("1. 测试脚本启动和退出...")
+def test_script_lifecycle(ctx):
+    """测试脚本的生命周期：启动后立即发送消息，不再固定等待0.5秒"""
     try:
         process = subprocess.Popen(
-            [host_path],
+            [HOST_PATH],
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
         )
-        
-        print(f"  ✅ 脚本启动成功，PID: {process.pid}")
-        
-        # 等待一下看脚本是否立即退出
-        time.sleep(0.5)
-        poll_result = process.poll()
-        
-        if poll_result is not None:
-            print(f"  ❌ 脚本立即退出，退出码: {poll_result}")
-            stdout, stderr = process.communicate()
-            if stderr:
-                print(f"  错误输出: {stderr.decode('utf-8', errors='ignore')}")
-        else:
-            print("  ✅ 脚本正在运行，等待输入...")
-            
-            # 发送一个简单消息测试
-            message = {"action": "testConnection"}
-            message_json = json.dumps(message)
-            message_bytes = message_json.encode('utf-8')
-            message_length = len(message_bytes)
-            length_bytes = struct.pack('@I', message_length)
-            
-            process.stdin.write(length_bytes)
-            process.stdin.write(message_bytes)
-            process.stdin.flush()
-            
-            # 等待响应
-            try:
-                stdout, stderr = process.communicate(timeout=5)
-                print(f"  ✅ 脚本正常处理消息并退出，退出码: {process.returncode}")
-                
-                if stderr:
-                    print(f"  ⚠️ 错误输出: {stderr.decode('utf-8', errors='ignore')}")
-                    
-            except subprocess.TimeoutExpired:
-                print("  ❌ 脚本超时，强制终止")
-                process.kill()
-                
     except Exception as e:
-        print(f"  ❌ 启动脚本失败: {e}")
-
-def test_concurrent_access():
-    """测试并发访问问题"""
-    print("\n🔄 测试并发访问...")
+        ctx.issue(f"启动脚本失败: {e}", "重新安装原生主机: python3 install_native_host.py")
+        return None
     
-    host_path = os.path.expanduser("~/Library/Application Support/Google/Chrome/NativeMessagingHosts/native_host.py")
-    
-    # 启动多个进程测试
+    ctx.log(f"✅ 脚本启动成功，PID: {process.pid}")
+    try:
+        # 脚本若在读取消息前就退出，写入会得到BrokenPipe
+        process.stdin.write(frame_message({"action": "testConnection"}))
+        process.stdin.flush()
+    except BrokenPipeError:
+        stdout, stderr = process.communicate()
+        ctx.issue(f"脚本立即退出，退出码: {process.returncode}")
+        if stderr:
+            ctx.log(f"错误输出: {stderr.decode('utf-8', errors='ignore')}")
+        return {"returncode": process.returncode}
+    
+    # 等待响应
+    try:
+        stdout, stderr = process.communicate(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        ctx.issue("脚本超时，强制终止")
+        return None
+    
+    if len(stdout) > 4:
+        ctx.log(f"✅ 脚本正常处理消息并退出，退出码: {process.returncode}")
+    else:
+        ctx.issue(f"脚本没有返回响应，退出码: {process.returncode}")
+    if stderr:
+        ctx.warn(f"错误输出: {stderr.decode('utf-8', errors='ignore')}")
+    return {"returncode": process.returncode}
+
+def test_concurrent_access(ctx):
+    """测试并发访问：同时启动3个进程各发送一条消息，检查是否都正常响应（不再固定等待1秒）"""
     processes = []
     for i in range(3):
         try:
             process = subprocess.Popen(
-                [host_path],
+                [HOST_PATH],
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE
             )
             processes.append(process)
-            print(f"  进程 {i+1}: PID {process.pid} 启动成功")
+            ctx.log(f"进程 {i+1}: PID {process.pid} 启动成功")
         except Exception as e:
-            print(f"  进程 {i+1}: 启动失败 - {e}")
-    
-    # 等待并检查状态
-    time.sleep(1)
+            ctx.issue(f"进程 {i+1}: 启动失败 - {e}")
     
+    message = frame_message({"action": "testConnection"})
     for i, process in enumerate(processes):
-        if process.poll() is not None:
-            print(f"  进程 {i+1}: 已退出，退出码 {process.returncode}")
+        try:
+            stdout, _ = process.communicate(input=message, timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            ctx.issue(f"进程 {i+1}: 超时，强制终止")
+            continue
+        except BrokenPipeError:
+            stdout = b""
+        if len(stdout) > 4:
+            ctx.log(f"进程 {i+1}: 已响应，退出码 {process.returncode}")
         else:
-            print(f"  进程 {i+1}: 仍在运行")
-            process.terminate()
+            ctx.issue(f"进程 {i+1}: 没有响应，退出码 {process.returncode}")
 
-def check_file_locks():
+def check_file_locks(ctx):
     """检查文件锁定情况"""
-    print("\n🔒 检查文件锁定情况...")
-    
     # 检查Cursor数据库文件
-    cursor_db = os.path.expanduser("~/Library/Application Support/Cursor/User/globalStorage/state.vscdb")
+    if not os.path.exists(CURSOR_DB):
+        ctx.issue(f"Cursor数据库文件不存在: {CURSOR_DB}")
+        return
+    
+    ctx.log(f"✅ Cursor数据库文件存在: {CURSOR_DB}")
     
-    if os.path.exists(cursor_db):
-        print(f"✅ Cursor数据库文件存在: {cursor_db}")
+    # 检查文件是否被锁定
+    try:
+        # 尝试以只读方式打开
+        with open(CURSOR_DB, 'rb') as f:
+            f.read(1)  # 尝试读取一个字节
+        ctx.log("✅ 数据库文件可读取")
+    except Exception as e:
+        ctx.issue(f"数据库文件访问失败: {e}")
         
-        # 检查文件是否被锁定
-        try:
-            # 尝试以只读方式打开
-            with open(cursor_db, 'rb') as f:
-                f.read(1)  # 尝试读取一个字节
-            print("  ✅ 数据库文件可读取")
-        except Exception as e:
-            print(f"  ❌ 数据库文件访问失败: {e}")
-            
-        # 检查是否有其他进程在访问文件
-        try:
-            result = subprocess.run(['lsof', cursor_db], capture_output=True, text=True)
-            if result.stdout:
-                print("  ⚠️ 文件正在被以下进程使用:")
-                print(result.stdout)
-            else:
-                print("  ✅ 没有其他进程在使用数据库文件")
-        except Exception:
-            print("  ❓ 无法检查文件使用情况")
-    else:
-        print(f"❌ Cursor数据库文件不存在: {cursor_db}")
+    # 检查是否有其他进程在访问文件
+    try:
+        result = subprocess.run(['lsof', CURSOR_DB], capture_output=True, text=True)
+        if result.stdout:
+            ctx.warn("文件正在被以下进程使用:")
+            ctx.log(result.stdout)
+        else:
+            ctx.log("✅ 没有其他进程在使用数据库文件")
+    except Exception:
+        ctx.log("❓ 无法检查文件使用情况")
+
+def check_chrome_version(ctx):
+    """检查Chrome版本"""
+    chrome_app = "/Applications/Google Chrome.app/Contents/Info.plist"
+    if not os.path.exists(chrome_app):
+        ctx.log("❓ 未找到Chrome应用，无法获取版本")
+        return None
+    try:
+        result = subprocess.run(['defaults', 'read', chrome_app, 'CFBundleShortVersionString'], 
+                              capture_output=True, text=True)
+    except Exception:
+        ctx.log("❓ 无法检查Chrome版本")
+        return None
+    if result.stdout:
+        ctx.log(f"📱 Chrome版本: {result.stdout.strip()}")
+        return {"version": result.stdout.strip()}
+    ctx.log("❓ 无法获取Chrome版本")
+    return None
 
 def analyze_chrome_extension_state():
     """分析Chrome扩展状态"""
@@ -166,20 +179,17 @@ def analyze_chrome_extension_state():
     print("3. 原生主机启动频率限制")
     print("4. 扩展被暂时禁用或限制")
     print("5. Chrome版本兼容性问题")
-    
-    # 检查Chrome版本
-    try:
-        # 尝试获取Chrome版本信息
-        chrome_app = "/Applications/Google Chrome.app/Contents/Info.plist"
-        if os.path.exists(chrome_app):
-            result = subprocess.run(['defaults', 'read', chrome_app, 'CFBundleShortVersionString'], 
-                                  capture_output=True, text=True)
-            if result.stdout:
-                print(f"📱 Chrome版本: {result.stdout.strip()}")
-            else:
-                print("❓ 无法获取Chrome版本")
-    except Exception:
-        print("❓ 无法检查Chrome版本")
+
+def build_diagnostics():
+    """声明检查项：各项都会启动主机或读取实时状态，每次都重新检查"""
+    engine = DiagnosticsEngine("diagnose_exit_error", manifest_fingerprint_paths(MANIFEST_PATH, HOST_PATH))
+    engine.add(DiagnosticCheck("chrome_logs", check_chrome_native_host_logs, title="Chrome原生主机日志"))
+    engine.add(DiagnosticCheck("script_lifecycle", test_script_lifecycle, title="原生主机脚本生命周期"))
+    engine.add(DiagnosticCheck("concurrent_access", test_concurrent_access, depends=["script_lifecycle"],
+                               title="并发访问"))
+    engine.add(DiagnosticCheck("file_locks", check_file_locks, title="Cursor数据库文件锁定"))
+    engine.add(DiagnosticCheck("chrome_version", check_chrome_version, title="Chrome版本"))
+    return engine
 
 def provide_solutions():
     """提供解决方案"""
@@ -217,14 +227,19 @@ def provide_solutions():
     print("这可能是Chrome的安全策略或进程管理问题。")
 
 def main():
-    print("🚨 Native Host Has Exited 错误专项诊断工具")
-    print("=" * 60)
-    
-    # 运行所有检查
-    check_chrome_native_host_logs()
-    test_script_lifecycle()
-    test_concurrent_access()
-    check_file_locks()
+    parser = argparse.ArgumentParser(description="'Native host has exited' 错误专项诊断")
+    add_engine_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.json:
+        print("🚨 Native Host Has Exited 错误专项诊断工具")
+        print("=" * 60)
+    
+    # 运行所有检查（互不依赖的并行执行）
+    report = run_engine(build_diagnostics(), args)
+    if args.json:
+        sys.exit(0 if report["passed"] else 1)
+
     analyze_chrome_extension_state()
     provide_solutions()
     
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+诊断引擎
+fix_native_host.py、diagnose_exit_error.py 和 debug_native_messaging.py 共用:
+  - 检查项声明依赖（depends），依赖完成后才执行；依赖失败时跳过并注明原因
+  - 互不依赖的检查项在线程池中并行执行（启动主机、读取清单等都以等待I/O为主）
+  - cacheable 的检查项按 清单文件 + 主机脚本 + 解释器 + 已安装依赖版本 + CURSOR_*环境变量 的指纹缓存结果，
+    指纹未变化时直接复用；只缓存通过（ok / warning）的结果，失败的检查下次总会重新执行。
+    启动主机的检查不应声明为cacheable：它们的结果还取决于指纹之外的环境（数据库、网络、锁等）
+  - 生成机器可读的报告（每个检查项的状态、耗时、是否来自缓存）
+
+检查函数接收 CheckContext，用 log() 输出说明、issue()/warn() 报告问题，
+可返回一个可JSON序列化的dict作为details，供依赖它的检查项通过 ctx.details(名称) 读取。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from importlib import metadata
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# 版本1的缓存可能含有主机响应（包括token），升级版本使旧条目在下次保存时被丢弃
+CACHE_VERSION = 2
+STATUS_ICONS = {"ok": "✅", "warning": "⚠️", "error": "❌", "skipped": "⏭️"}
+CACHEABLE_STATUSES = ("ok", "warning")
+# 原生主机及诊断工具依赖的包，版本变化时缓存失效
+FINGERPRINT_PACKAGES = ("nativemessaging", "requests", "cryptography", "keyring", "selenium")
+
+
+def default_cache_path() -> str:
+    """缓存文件放在原生主机数据目录（CURSOR_HOST_DATA_DIR，默认 ~/.cursor_client2login）"""
+    data_dir = os.getenv("CURSOR_HOST_DATA_DIR") or os.path.join(os.path.expanduser("~"), ".cursor_client2login")
+    return os.path.join(data_dir, "diagnostics_cache.json")
+
+
+def fingerprint_files(paths: Iterable[str]) -> Dict[str, Optional[str]]:
+    """文件内容的sha256（前16位），不存在或不可读的文件为None"""
+    fingerprints: Dict[str, Optional[str]] = {}
+    for path in paths:
+        if not path or path in fingerprints:
+            continue
+        try:
+            with open(path, "rb") as f:
+                fingerprints[path] = hashlib.sha256(f.read()).hexdigest()[:16]
+        except OSError:
+            fingerprints[path] = None
+    return fingerprints
+
+
+def package_versions(packages: Iterable[str] = FINGERPRINT_PACKAGES) -> Dict[str, Optional[str]]:
+    """已安装的依赖版本，未安装为None"""
+    versions: Dict[str, Optional[str]] = {}
+    for package in packages:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def environment_fingerprint() -> str:
+    """CURSOR_*环境变量及PATH/PYTHONPATH的sha256（前16位），不在缓存和报告中保存原值"""
+    env = {key: value for key, value in os.environ.items()
+           if key.startswith("CURSOR_") or key in ("PATH", "PYTHONPATH")}
+    return hashlib.sha256(json.dumps(env, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def manifest_fingerprint_paths(manifest_path: str, *extra: str) -> List[str]:
+    """清单文件及其 path 指向的主机脚本，外加额外的文件"""
+    paths = [str(manifest_path)]
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            script = json.load(f).get("path")
+        if script:
+            paths.append(str(script))
+    except (OSError, ValueError, AttributeError):
+        pass
+    return paths + [str(path) for path in extra]
+
+
+class CheckContext:
+    """单个检查项执行时的上下文"""
+
+    def __init__(self, engine: "DiagnosticsEngine", name: str):
+        self._engine = engine
+        self.name = name
+        self.lines: List[str] = []
+        self.issues: List[str] = []
+        self.warnings: List[str] = []
+        self.suggestions: List[str] = []
+
+    def log(self, text: str) -> None:
+        self.lines.append(text)
+
+    def issue(self, text: str, suggestion: Optional[str] = None) -> None:
+        """记录问题，检查项状态为error"""
+        self.issues.append(text)
+        if suggestion:
+            self.suggestions.append(suggestion)
+
+    def warn(self, text: str, suggestion: Optional[str] = None) -> None:
+        """记录警告，检查项状态为warning"""
+        self.warnings.append(text)
+        if suggestion:
+            self.suggestions.append(suggestion)
+
+    def details(self, name: str) -> Dict[str, Any]:
+        """读取某个依赖检查项返回的details"""
+        return self._engine.results[name].get("details") or {}
+
+
+class DiagnosticCheck:
+    """声明的检查项"""
+
+    def __init__(self, name: str, func: Callable[[CheckContext], Optional[Dict[str, Any]]],
+                 depends: Iterable[str] = (), title: str = "", cacheable: bool = False):
+        self.name = name
+        self.func = func
+        self.depends = tuple(depends)
+        self.title = title or name
+        self.cacheable = cacheable
+
+
+class DiagnosticsEngine:
+    """按依赖关系并行执行检查项并生成报告"""
+
+    def __init__(self, title: str, fingerprint_paths: Iterable[str] = (), max_workers: int = 8,
+                 cache_path: Optional[str] = None):
+        self.title = title
+        self.fingerprint_paths = list(fingerprint_paths)
+        self.max_workers = max_workers
+        self.cache_path = cache_path or default_cache_path()
+        self.checks: Dict[str, DiagnosticCheck] = {}
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._lock = threading.Lock()
+        self._run_started = time.perf_counter()
+
+    def check(self, name: str, depends: Iterable[str] = (), title: str = "", cacheable: bool = False):
+        """装饰器：声明检查项"""
+        def decorator(func: Callable[[CheckContext], Optional[Dict[str, Any]]]):
+            self.add(DiagnosticCheck(name, func, depends, title, cacheable))
+            return func
+        return decorator
+
+    def add(self, check: DiagnosticCheck) -> None:
+        if check.name in self.checks:
+            raise ValueError(f"检查项重复: {check.name}")
+        self.checks[check.name] = check
+
+    def _validate(self) -> None:
+        """依赖必须已声明且无环"""
+        for check in self.checks.values():
+            for dependency in check.depends:
+                if dependency not in self.checks:
+                    raise ValueError(f"检查项 {check.name} 依赖未声明的 {dependency}")
+        visiting, done = set(), set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"检查项依赖存在环: {name}")
+            visiting.add(name)
+            for dependency in self.checks[name].depends:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.checks:
+            visit(name)
+
+    # ---------- 缓存 ----------
+
+    def fingerprint(self) -> Dict[str, Any]:
+        return {
+            "python": f"{sys.executable} {sys.version.split()[0]}",
+            "packages": package_versions(),
+            "env": environment_fingerprint(),
+            "files": fingerprint_files(self.fingerprint_paths)
+        }
+
+    def _cache_key(self, check: DiagnosticCheck, fingerprint: Dict[str, Any]) -> str:
+        """指纹 + 依赖项的结果，任一变化都会使缓存失效"""
+        dependencies = {name: {"status": self.results[name]["status"],
+                               "details": self.results[name].get("details")} for name in check.depends}
+        payload = json.dumps({"check": check.name, "fingerprint": fingerprint, "depends": dependencies},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_cache(self) -> Dict[str, Any]:
+        """缓存文件中所有工具的条目，按引擎标题分组"""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+            if cache.get("version") == CACHE_VERSION:
+                return cache.get("entries", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save_cache(self, entries: Dict[str, Any]) -> None:
+        """只替换本引擎的条目，其他诊断工具的缓存保留；文件权限为0600"""
+        all_entries = self._load_cache()
+        all_entries[self.title] = entries
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "entries": all_entries}, f, ensure_ascii=False)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            pass
+
+    def clear_cache(self) -> None:
+        try:
+            os.remove(self.cache_path)
+        except OSError:
+            pass
+
+    # ---------- 执行 ----------
+
+    def _execute(self, check: DiagnosticCheck) -> Dict[str, Any]:
+        ctx = CheckContext(self, check.name)
+        started = time.perf_counter()
+        start_ms = round((started - self._run_started) * 1000.0, 3)
+        details = None
+        try:
+            details = check.func(ctx)
+        except Exception as e:
+            ctx.issue(f"检查异常: {type(e).__name__}: {e}")
+        status = "error" if ctx.issues else ("warning" if ctx.warnings else "ok")
+        return {
+            "name": check.name,
+            "title": check.title,
+            "status": status,
+            "dependsOn": list(check.depends),
+            "startMs": start_ms,
+            "durationMs": round((time.perf_counter() - started) * 1000.0, 3),
+            "cached": False,
+            "lines": ctx.lines,
+            "issues": ctx.issues,
+            "warnings": ctx.warnings,
+            "suggestions": ctx.suggestions,
+            "details": details
+        }
+
+    def _skipped(self, check: DiagnosticCheck, failed: List[str]) -> Dict[str, Any]:
+        return {
+            "name": check.name, "title": check.title, "status": "skipped", "dependsOn": list(check.depends),
+            "startMs": None, "durationMs": 0.0, "cached": False, "lines": [], "issues": [], "warnings": [], "suggestions": [],
+            "details": None, "reason": f"依赖未通过: {', '.join(failed)}"
+        }
+
+    def _record(self, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self.results[result["name"]] = result
+        if self.on_result:
+            self.on_result(result)
+
+    def run(self, use_cache: bool = True) -> Dict[str, Any]:
+        """执行全部检查项，返回报告"""
+        self._validate()
+        self.results = {}
+        fingerprint = self.fingerprint()
+        cache = self._load_cache().get(self.title, {}) if use_cache else {}
+        new_entries: Dict[str, Any] = {}
+        self._run_started = time.perf_counter()
+        started_at = datetime.now().isoformat()
+
+        pending = dict(self.checks)
+        running: Dict[Any, DiagnosticCheck] = {}
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers), thread_name_prefix="diagnose") as executor:
+            while pending or running:
+                for name, check in list(pending.items()):
+                    if any(dependency not in self.results for dependency in check.depends):
+                        continue
+                    del pending[name]
+                    failed = [d for d in check.depends if self.results[d]["status"] in ("error", "skipped")]
+                    if failed:
+                        self._record(self._skipped(check, failed))
+                        continue
+                    if check.cacheable:
+                        key = self._cache_key(check, fingerprint)
+                        entry = cache.get(name)
+                        if (entry and entry.get("key") == key
+                                and entry.get("result", {}).get("status") in CACHEABLE_STATUSES):
+                            result = dict(entry["result"], cached=True, cachedAt=entry.get("savedAt"), startMs=None,
+                                          durationMs=0.0, cachedDurationMs=entry["result"].get("durationMs"))
+                            new_entries[name] = entry
+                            self._record(result)
+                            continue
+                    running[executor.submit(self._execute, check)] = check
+                if not running:
+                    continue
+                done, _ = wait_futures(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    check = running.pop(future)
+                    result = future.result()
+                    if check.cacheable and result["status"] in CACHEABLE_STATUSES:
+                        new_entries[check.name] = {"key": self._cache_key(check, fingerprint),
+                                                   "savedAt": datetime.now().isoformat(), "result": result}
+                    self._record(result)
+
+        if use_cache:
+            self._save_cache(new_entries)
+
+        ordered = [self.results[name] for name in self.checks]
+        wall_ms = round((time.perf_counter() - self._run_started) * 1000.0, 3)
+        return {
+            "title": self.title,
+            "startedAt": started_at,
+            "wallMs": wall_ms,
+            "sequentialMs": round(sum(result["durationMs"] for result in ordered), 3),
+            "cacheHits": sum(1 for result in ordered if result["cached"]),
+            "fingerprint": fingerprint,
+            "passed": all(result["status"] in ("ok", "warning") for result in ordered),
+            "counts": {status: sum(1 for result in ordered if result["status"] == status) for status in STATUS_ICONS},
+            "checks": ordered
+        }
+
+
+def print_progress(result: Dict[str, Any]) -> None:
+    """检查项完成时打印一行（按完成顺序）"""
+    suffix = "缓存" if result["cached"] else f"{result['durationMs']:.0f}ms"
+    print(f"  {STATUS_ICONS[result['status']]} {result['title']} ({suffix})", flush=True)
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """按声明顺序打印各检查项的输出"""
+    for result in report["checks"]:
+        suffix = "缓存" if result["cached"] else f"{result['durationMs']:.0f}ms"
+        print(f"\n{STATUS_ICONS[result['status']]} {result['title']} ({suffix})")
+        if result["status"] == "skipped":
+            print(f"   {result['reason']}")
+        for line in result["lines"]:
+            print(f"   {line}")
+        for text in result["issues"]:
+            print(f"   ❌ {text}")
+        for text in result["warnings"]:
+            print(f"   ⚠️ {text}")
+    print(f"\n⏱️ 总耗时 {report['wallMs']:.0f}ms（逐项累计 {report['sequentialMs']:.0f}ms，缓存命中 {report['cacheHits']} 项）")
+
+
+def add_engine_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--json", action="store_true", help="输出JSON报告（含每项耗时）")
+    parser.add_argument("--no-cache", action="store_true", help="不使用也不写入缓存，全部重新检查")
+    parser.add_argument("--clear-cache", action="store_true", help="运行前清空诊断缓存")
+    parser.add_argument("--jobs", type=int, default=8, help="并行执行的检查项数")
+
+
+def run_engine(engine: DiagnosticsEngine, args: argparse.Namespace) -> Dict[str, Any]:
+    """按命令行参数执行引擎；--json 时只输出报告"""
+    engine.max_workers = args.jobs
+    if args.clear_cache:
+        engine.clear_cache()
+    if not args.json:
+        engine.on_result = print_progress
+    report = engine.run(use_cache=not args.no_cache)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+    return report
@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+"""
+Cursor服务本地替身服务器
+模拟 cursor.com 的深度登录页面(loginDeepControl)和 api2.cursor.sh 的认证轮询接口(auth/poll)，
+用于在无网络环境下测试和压测 DeepTokenManager、get_cursor_deep_token.py 以及扩展中的 pollDeepToken。
+
+用法:
+  python3 fake_cursor_server.py serve [--port 8787] [--latency-ms 50] ...
+  python3 fake_cursor_server.py bench [--requests 200] [--concurrency 16] ...
+
+将被测代码指向替身服务器:
+  export CURSOR_WEB_BASE_URL=http://127.0.0.1:8787
+  export CURSOR_API_BASE_URL=http://127.0.0.1:8787
+  扩展端: chrome.storage.local.set({ apiBaseUrlOverride: 'http://127.0.0.1:8787' })
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+# 避免在扩展目录下生成__pycache__导致Chrome扩展加载失败
+sys.dont_write_bytecode = True
+
+
+class FakeServerConfig:
+    """替身服务器行为配置"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 slow_ratio: float = 0.0, slow_ms: float = 0.0,
+                 error_rate: float = 0.0, token_delay: float = 0.0,
+                 rate_limit: float = 0.0, burst: int = 0,
+                 auto_confirm: bool = True, token_days: int = 60, seed: Optional[int] = None):
+        """
+        Args:
+            latency_ms: 每个请求的基础延迟(毫秒)
+            jitter_ms: 延迟的随机抖动上限(毫秒)
+            slow_ratio: 触发慢请求的概率(0-1)，用于模拟长尾
+            slow_ms: 慢请求额外增加的延迟(毫秒)
+            error_rate: 返回500错误的概率(0-1)
+            token_delay: 确认登录后到轮询可取到token之间的秒数
+            rate_limit: 每个客户端每秒允许的请求数，0表示不限流
+            burst: 限流令牌桶容量，默认等于rate_limit
+            auto_confirm: 带会话Cookie访问深度登录页面时是否自动确认登录
+            token_days: 签发token的有效天数
+            seed: 随机数种子，便于复现
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.slow_ratio = slow_ratio
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.token_delay = token_delay
+        self.rate_limit = rate_limit
+        self.burst = burst or int(max(rate_limit, 1))
+        self.auto_confirm = auto_confirm
+        self.token_days = token_days
+        self.random = random.Random(seed)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency_ms": self.latency_ms,
+            "jitter_ms": self.jitter_ms,
+            "slow_ratio": self.slow_ratio,
+            "slow_ms": self.slow_ms,
+            "error_rate": self.error_rate,
+            "token_delay": self.token_delay,
+            "rate_limit": self.rate_limit,
+            "burst": self.burst,
+            "auto_confirm": self.auto_confirm,
+            "token_days": self.token_days
+        }
+
+
+class FakeAuthState:
+    """深度登录会话状态（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._buckets: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {
+            "deep_login": 0,
+            "confirm": 0,
+            "poll": 0,
+            "poll_pending": 0,
+            "poll_success": 0,
+            "errors_injected": 0,
+            "rate_limited": 0,
+            "bad_request": 0
+        }
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def register(self, uuid_str: str, challenge: str) -> None:
+        with self._lock:
+            session = self._sessions.setdefault(uuid_str, {})
+            session["challenge"] = challenge
+
+    def confirm(self, uuid_str: str, userid: str, ready_at: float) -> bool:
+        with self._lock:
+            session = self._sessions.get(uuid_str)
+            if session is None or not session.get("challenge"):
+                return False
+            session["userid"] = userid
+            session["ready_at"] = ready_at
+            return True
+
+    def lookup(self, uuid_str: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._sessions.get(uuid_str)
+            return dict(session) if session else None
+
+    def take_token(self, client: str, rate: float, burst: int) -> bool:
+        """令牌桶限流，返回是否放行"""
+        if rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(client, [float(burst), now])
+            tokens = min(float(burst), tokens + (now - last) * rate)
+            if tokens < 1.0:
+                self._buckets[client] = [tokens, now]
+                return False
+            self._buckets[client] = [tokens - 1.0, now]
+            return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "sessions": len(self._sessions)
+            }
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def make_fake_jwt(userid: str, valid_days: int = 60, token_type: str = "session") -> str:
+    """签发一个结构与Cursor一致的伪JWT（签名无效，仅用于测试）"""
+    now = int(time.time())
+    header = {"alg": "HS256", "typ": "JWT"}
+    payload = {
+        "sub": f"auth0|{userid}",
+        "time": str(now),
+        "randomness": os.urandom(8).hex(),
+        "exp": now + valid_days * 86400,
+        "iss": "https://authentication.cursor.sh",
+        "scope": "openid profile email offline_access",
+        "aud": "https://cursor.com",
+        "type": token_type
+    }
+    signing_input = f"{_b64url(json.dumps(header).encode())}.{_b64url(json.dumps(payload).encode())}"
+    signature = _b64url(hashlib.sha256(signing_input.encode()).digest())
+    return f"{signing_input}.{signature}"
+
+
+def _challenge_for(verifier: str) -> str:
+    digest = hashlib.sha256(verifier.encode("utf-8")).digest()
+    return base64.urlsafe_b64encode(digest).decode("utf-8").rstrip("=")
+
+
+DEEP_LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Fake Cursor Deep Login</title></head>
+<body>
+<p>Fake deep login for {uuid}</p>
+<button id="confirm"><span>Yes, Log In</span></button>
+<script>
+document.getElementById('confirm').addEventListener('click', function () {{
+  fetch('/api/auth/loginDeepCallbackControl', {{
+    method: 'POST',
+    headers: {{'Content-Type': 'application/json'}},
+    body: JSON.stringify({{uuid: '{uuid}', challenge: '{challenge}'}})
+  }});
+}});
+</script>
+</body></html>
+"""
+
+
+class FakeCursorRequestHandler(BaseHTTPRequestHandler):
+    """替身服务器请求处理器"""
+
+    server_version = "FakeCursor/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self) -> FakeServerConfig:
+        return self.server.fake_config
+
+    @property
+    def state(self) -> FakeAuthState:
+        return self.server.fake_state
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: Any, content_type: str = "application/json",
+              extra_headers: Optional[Dict[str, str]] = None) -> None:
+        if isinstance(body, (dict, list)):
+            payload = json.dumps(body).encode("utf-8")
+        else:
+            payload = str(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        # 允许扩展的service worker跨域访问
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Headers", "*")
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _simulate_network(self) -> bool:
+        """注入延迟/限流/错误，返回False表示已直接响应"""
+        config = self.config
+        rng = config.random
+        delay_ms = config.latency_ms
+        if config.jitter_ms:
+            delay_ms += rng.uniform(0, config.jitter_ms)
+        if config.slow_ratio and rng.random() < config.slow_ratio:
+            delay_ms += config.slow_ms
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
+        client = self.client_address[0]
+        if not self.state.take_token(client, config.rate_limit, config.burst):
+            self.state.count("rate_limited")
+            retry_after = max(1, int(round(1.0 / config.rate_limit)))
+            self._send(429, {"error": "rate_limited"}, extra_headers={"Retry-After": str(retry_after)})
+            return False
+
+        if config.error_rate and rng.random() < config.error_rate:
+            self.state.count("errors_injected")
+            self._send(500, {"error": "injected_failure"})
+            return False
+        return True
+
+    def _session_userid(self) -> Optional[str]:
+        cookie_header = self.headers.get("Cookie", "")
+        for part in cookie_header.split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == "WorkosCursorSessionToken" and value:
+                decoded = unquote(value)
+                if "::" in decoded:
+                    return decoded.split("::", 1)[0]
+        return None
+
+    def do_OPTIONS(self) -> None:
+        self._send(204, "")
+
+    def do_GET(self) -> None:
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+
+        if parsed.path == "/__stats":
+            self._send(200, {"config": self.config.to_dict(), **self.state.snapshot()})
+            return
+        if parsed.path in ("/", "/cn", "/cn/"):
+            self._send(200, "<html><body>Fake Cursor</body></html>", "text/html; charset=utf-8")
+            return
+
+        if not self._simulate_network():
+            return
+
+        if parsed.path in ("/cn/loginDeepControl", "/loginDeepControl"):
+            self._handle_deep_login(query)
+        elif parsed.path == "/auth/poll":
+            self._handle_poll(query)
+        elif parsed.path in ("/api/usage", "/api/auth/stripe"):
+            self._handle_account_info(parsed.path, query)
+        else:
+            self._send(404, {"error": "not_found"})
+
+    def do_POST(self) -> None:
+        parsed = urlparse(self.path)
+        if parsed.path != "/api/auth/loginDeepCallbackControl":
+            self._send(404, {"error": "not_found"})
+            return
+        if not self._simulate_network():
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            body = {}
+        uuid_str = body.get("uuid")
+        userid = self._session_userid()
+        if not uuid_str or not userid:
+            self.state.count("bad_request")
+            self._send(401, {"error": "not_authenticated"})
+            return
+        if not self.state.confirm(uuid_str, userid, time.monotonic() + self.config.token_delay):
+            self.state.count("bad_request")
+            self._send(400, {"error": "unknown_uuid"})
+            return
+        self.state.count("confirm")
+        self._send(200, {})
+
+    def _handle_deep_login(self, query: Dict[str, str]) -> None:
+        uuid_str = query.get("uuid")
+        challenge = query.get("challenge")
+        if not uuid_str or not challenge:
+            self.state.count("bad_request")
+            self._send(400, "missing challenge or uuid", "text/plain")
+            return
+
+        self.state.count("deep_login")
+        self.state.register(uuid_str, challenge)
+
+        userid = self._session_userid()
+        if userid and self.config.auto_confirm:
+            self.state.confirm(uuid_str, userid, time.monotonic() + self.config.token_delay)
+            self.state.count("confirm")
+
+        page = DEEP_LOGIN_PAGE.format(uuid=uuid_str, challenge=challenge)
+        self._send(200, page, "text/html; charset=utf-8")
+
+    def _handle_account_info(self, path: str, query: Dict[str, str]) -> None:
+        """用量/会员信息接口，支持ETag与If-None-Match条件请求"""
+        userid = self._session_userid()
+        if not userid or (path == "/api/usage" and query.get("user") != userid):
+            self.state.count("bad_request")
+            self._send(401, {"error": "not_authenticated"})
+            return
+
+        if path == "/api/usage":
+            self.state.count("usage")
+            body: Dict[str, Any] = {
+                "gpt-4": {"numRequests": 0, "maxRequestUsage": 500},
+                "startOfMonth": "2026-01-01T00:00:00.000Z"
+            }
+        else:
+            self.state.count("stripe")
+            body = {"membershipType": "pro", "daysRemainingOnTrial": 0}
+
+        etag = '"' + hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.state.count("not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self._send(200, body, extra_headers={"ETag": etag})
+
+    def _handle_poll(self, query: Dict[str, str]) -> None:
+        self.state.count("poll")
+        uuid_str = query.get("uuid")
+        verifier = query.get("verifier")
+        session = self.state.lookup(uuid_str) if uuid_str else None
+        if not session or not verifier or _challenge_for(verifier) != session.get("challenge"):
+            self.state.count("bad_request")
+            self._send(400, {"error": "invalid_verifier"})
+            return
+
+        ready_at = session.get("ready_at")
+        if ready_at is None or time.monotonic() < ready_at:
+            # 与线上行为一致：登录尚未确认时返回404
+            self.state.count("poll_pending")
+            self._send(404, {"error": "pending"})
+            return
+
+        self.state.count("poll_success")
+        userid = session["userid"]
+        self._send(200, {
+            "accessToken": make_fake_jwt(userid, self.config.token_days),
+            "refreshToken": make_fake_jwt(userid, self.config.token_days),
+            "challenge": session["challenge"],
+            "authId": f"auth0|{userid}",
+            "uuid": uuid_str
+        })
+
+
+class FakeCursorServer:
+    """替身服务器，可在后台线程中启动，供测试和压测脚本使用"""
+
+    def __init__(self, config: Optional[FakeServerConfig] = None, host: str = "127.0.0.1",
+                 port: int = 0, verbose: bool = False):
+        self.config = config or FakeServerConfig()
+        self.state = FakeAuthState()
+        self.httpd = ThreadingHTTPServer((host, port), FakeCursorRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake_config = self.config
+        self.httpd.fake_state = self.state
+        self.httpd.verbose = verbose
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeCursorServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def point_env_here(self) -> None:
+        """设置环境变量，使 native_host / get_cursor_deep_token 指向本服务器"""
+        os.environ["CURSOR_WEB_BASE_URL"] = self.base_url
+        os.environ["CURSOR_API_BASE_URL"] = self.base_url
+
+    def __enter__(self) -> "FakeCursorServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩法计算百分位数（输入需已排序）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def run_deep_token_benchmark(server: FakeCursorServer, total: int, concurrency: int,
+                             max_attempts: int, poll_delay: float, hedge: bool = False) -> Dict[str, Any]:
+    """
+    使用 DeepTokenManager.get_deep_token_headless 对替身服务器进行并发压测
+
+    保护器和轮询客户端使用本次压测私有、不落盘的实例，
+    回环地址的延迟样本和熔断状态不会写入数据目录影响真实调用。
+    """
+    server.point_env_here()
+    from native_host import DeepTokenManager, DeepTokenPollClient, OutboundCallGuard
+    guard = OutboundCallGuard(state_path=None)
+    poll_client = DeepTokenPollClient(guard=guard, hedge=hedge, state_path=None)
+
+    def one(index: int) -> Dict[str, Any]:
+        start = time.perf_counter()
+        result = DeepTokenManager.get_deep_token_headless(
+            f"fake-client-token-{index}", f"user_bench{index:06d}",
+            max_attempts=max_attempts, poll_delay=poll_delay, guard=guard, poll_client=poll_client
+        )
+        return {"ok": bool(result.get("success")), "seconds": time.perf_counter() - start}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(r["seconds"] * 1000.0 for r in results if r["ok"])
+    successes = len(latencies)
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "successes": successes,
+        "failures": total - successes,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_sec": round(successes / wall, 2) if wall > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0
+        },
+        "poll_client": poll_client.stats(),
+        "server": server.state.snapshot()
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Cursor服务本地替身服务器")
+    sub = parser.add_subparsers(dest="command")
+
+    def add_common(p: argparse.ArgumentParser) -> None:
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=8787)
+        p.add_argument("--latency-ms", type=float, default=0.0, help="基础延迟(毫秒)")
+        p.add_argument("--jitter-ms", type=float, default=0.0, help="随机抖动上限(毫秒)")
+        p.add_argument("--slow-ratio", type=float, default=0.0, help="慢请求概率(0-1)")
+        p.add_argument("--slow-ms", type=float, default=0.0, help="慢请求额外延迟(毫秒)")
+        p.add_argument("--error-rate", type=float, default=0.0, help="注入500错误的概率(0-1)")
+        p.add_argument("--token-delay", type=float, default=0.0, help="确认后token可用的延迟(秒)")
+        p.add_argument("--rate-limit", type=float, default=0.0, help="每客户端每秒请求上限，0为不限")
+        p.add_argument("--burst", type=int, default=0, help="限流令牌桶容量")
+        p.add_argument("--no-auto-confirm", action="store_true", help="访问登录页时不自动确认，需点击按钮")
+        p.add_argument("--seed", type=int, default=None)
+        p.add_argument("--verbose", action="store_true")
+
+    add_common(sub.add_parser("serve", help="启动替身服务器"))
+    bench = sub.add_parser("bench", help="启动替身服务器并压测深度Token获取")
+    add_common(bench)
+    bench.add_argument("--requests", type=int, default=200, help="总获取次数")
+    bench.add_argument("--concurrency", type=int, default=16, help="并发数")
+    bench.add_argument("--max-attempts", type=int, default=5, help="每次获取的最大尝试次数")
+    bench.add_argument("--poll-delay", type=float, default=0.0, help="访问登录页后到轮询的等待秒数")
+    bench.add_argument("--hedge", action="store_true", help="开启auth/poll对冲请求")
+    return parser
+
+
+def config_from_args(args: argparse.Namespace) -> FakeServerConfig:
+    return FakeServerConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        slow_ratio=args.slow_ratio, slow_ms=args.slow_ms,
+        error_rate=args.error_rate, token_delay=args.token_delay,
+        rate_limit=args.rate_limit, burst=args.burst,
+        auto_confirm=not args.no_auto_confirm, seed=args.seed
+    )
+
+
+def main() -> None:
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        return
+
+    config = config_from_args(args)
+    if args.command == "serve":
+        server = FakeCursorServer(config, args.host, args.port, verbose=args.verbose)
+        print(f"🧪 替身服务器已启动: {server.base_url}")
+        print(f"   export CURSOR_WEB_BASE_URL={server.base_url}")
+        print(f"   export CURSOR_API_BASE_URL={server.base_url}")
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\n🛑 替身服务器已停止")
+        finally:
+            server.httpd.server_close()
+    elif args.command == "bench":
+        with FakeCursorServer(config, args.host, args.port, verbose=args.verbose) as server:
+            report = run_deep_token_benchmark(server, args.requests, args.concurrency,
+                                              args.max_attempts, args.poll_delay, args.hedge)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@
 原生主机连接问题诊断和修复工具
 """
 
+import argparse
 import json
 import os
 import sys
@@ -10,6 +11,15 @@ import subprocess
 import platform
 from pathlib import Path
 
+# 避免在扩展目录下生成__pycache__导致Chrome扩展加载失败
+sys.dont_write_bytecode = True
+
+from debug_native_messaging import frame_message  # noqa: E402
+from diagnostics import (  # noqa: E402
+    DiagnosticsEngine, add_engine_arguments, manifest_fingerprint_paths,
+    run_engine
+)
+
 class NativeHostFixer:
     def __init__(self):
         self.system = platform.system()
@@ -28,102 +38,100 @@ class NativeHostFixer:
         else:
             raise Exception(f"不支持的操作系统: {self.system}")
     
-    def diagnose(self):
-        """诊断原生主机连接问题"""
-        print("🔍 开始诊断原生主机连接问题...\n")
-        
-        issues = []
-        suggestions = []
-        
-        # 1. 检查原生主机文件
+    def build_diagnostics(self):
+        """声明诊断检查项：清单解析按清单与脚本指纹缓存，本地脚本测试会启动主机，每次都重新执行"""
         native_host_dir = self.get_native_host_dir()
         config_file = native_host_dir / f"{self.native_host_name}.json"
         script_file = native_host_dir / "native_host.py"
-        
-        print(f"📁 原生主机目录: {native_host_dir}")
-        print(f"📄 配置文件: {config_file}")
-        print(f"🐍 脚本文件: {script_file}")
-        print()
-        
-        if not native_host_dir.exists():
-            issues.append("❌ 原生主机目录不存在")
-            suggestions.append("运行: python3 install_native_host.py install")
-        else:
-            print("✅ 原生主机目录存在")
-        
-        if not config_file.exists():
-            issues.append("❌ 原生主机配置文件不存在")
-            suggestions.append("运行: python3 install_native_host.py install")
-        else:
-            print("✅ 原生主机配置文件存在")
-            
-            # 检查配置文件内容
+        local_script = self.script_dir / "native_host.py"
+        engine = DiagnosticsEngine("fix_native_host",
+                                   manifest_fingerprint_paths(str(config_file), str(script_file), str(local_script)))
+
+        @engine.check("host_dir", title="原生主机目录")
+        def check_host_dir(ctx):
+            ctx.log(f"📁 {native_host_dir}")
+            if not native_host_dir.exists():
+                ctx.issue("原生主机目录不存在", "运行: python3 install_native_host.py install")
+
+        @engine.check("manifest", title="原生主机配置文件", cacheable=True)
+        def check_manifest(ctx):
+            ctx.log(f"📄 {config_file}")
+            if not config_file.exists():
+                ctx.issue("原生主机配置文件不存在", "运行: python3 install_native_host.py install")
+                return None
             try:
                 with open(config_file, 'r') as f:
                     config = json.load(f)
-                
-                print(f"📋 配置内容:")
-                print(f"   名称: {config.get('name')}")
-                print(f"   描述: {config.get('description')}")
-                print(f"   路径: {config.get('path')}")
-                print(f"   允许的来源: {config.get('allowed_origins', [])}")
-                
-                # 检查路径是否正确
-                config_path = Path(config.get('path', ''))
-                if not config_path.exists():
-                    issues.append(f"❌ 脚本路径不存在: {config_path}")
-                    suggestions.append("运行: python3 install_native_host.py install")
-                else:
-                    print("✅ 脚本路径存在")
-                
-                # 检查扩展ID配置
-                allowed_origins = config.get('allowed_origins', [])
-                if not allowed_origins:
-                    issues.append("❌ 未配置允许的扩展来源")
-                    suggestions.append("需要配置扩展ID: python3 update_native_host.py [扩展ID]")
-                else:
-                    print("✅ 已配置扩展来源")
-                    for origin in allowed_origins:
-                        extension_id = origin.replace('chrome-extension://', '').replace('/', '')
-                        print(f"   扩展ID: {extension_id}")
-                
             except Exception as e:
-                issues.append(f"❌ 配置文件格式错误: {e}")
-                suggestions.append("重新安装: python3 install_native_host.py install")
-        
-        if not script_file.exists():
-            issues.append("❌ 原生主机脚本不存在")
-            suggestions.append("运行: python3 install_native_host.py install")
-        else:
-            print("✅ 原生主机脚本存在")
-            
-            # 检查脚本权限
-            if not os.access(script_file, os.X_OK):
-                issues.append("❌ 原生主机脚本无执行权限")
-                suggestions.append(f"添加执行权限: chmod +x {script_file}")
+                ctx.issue(f"配置文件格式错误: {e}", "重新安装: python3 install_native_host.py install")
+                return None
+            ctx.log(f"名称: {config.get('name')}")
+            ctx.log(f"描述: {config.get('description')}")
+            ctx.log(f"路径: {config.get('path')}")
+            ctx.log(f"允许的来源: {config.get('allowed_origins', [])}")
+            return {"path": config.get('path', ''), "allowed_origins": config.get('allowed_origins', [])}
+
+        @engine.check("manifest_path", depends=["manifest"], title="配置中的脚本路径")
+        def check_manifest_path(ctx):
+            config_path = Path(ctx.details("manifest")["path"])
+            if not config_path.exists():
+                ctx.issue(f"脚本路径不存在: {config_path}", "运行: python3 install_native_host.py install")
+
+        @engine.check("allowed_origins", depends=["manifest"], title="允许的扩展来源")
+        def check_allowed_origins(ctx):
+            allowed_origins = ctx.details("manifest")["allowed_origins"]
+            if not allowed_origins:
+                ctx.issue("未配置允许的扩展来源", "需要配置扩展ID: python3 update_native_host.py [扩展ID]")
+            for origin in allowed_origins:
+                extension_id = origin.replace('chrome-extension://', '').replace('/', '')
+                ctx.log(f"扩展ID: {extension_id}")
+
+        @engine.check("script", title="原生主机脚本")
+        def check_script(ctx):
+            ctx.log(f"🐍 {script_file}")
+            if not script_file.exists():
+                ctx.issue("原生主机脚本不存在", "运行: python3 install_native_host.py install")
+            elif not os.access(script_file, os.X_OK):
+                ctx.issue("原生主机脚本无执行权限", f"添加执行权限: chmod +x {script_file}")
             else:
-                print("✅ 原生主机脚本有执行权限")
-        
-        # 2. 测试脚本功能
-        print("\n🧪 测试原生主机脚本功能...")
-        local_script = self.script_dir / "native_host.py"
-        if local_script.exists():
+                ctx.log("脚本有执行权限")
+
+        @engine.check("local_script", title="本地脚本功能测试")
+        def check_local_script(ctx):
+            if not local_script.exists():
+                ctx.warn(f"本地脚本不存在: {local_script}")
+                return None
             try:
-                result = subprocess.run([
-                    sys.executable, str(local_script)
-                ], input='{"action": "testConnection"}', 
-                text=True, capture_output=True, timeout=10)
-                
-                if result.returncode == 0:
-                    print("✅ 本地脚本测试成功")
-                else:
-                    issues.append(f"❌ 本地脚本测试失败: {result.stderr}")
-                    suggestions.append("检查Python环境和依赖")
+                result = subprocess.run([sys.executable, "-B", str(local_script)],
+                                        input=frame_message({"action": "testConnection"}),
+                                        capture_output=True, timeout=10)
             except Exception as e:
-                issues.append(f"❌ 本地脚本测试异常: {e}")
-                suggestions.append("检查Python环境")
-        
-        # 3. 输出诊断结果
+                ctx.issue(f"本地脚本测试异常: {e}", "检查Python环境")
+                return None
+            if result.returncode == 0 and len(result.stdout) > 4:
+                ctx.log("本地脚本测试成功")
+            else:
+                ctx.issue(f"本地脚本测试失败: {result.stderr.decode('utf-8', errors='ignore')}",
+                          "检查Python环境和依赖")
+            return {"returncode": result.returncode}
+
+        return engine
+
+    def diagnose(self, args=None):
+        """诊断原生主机连接问题，args 为 add_engine_arguments 解析出的参数（--json/--no-cache/--jobs）"""
+        if args is None:
+            args = argparse.Namespace(json=False, no_cache=False, clear_cache=False, jobs=8)
+        if not args.json:
+            print("🔍 开始诊断原生主机连接问题...\n")
+
+        report = run_engine(self.build_diagnostics(), args)
+        if args.json:
+            return report["passed"]
+
+        issues = [f"❌ {text}" for check in report["checks"] for text in check["issues"]]
+        suggestions = [text for check in report["checks"] for text in check["suggestions"]]
+
+        # 输出诊断结果
         print("\n" + "="*50)
         print("📊 诊断结果")
         print("="*50)
@@ -140,10 +148,10 @@ class NativeHostFixer:
                 print(f"{i}. {issue}")
             
             print("\n💡 建议的解决方案:")
-            for i, suggestion in enumerate(set(suggestions), 1):
+            for i, suggestion in enumerate(dict.fromkeys(suggestions), 1):
                 print(f"{i}. {suggestion}")
         
-        return len(issues) == 0
+        return report["passed"]
     
     def auto_fix(self):
         """自动修复常见问题"""
@@ -209,26 +217,34 @@ class NativeHostFixer:
 def main():
     fixer = NativeHostFixer()
     
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "--fix":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command in ("--fix", "--id-guide", "--help") or (command and not command.startswith("--")):
+        if command == "--fix":
             fixer.auto_fix()
-        elif sys.argv[1] == "--id-guide":
+        elif command == "--id-guide":
             fixer.get_extension_id_guide()
-        elif sys.argv[1] == "--help":
+        elif command == "--help":
             print("原生主机修复工具")
             print("用法:")
             print("  python3 fix_native_host.py           # 诊断问题")
+            print("  python3 fix_native_host.py --json    # 诊断并输出JSON报告（含每项耗时）")
+            print("  python3 fix_native_host.py --no-cache # 诊断时忽略缓存，全部重新检查")
             print("  python3 fix_native_host.py --fix     # 自动修复")
             print("  python3 fix_native_host.py --id-guide # 显示获取扩展ID指南")
         else:
             print("未知参数，使用 --help 查看帮助")
     else:
         # 默认执行诊断
-        success = fixer.diagnose()
+        parser = argparse.ArgumentParser(description="原生主机连接问题诊断")
+        add_engine_arguments(parser)
+        args = parser.parse_args()
+        success = fixer.diagnose(args)
         
-        if not success:
+        if not success and not args.json:
             print(f"\n🔧 要自动修复这些问题，请运行:")
             print(f"python3 {sys.argv[0]} --fix")
+        if args.json:
+            sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+合成Cursor数据目录生成器
+生成与长期使用的Cursor安装结构一致的数据目录，用于在10×–1000×规模下测试和压测读取路径:
+  <输出目录>/User/globalStorage/state.vscdb   ItemTable，值大小呈对数正态分布，可保留未检查点的WAL
+  <输出目录>/sentry/scope_v3.json             用户信息 + 大量breadcrumbs，末尾带%
+
+规模预设（--scale）以开发机上的小数据为1×：1000行ItemTable、100条breadcrumb；
+单独指定的 --rows / --breadcrumbs 优先于预设。
+
+用法:
+  python3 gen_cursor_profile.py [--scale 100] [--out 目录] [--rows N] [--value-median 512]
+                                [--value-max 65536] [--wal-rows 500] [--breadcrumbs N]
+
+生成后把原生主机指向该目录:
+  export CURSOR_APP_DATA_DIR=<输出目录>
+  python3 tests/compare_benchmarks.py run      # 基准测试会读取该目录
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# 避免在扩展目录下生成__pycache__导致Chrome扩展加载失败
+sys.dont_write_bytecode = True
+
+from fake_cursor_server import make_fake_jwt  # noqa: E402
+
+BASE_ROWS = 1000
+BASE_BREADCRUMBS = 100
+DEFAULT_EMAIL = "synthetic@example.com"
+DEFAULT_USERID = "user_01SYNTHETIC000000000000000"
+
+# 真实state.vscdb中常见的键前缀，值多为JSON
+KEY_PREFIXES = (
+    "workbench.panel.", "workbench.view.", "memento/workbench.editors.", "history.recentlyOpened.",
+    "src.vs.platform.reactiveStorage.", "aiService.prompts.", "composerData.", "extensionsIdentifiers/"
+)
+
+
+def value_sizes(rng: random.Random, count: int, median: int, maximum: int) -> Iterator[int]:
+    """对数正态分布的值大小：多数很小，少数（编辑器状态、对话记录）很大"""
+    mu = math.log(max(median, 1))
+    for _ in range(count):
+        yield max(16, min(maximum, int(rng.lognormvariate(mu, 1.2))))
+
+
+def text_pool(rng: random.Random, size: int = 256 * 1024) -> str:
+    """预先生成的随机文本，各行的值从中截取，百万行规模下也不必逐字符生成"""
+    return "".join(rng.choices("abcdefghijklmnopqrstuvwxyz0123456789 ", k=size))
+
+
+def pool_text(rng: random.Random, pool: str, size: int) -> str:
+    """从文本池的随机位置截取size个字符"""
+    start = rng.randrange(len(pool))
+    if start + size <= len(pool):
+        return pool[start:start + size]
+    return (pool[start:] + pool * (size // len(pool) + 1))[:size]
+
+
+def make_value(rng: random.Random, size: int, pool: str) -> str:
+    """构造约size字节的JSON值"""
+    return json.dumps({"v": 1, "ts": rng.randrange(1_600_000_000, 1_800_000_000),
+                       "data": pool_text(rng, pool, size)})
+
+
+def item_rows(rng: random.Random, rows: int, median: int, maximum: int, pool: str) -> Iterator[Tuple[str, str]]:
+    for index, size in enumerate(value_sizes(rng, rows, median, maximum)):
+        yield f"{KEY_PREFIXES[index % len(KEY_PREFIXES)]}{index}", make_value(rng, size, pool)
+
+
+def create_state_db(path: str, rows: int, access_token: str, email: str = DEFAULT_EMAIL,
+                    value_median: int = 512, value_max: int = 64 * 1024, wal_rows: int = 0,
+                    seed: int = 42) -> Dict[str, Any]:
+    """
+    生成state.vscdb
+
+    Args:
+        path: 输出路径
+        rows: 无关键值的行数（cursorAuth键另加）
+        access_token: 写入cursorAuth/accessToken的token
+        value_median / value_max: 值大小的中位数和上限（字节）
+        wal_rows: 最后更新的行数，这些更新保留在未检查点的 -wal 文件中
+                  （模拟Cursor运行时的状态）；0表示不生成WAL文件
+        seed: 随机种子，相同参数生成相同内容
+    """
+    rng = random.Random(seed)
+    pool = text_pool(rng)
+    # 先在临时目录生成，WAL模式下关闭连接会检查点并删除WAL，所以在连接打开时复制出WAL文件
+    staging = tempfile.mkdtemp(prefix="cursor_profile_staging_")
+    staging_path = os.path.join(staging, "state.vscdb")
+    conn = sqlite3.connect(staging_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE ItemTable (key TEXT UNIQUE ON CONFLICT REPLACE, value BLOB)")
+        conn.executemany("INSERT INTO ItemTable (key, value) VALUES (?, ?)",
+                         item_rows(rng, rows, value_median, value_max, pool))
+        conn.executemany("INSERT INTO ItemTable (key, value) VALUES (?, ?)", [
+            ("cursorAuth/accessToken", access_token),
+            ("cursorAuth/refreshToken", access_token),
+            ("cursorAuth/cachedEmail", email),
+            ("cursorAuth/cachedSignUpType", "Auth_0"),
+            ("cursorAuth/stripeMembershipType", "pro")
+        ])
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        if wal_rows > 0:
+            conn.execute("PRAGMA wal_autocheckpoint=0")
+            keys = [f"{KEY_PREFIXES[i % len(KEY_PREFIXES)]}{i}" for i in rng.sample(range(rows), min(wal_rows, rows))]
+            conn.executemany("INSERT INTO ItemTable (key, value) VALUES (?, ?)",
+                             ((key, make_value(rng, size, pool)) for key, size in
+                              zip(keys, value_sizes(rng, len(keys), value_median, value_max))))
+            conn.commit()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        shutil.copyfile(staging_path, path)
+        if wal_rows > 0:
+            shutil.copyfile(staging_path + "-wal", path + "-wal")
+    finally:
+        conn.close()
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return {
+        "path": path,
+        "rows": rows + 5,
+        "walRows": wal_rows,
+        "sizeBytes": os.path.getsize(path),
+        "walBytes": os.path.getsize(path + "-wal") if os.path.exists(path + "-wal") else 0
+    }
+
+
+def create_scope_json(path: str, breadcrumbs: int, email: str = DEFAULT_EMAIL, userid: str = DEFAULT_USERID,
+                      breadcrumb_size: int = 200, seed: int = 42) -> Dict[str, Any]:
+    """生成scope_v3.json：sentry作用域（用户、标签、上下文）+ breadcrumbs，末尾带%"""
+    rng = random.Random(seed)
+    pool = text_pool(rng, 64 * 1024)
+    now = time.time()
+    data = {
+        "scope": {
+            "user": {"email": email, "id": f"auth0|{userid}"},
+            "tags": {"platform": sys.platform, "release": "cursor@1.0.0"},
+            "contexts": {"app": {"app_name": "Cursor"}, "os": {"name": sys.platform}},
+            "breadcrumbs": [
+                {
+                    "timestamp": round(now - (breadcrumbs - i), 3),
+                    "category": rng.choice(("console", "ui.click", "navigation", "http", "electron")),
+                    "level": rng.choice(("info", "info", "info", "warning", "error")),
+                    "message": pool_text(rng, pool, breadcrumb_size)
+                }
+                for i in range(breadcrumbs)
+            ]
+        },
+        "event": {"sdk": {"name": "sentry.javascript.electron"}}
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(data) + "%")
+    return {"path": path, "breadcrumbs": breadcrumbs, "sizeBytes": os.path.getsize(path)}
+
+
+def generate_profile(out_dir: str, rows: int, breadcrumbs: int, value_median: int = 512,
+                     value_max: int = 64 * 1024, wal_rows: int = 0, breadcrumb_size: int = 200,
+                     email: str = DEFAULT_EMAIL, userid: str = DEFAULT_USERID,
+                     token_days: int = 30, seed: int = 42) -> Dict[str, Any]:
+    """按 CursorDataManager 期望的目录结构生成完整的数据目录"""
+    started = time.perf_counter()
+    state = create_state_db(
+        os.path.join(out_dir, "User", "globalStorage", "state.vscdb"),
+        rows, make_fake_jwt(userid, token_days), email, value_median, value_max, wal_rows, seed
+    )
+    scope = create_scope_json(os.path.join(out_dir, "sentry", "scope_v3.json"),
+                              breadcrumbs, email, userid, breadcrumb_size, seed)
+    return {
+        "dataDir": out_dir,
+        "env": f"CURSOR_APP_DATA_DIR={out_dir}",
+        "email": email,
+        "userid": userid,
+        "stateDb": state,
+        "scopeJson": scope,
+        "elapsedSeconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="生成合成Cursor数据目录（state.vscdb + scope_v3.json）")
+    parser.add_argument("--out", help="输出目录，默认新建临时目录")
+    parser.add_argument("--scale", type=float, default=1.0, help="规模倍数（1× = 1000行、100条breadcrumb）")
+    parser.add_argument("--rows", type=int, help="ItemTable行数，覆盖--scale")
+    parser.add_argument("--value-median", type=int, default=512, help="值大小中位数(字节)")
+    parser.add_argument("--value-max", type=int, default=64 * 1024, help="值大小上限(字节)")
+    parser.add_argument("--wal-rows", type=int, default=0, help="保留在WAL中未检查点的更新行数，0为无WAL")
+    parser.add_argument("--breadcrumbs", type=int, help="breadcrumb条数，覆盖--scale")
+    parser.add_argument("--breadcrumb-size", type=int, default=200, help="每条breadcrumb消息长度")
+    parser.add_argument("--email", default=DEFAULT_EMAIL)
+    parser.add_argument("--userid", default=DEFAULT_USERID)
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    args = parser.parse_args(argv)
+
+    out_dir = os.path.abspath(args.out) if args.out else tempfile.mkdtemp(prefix="cursor_profile_")
+    rows = args.rows if args.rows is not None else int(BASE_ROWS * args.scale)
+    breadcrumbs = args.breadcrumbs if args.breadcrumbs is not None else int(BASE_BREADCRUMBS * args.scale)
+    report = generate_profile(out_dir, rows, breadcrumbs, args.value_median, args.value_max,
+                              args.wal_rows, args.breadcrumb_size, args.email, args.userid, seed=args.seed)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,138 @@
+import argparse
+import json
 import logging
+import os
+import threading
 import time
 import uuid
 import secrets
 import hashlib
 import base64
 import requests
-from typing import Optional, Tuple, Dict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
-def get_cursor_session_token(driver, max_attempts: int = 3, retry_interval: int = 2, cookies: Dict[str, str] = None) -> Optional[Tuple[str, str]]:
+# 服务基础URL，可通过环境变量指向本地替身服务器（见 fake_cursor_server.py）
+WEB_BASE_URL_ENV = "CURSOR_WEB_BASE_URL"
+API_BASE_URL_ENV = "CURSOR_API_BASE_URL"
+
+
+def get_web_base_url() -> str:
+    """获取网站基础URL，默认 https://www.cursor.com"""
+    return (os.getenv(WEB_BASE_URL_ENV) or "https://www.cursor.com").rstrip("/")
+
+
+def get_api_base_url() -> str:
+    """获取API基础URL，默认 https://api2.cursor.sh"""
+    return (os.getenv(API_BASE_URL_ENV) or "https://api2.cursor.sh").rstrip("/")
+
+POLL_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Cursor/0.48.6 Chrome/132.0.6834.210 Electron/34.3.4 Safari/537.36",
+    "Accept": "*/*"
+}
+
+
+class StepTimer:
+    """
+    分步计时器
+    
+    记录深度登录流程中每一步的耗时，用于定位转换时间花在哪里。
+    """
+    
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+    
+    @contextmanager
+    def step(self, name: str, **extra) -> Iterator[Dict[str, Any]]:
+        """计时一个步骤，可在with块内向返回的字典补充信息"""
+        record: Dict[str, Any] = {"step": name, **extra}
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - started, 4)
+            self.records.append(record)
+            logging.debug(f"步骤 {name} 耗时 {record['seconds']:.3f}s")
+    
+    def summary(self) -> Dict[str, float]:
+        """按步骤名汇总耗时（秒）"""
+        totals: Dict[str, float] = {}
+        for record in self.records:
+            totals[record["step"]] = round(totals.get(record["step"], 0.0) + record["seconds"], 4)
+        return totals
+
+
+def wait_for_page_ready(driver, timeout: float = 10) -> None:
+    """等待页面document.readyState变为complete"""
+    WebDriverWait(driver, timeout).until(
+        lambda d: d.execute_script("return document.readyState") == "complete"
+    )
+
+
+def poll_auth_result(uuid_str: str, verifier: str, timeout: float = 10.0,
+                     interval: float = 0.25, session: Optional[requests.Session] = None,
+                     record: Optional[Dict[str, Any]] = None) -> Optional[Tuple[str, str]]:
+    """
+    轮询认证结果，拿到token立即返回
+    
+    Args:
+        uuid_str: 深度登录UUID
+        verifier: PKCE verifier
+        timeout: 轮询总时长上限(秒)
+        interval: 两次轮询之间的间隔(秒)
+        session: 复用的HTTP会话
+        record: 用于记录轮询次数等信息的字典
+        
+    Returns:
+        Tuple[str, str] | None: 成功返回(userId, accessToken)元组，超时返回None
+    """
+    http = session or requests.Session()
+    auth_poll_url = f"{get_api_base_url()}/auth/poll?uuid={uuid_str}&verifier={verifier}"
+    logging.info(f"轮询认证状态: {auth_poll_url}")
+    
+    deadline = time.monotonic() + timeout
+    requests_made = 0
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            requests_made += 1
+            try:
+                response = http.get(auth_poll_url, headers=POLL_HEADERS, timeout=min(5.0, remaining))
+                if response.status_code == 200:
+                    data = response.json()
+                    accessToken = data.get("accessToken", None)
+                    authId = data.get("authId", "")
+                    
+                    if accessToken:
+                        userId = ""
+                        if len(authId.split("|")) > 1:
+                            userId = authId.split("|")[1]
+                        return userId, accessToken
+                elif response.status_code != 404:
+                    # 404表示登录尚未确认，其他状态码记录下来继续轮询
+                    logging.warning(f"轮询返回状态码: {response.status_code}")
+            except requests.RequestException as e:
+                logging.warning(f"轮询请求失败: {str(e)}")
+            
+            time.sleep(max(0.0, min(interval, deadline - time.monotonic())))
+        return None
+    finally:
+        if record is not None:
+            record["requests"] = requests_made
+        if session is None:
+            http.close()
+
+
+def get_cursor_session_token(driver, max_attempts: int = 3, retry_interval: int = 2, cookies: Dict[str, str] = None,
+                             poll_timeout: float = 10.0, poll_interval: float = 0.25,
+                             timer: Optional[StepTimer] = None) -> Optional[Tuple[str, str]]:
     """
     获取Cursor会话token
     
@@ -19,11 +141,15 @@ def get_cursor_session_token(driver, max_attempts: int = 3, retry_interval: int
         max_attempts: 最大尝试次数
         retry_interval: 重试间隔(秒)
         cookies: 要设置的cookies字典，格式为{name: value}
+        poll_timeout: 点击确认后轮询认证结果的最长时间(秒)
+        poll_interval: 轮询间隔(秒)
+        timer: 分步计时器，传入后记录每一步的耗时
         
     Returns:
         Tuple[str, str] | None: 成功返回(userId, accessToken)元组，失败返回None
     """
     logging.info("开始获取会话令牌")
+    timer = timer or StepTimer()
     
     # 首先尝试使用UUID深度登录方式
     logging.info("尝试使用深度登录方式获取token")
@@ -35,81 +161,124 @@ def get_cursor_session_token(driver, max_attempts: int = 3, retry_interval: int
         code_challenge = base64.urlsafe_b64encode(code_challenge_digest).decode('utf-8').rstrip('=')    
         return code_verifier, code_challenge
     
-    attempts = 0
-    while attempts < max_attempts:
-        try:
-            verifier, challenge = _generate_pkce_pair()
-            id = uuid.uuid4()
-            client_login_url = f"https://www.cursor.com/cn/loginDeepControl?challenge={challenge}&uuid={id}&mode=login"
-            
-            # 先访问网站，以便可以设置cookie
-            logging.info(f"首先访问网站: https://www.cursor.com/")
-            driver.get("https://www.cursor.com/")
-            time.sleep(1)
-            
-            # 如果提供了cookies，先设置到浏览器
-            if cookies:
-                logging.info("设置浏览器cookies")
-                for name, value in cookies.items():
-                    # 不指定domain，让浏览器自动匹配当前域名
-                    driver.add_cookie({"name": name, "value": value, "path": "/"})
-                logging.info("cookies设置完成")
-            
-            logging.info(f"访问深度登录URL: {client_login_url}")
-            driver.get(client_login_url)
-            
-            # 使用WebDriverWait等待元素出现，最多等待5秒
+    # 如果提供了cookies，先设置到浏览器（cookie在多次尝试间保持有效，只需设置一次）
+    if cookies:
+        with timer.step("set_cookies"):
+            set_session_cookies(driver, cookies)
+    
+    http = requests.Session()
+    try:
+        attempts = 0
+        while attempts < max_attempts:
             try:
-                login_button = WebDriverWait(driver, 5).until(
-                    EC.presence_of_element_located((By.XPATH, "//span[contains(text(), 'Yes, Log In')]"))
-                )
-                logging.info("点击确认登录按钮")
-                login_button.click()
-                time.sleep(1.5)
-                
-                auth_poll_url = f"https://api2.cursor.sh/auth/poll?uuid={id}&verifier={verifier}"
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Cursor/0.48.6 Chrome/132.0.6834.210 Electron/34.3.4 Safari/537.36",
-                    "Accept": "*/*"
-                }
+                verifier, challenge = _generate_pkce_pair()
+                id = uuid.uuid4()
+                web_base_url = get_web_base_url()
+                client_login_url = f"{web_base_url}/cn/loginDeepControl?challenge={challenge}&uuid={id}&mode=login"
                 
-                logging.info(f"轮询认证状态: {auth_poll_url}")
-                response = requests.get(auth_poll_url, headers=headers, timeout=5)
+                logging.info(f"访问深度登录URL: {client_login_url}")
+                with timer.step("open_login_page", attempt=attempts + 1):
+                    driver.get(client_login_url)
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    accessToken = data.get("accessToken", None)
-                    authId = data.get("authId", "")
+                # 等待确认按钮可点击，最多等待5秒
+                try:
+                    with timer.step("wait_login_button", attempt=attempts + 1):
+                        login_button = WebDriverWait(driver, 5).until(
+                            EC.element_to_be_clickable((By.XPATH, "//span[contains(text(), 'Yes, Log In')]"))
+                        )
+                    logging.info("点击确认登录按钮")
+                    with timer.step("click", attempt=attempts + 1):
+                        login_button.click()
+                    
+                    # 点击后立即开始轮询，拿到token即停止
+                    with timer.step("poll", attempt=attempts + 1) as record:
+                        result = poll_auth_result(str(id), verifier, timeout=poll_timeout,
+                                                  interval=poll_interval, session=http, record=record)
+                    if result:
+                        logging.info(f"成功获取账号token和userId，步骤耗时: {timer.summary()}")
+                        return result
+                    logging.error(f"轮询 {poll_timeout} 秒内未获取到token")
+                except Exception as e:
+                    logging.warning(f"未找到登录确认按钮或点击失败: {str(e)}")
+                    
+                attempts += 1
+                if attempts < max_attempts:
+                    wait_time = retry_interval * attempts  # 逐步增加等待时间
+                    logging.warning(f"第 {attempts} 次尝试未获取到token，{wait_time}秒后重试...")
+                    with timer.step("retry_backoff", attempt=attempts):
+                        time.sleep(wait_time)
                     
-                    if accessToken:
-                        userId = ""
-                        if len(authId.split("|")) > 1:
-                            userId = authId.split("|")[1]
-                        
-                        logging.info("成功获取账号token和userId")
-                        return userId, accessToken
-                else:
-                    logging.error(f"API请求失败，状态码: {response.status_code}")
             except Exception as e:
-                logging.warning(f"未找到登录确认按钮或点击失败: {str(e)}")
-                
-            attempts += 1
-            if attempts < max_attempts:
-                wait_time = retry_interval * attempts  # 逐步增加等待时间
-                logging.warning(f"第 {attempts} 次尝试未获取到token，{wait_time}秒后重试...")
-                time.sleep(wait_time)
-                
-        except Exception as e:
-            logging.error(f"深度登录获取token失败: {str(e)}")
-            attempts += 1
-            if attempts < max_attempts:
-                wait_time = retry_interval * attempts
-                logging.warning(f"将在 {wait_time} 秒后重试...")
-                time.sleep(wait_time)
-    
-    logging.error(f"在 {max_attempts} 次尝试后仍未获取到token")
+                logging.error(f"深度登录获取token失败: {str(e)}")
+                attempts += 1
+                if attempts < max_attempts:
+                    wait_time = retry_interval * attempts
+                    logging.warning(f"将在 {wait_time} 秒后重试...")
+                    with timer.step("retry_backoff", attempt=attempts):
+                        time.sleep(wait_time)
+    finally:
+        http.close()
+    
+    logging.error(f"在 {max_attempts} 次尝试后仍未获取到token，步骤耗时: {timer.summary()}")
     return None
 
+def set_session_cookies(driver, cookies: Dict[str, str]) -> None:
+    """
+    设置会话cookies
+    
+    优先通过CDP直接写入cookie，无需先打开网站首页；
+    浏览器不支持CDP时回退为先访问首页再调用add_cookie。
+    
+    Args:
+        driver: Selenium WebDriver对象
+        cookies: 要设置的cookies字典，格式为{name: value}
+    """
+    web_base_url = get_web_base_url()
+    logging.info("设置浏览器cookies")
+    try:
+        for name, value in cookies.items():
+            driver.execute_cdp_cmd("Network.setCookie", {
+                "name": name,
+                "value": value,
+                "url": f"{web_base_url}/",
+                "path": "/"
+            })
+        logging.info("cookies设置完成 (CDP)")
+        return
+    except Exception as e:
+        logging.debug(f"CDP设置cookie失败，回退到页面方式: {str(e)}")
+    
+    # 先访问网站，以便可以设置cookie
+    logging.info(f"首先访问网站: {web_base_url}/")
+    driver.get(f"{web_base_url}/")
+    wait_for_page_ready(driver)
+    for name, value in cookies.items():
+        # 不指定domain，让浏览器自动匹配当前域名
+        driver.add_cookie({"name": name, "value": value, "path": "/"})
+    logging.info("cookies设置完成")
+
+
+def reset_browser_context(driver) -> None:
+    """
+    清空浏览器上下文（cookies、站点存储、缓存），使复用的浏览器在任务之间互相隔离
+    
+    Args:
+        driver: Selenium WebDriver对象
+    """
+    try:
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+        for origin in {get_web_base_url(), get_api_base_url()}:
+            driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+                "origin": origin,
+                "storageTypes": "all"
+            })
+    except Exception as e:
+        logging.debug(f"CDP清理失败，回退到WebDriver方式: {str(e)}")
+        driver.delete_all_cookies()
+    driver.get("about:blank")
+
+
 def init_browser(headless: bool = False):
     """
     初始化浏览器
@@ -136,30 +305,238 @@ def init_browser(headless: bool = False):
     logging.info("初始化Chrome浏览器" + (" (无头模式)" if headless else ""))
     return webdriver.Chrome(options=chrome_options)
 
-# 使用示例
-if __name__ == "__main__":
-    # 配置日志
+class WebDriverPool:
+    """
+    WebDriver浏览器池
+    
+    预先启动N个无头浏览器并在任务之间复用，每个任务开始前清空浏览器上下文，
+    避免每转换一个账户都要承担数秒的浏览器启动开销。
+    """
+    
+    ACQUIRE_TIMEOUT = 300.0
+    
+    def __init__(self, size: int = 2, headless: bool = True,
+                 driver_factory: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            size: 浏览器实例数量
+            headless: 是否使用无头模式
+            driver_factory: 自定义WebDriver创建函数，默认使用init_browser
+        """
+        if size < 1:
+            raise ValueError("浏览器池大小必须大于0")
+        self.size = size
+        self._factory = driver_factory or (lambda: init_browser(headless=headless))
+        self._idle: "deque[Any]" = deque()
+        self._drivers: List[Any] = []
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        # 当前池中的实例数（空闲 + 借出）；补充实例失败时减少，降到0时等待者立即失败而不是永远阻塞
+        self._capacity = 0
+        self._closed = False
+        self.startup_seconds = 0.0
+    
+    def _create_driver(self):
+        driver = self._factory()
+        with self._lock:
+            self._drivers.append(driver)
+        return driver
+    
+    def _discard_driver(self, driver) -> None:
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass  # 浏览器可能已崩溃，忽略退出错误
+    
+    def _release(self, driver) -> None:
+        with self._available:
+            self._idle.append(driver)
+            self._available.notify()
+    
+    def _replace(self, driver) -> None:
+        """丢弃出错的实例并补充一个新实例；补充失败时池容量减一"""
+        self._discard_driver(driver)
+        if self._closed:
+            return
+        try:
+            replacement = self._create_driver()
+        except Exception as e:
+            logging.error(f"补充浏览器实例失败，浏览器池容量减为 {self._capacity - 1}: {e}")
+            with self._available:
+                self._capacity -= 1
+                self._available.notify_all()
+            return
+        self._release(replacement)
+    
+    def warm(self) -> "WebDriverPool":
+        """并行启动全部浏览器实例；任一实例启动失败时退出已启动的实例并抛出异常"""
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            futures = [executor.submit(self._create_driver) for _ in range(self.size)]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            self.close()
+            raise errors[0]
+        with self._available:
+            self._idle.extend(future.result() for future in futures)
+            self._capacity = self.size
+            self._available.notify_all()
+        self.startup_seconds = time.perf_counter() - started
+        logging.info(f"浏览器池已就绪: {self.size} 个实例，耗时 {self.startup_seconds:.2f}s")
+        return self
+    
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = ACQUIRE_TIMEOUT) -> Iterator[Any]:
+        """
+        借出一个已清空上下文的浏览器，用完自动归还
+        
+        任务中浏览器发生异常时会被丢弃并补充一个新实例；补充失败时池容量减一，
+        容量降到0（或池未启动、已关闭）时抛出RuntimeError，等待超过timeout时抛出TimeoutError。
+        """
+        with self._available:
+            ready = self._available.wait_for(lambda: self._closed or self._idle or self._capacity <= 0, timeout)
+            if self._closed:
+                raise RuntimeError("浏览器池已关闭")
+            if not ready:
+                raise TimeoutError(f"等待空闲浏览器超过 {timeout}s")
+            if not self._idle:
+                raise RuntimeError("浏览器池中没有可用的浏览器实例（未启动或补充实例失败）")
+            driver = self._idle.popleft()
+        healthy = True
+        try:
+            reset_browser_context(driver)
+            yield driver
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            if healthy and not self._closed:
+                self._release(driver)
+            else:
+                self._replace(driver)
+    
+    def convert_session_tokens(self, session_tokens: List[str], **token_kwargs) -> List[Dict[str, Any]]:
+        """
+        并行地把一批WorkosCursorSessionToken转换为深度token
+        
+        Args:
+            session_tokens: 会话token列表（userid%3A%3AaccessToken格式）
+            **token_kwargs: 透传给get_cursor_session_token的参数
+            
+        Returns:
+            List[Dict[str, Any]]: 与输入顺序一致的结果列表，每项包含耗时明细(timings，单位秒)
+        """
+        def run_job(index: int) -> Dict[str, Any]:
+            queued_at = time.perf_counter()
+            result: Dict[str, Any] = {"index": index, "success": False}
+            try:
+                timer = StepTimer()
+                with self.acquire() as driver:
+                    acquired_at = time.perf_counter()
+                    token_result = get_cursor_session_token(
+                        driver, cookies={"WorkosCursorSessionToken": session_tokens[index]},
+                        timer=timer, **token_kwargs
+                    )
+                    finished_at = time.perf_counter()
+                result["timings"] = {
+                    "wait": round(acquired_at - queued_at, 3),
+                    "login": round(finished_at - acquired_at, 3),
+                    "total": round(finished_at - queued_at, 3),
+                    "steps": timer.summary()
+                }
+                if token_result:
+                    result.update({"success": True, "userId": token_result[0], "accessToken": token_result[1]})
+            except Exception as e:
+                result["error"] = str(e)
+                result["timings"] = {"total": round(time.perf_counter() - queued_at, 3)}
+            logging.info(f"任务 {index} 完成: success={result['success']} timings={result.get('timings')}")
+            return result
+        
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(executor.map(run_job, range(len(session_tokens))))
+    
+    def close(self) -> None:
+        """关闭全部浏览器实例"""
+        with self._available:
+            self._closed = True
+            drivers = list(self._drivers)
+            self._drivers.clear()
+            self._idle.clear()
+            self._available.notify_all()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+    
+    def __enter__(self) -> "WebDriverPool":
+        return self.warm()
+    
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def summarize_timings(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总批量转换的耗时统计"""
+    totals = sorted(r["timings"]["total"] for r in results if r.get("timings"))
+    if not totals:
+        return {"jobs": len(results), "succeeded": 0}
+    step_totals: Dict[str, float] = {}
+    for r in results:
+        for name, seconds in r.get("timings", {}).get("steps", {}).items():
+            step_totals[name] = round(step_totals.get(name, 0.0) + seconds, 3)
+    return {
+        "jobs": len(results),
+        "succeeded": sum(1 for r in results if r["success"]),
+        "steps_total": step_totals,
+        "total_p50": totals[len(totals) // 2],
+        "total_max": totals[-1],
+        "total_sum": round(sum(totals), 3)
+    }
+
+
+def main():
+    """命令行入口：单个或批量把会话token转换为深度token"""
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     
-    # 设置WorkosCursorSessionToken的值
-    session_token = "user_0xxxxxx%3A%3Aeyxxxxxx"
+    parser = argparse.ArgumentParser(description="通过深度登录把WorkosCursorSessionToken转换为深度token")
+    parser.add_argument("session_tokens", nargs="*", help="会话token（userid%%3A%%3AaccessToken）")
+    parser.add_argument("--tokens-file", help="每行一个会话token的文件")
+    parser.add_argument("--pool-size", type=int, default=1, help="并行使用的浏览器数量")
+    parser.add_argument("--max-attempts", type=int, default=3, help="每个账户的最大尝试次数")
+    parser.add_argument("--output", help="结果输出到JSON文件（默认打印）")
+    args = parser.parse_args()
     
-    # 初始化浏览器
-    driver = init_browser(headless=False)
+    session_tokens = list(args.session_tokens)
+    if args.tokens_file:
+        with open(args.tokens_file, "r", encoding="utf-8") as f:
+            session_tokens.extend(line.strip() for line in f if line.strip())
+    if not session_tokens:
+        parser.error("请提供至少一个会话token")
     
-    try:
-        # 设置cookies
-        cookies = {
-            "WorkosCursorSessionToken": session_token
+    pool_size = max(1, min(args.pool_size, len(session_tokens)))
+    started = time.perf_counter()
+    with WebDriverPool(size=pool_size, headless=True) as pool:
+        results = pool.convert_session_tokens(session_tokens, max_attempts=args.max_attempts)
+        report = {
+            "pool_size": pool_size,
+            "pool_startup_seconds": round(pool.startup_seconds, 3),
+            "wall_seconds": round(time.perf_counter() - started, 3),
+            "summary": summarize_timings(results),
+            "results": results
         }
-        
-        # 获取token
-        result = get_cursor_session_token(driver, cookies=cookies)
-        if result:
-            userId, accessToken = result
-            print(f"登录成功! userId: {userId}")
-            print(f"accessToken: {accessToken}")
-        else:
-            print("登录失败")
-    finally:
-        driver.quit()
\ No newline at end of file
+    
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"结果已写入: {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,53 @@ import shutil
 import subprocess
 from pathlib import Path
 
+# 安装目录中的主机模块名；native_host.py 安装为执行它的启动器
+HOST_MODULE = "cursor_native_host"
+
+# 作为脚本直接运行时Python每次都要重新编译整个 native_host.py（数千行，几十毫秒），
+# 所以安装为启动器 + 主机模块：启动器把编译结果缓存到数据目录（按源文件修改时间和大小失效），
+# 再以 __main__ 身份执行，行为与直接运行脚本相同。不设置sys.pycache_prefix，
+# 以免其他模块的字节码查找也被重定向；缓存写不进去时只是退回每次编译
+LAUNCHER_TEMPLATE = """#!/usr/bin/env python3
+# 由 install_native_host.py 生成，主机代码见同目录的 {module}.py
+import marshal
+import os
+import sys
+import types
+
+source_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "{module}.py")
+cache_path = os.path.join(os.environ.get("CURSOR_HOST_DATA_DIR") or os.path.expanduser("~/.cursor_client2login"),
+                          "pycache", "{module}." + sys.implementation.cache_tag + ".bin")
+source_stat = os.stat(source_path)
+key = [source_stat.st_mtime_ns, source_stat.st_size]
+
+code = None
+try:
+    with open(cache_path, "rb") as f:
+        if marshal.load(f) == key:
+            code = marshal.load(f)
+except (OSError, EOFError, ValueError, TypeError):
+    pass
+
+if code is None:
+    with open(source_path, "rb") as f:
+        code = compile(f.read(), source_path, "exec", dont_inherit=True)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + "." + str(os.getpid()) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            marshal.dump(key, f)
+            marshal.dump(code, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+main_module = types.ModuleType("__main__")
+main_module.__file__ = source_path
+sys.modules["__main__"] = main_module
+exec(code, main_module.__dict__)
+"""
+
 
 def get_system_info():
     """获取系统信息"""
@@ -35,6 +82,16 @@ def get_chrome_native_host_dir():
         return os.path.expanduser("~/.config/google-chrome/NativeMessagingHosts")
 
 
+def write_host_files(host_dir, native_host_script):
+    """把主机代码复制为模块并写入启动器，返回启动器路径"""
+    # 用copy而不是copy2：新的修改时间保证旧的字节码缓存失效
+    shutil.copy(native_host_script, os.path.join(host_dir, f"{HOST_MODULE}.py"))
+    target_script = os.path.join(host_dir, "native_host.py")
+    with open(target_script, 'w', encoding='utf-8') as f:
+        f.write(LAUNCHER_TEMPLATE.format(module=HOST_MODULE))
+    return target_script
+
+
 def create_native_host_manifest(host_dir, script_path):
     """创建原生主机清单文件"""
     manifest = {
@@ -74,18 +131,15 @@ def install_native_host():
         os.makedirs(host_dir, exist_ok=True)
         print(f"📁 原生主机目录: {host_dir}")
         
-        # 复制脚本到系统目录
+        # 复制脚本到系统目录（主机模块 + 启动器）
         system = get_system_info()
+        target_script = write_host_files(host_dir, native_host_script)
         if system == "windows":
             # Windows可能需要.exe或.bat包装器，但这里我们使用python直接路径
             python_executable = sys.executable
-            target_script = os.path.join(host_dir, "native_host.py")
-            shutil.copy2(native_host_script, target_script)
             # 在Windows上，我们需要在manifest中使用python解释器的完整路径
             script_path_for_manifest = f'"{python_executable}" "{target_script}"'
         else:
-            target_script = os.path.join(host_dir, "native_host.py")
-            shutil.copy2(native_host_script, target_script)
             script_path_for_manifest = target_script
         
         # 设置执行权限（Unix系统）
@@ -152,6 +206,7 @@ def uninstall_native_host():
         # 删除文件
         files_to_remove = [
             os.path.join(host_dir, "native_host.py"),
+            os.path.join(host_dir, f"{HOST_MODULE}.py"),
             os.path.join(host_dir, "native_host.exe"),
             os.path.join(host_dir, "com.cursor.client.manage.json")
         ]
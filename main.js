@@ -511,25 +511,35 @@ const UIManager = {
       let expiryDisplay = '未知';
       let expiryClass = '';
       
-      if (account.accessToken) {
+      // 原生账户存储已预计算过期信息时直接使用，否则在前端解码JWT
+      let expirationInfo = null;
+      if (account.expiryInfo && account.expiryInfo.exp) {
+        expirationInfo = {
+          expDate: new Date(account.expiryInfo.exp * 1000).toISOString(),
+          isExpired: account.expiryInfo.isExpired,
+          remainingDays: account.expiryInfo.remainingDays
+        };
+      } else if (account.accessToken) {
         const jwtInfo = JWTDecoder.parseToken(account.accessToken);
-        if (jwtInfo && jwtInfo.expirationInfo) {
-          const { remainingDays, isExpired } = jwtInfo.expirationInfo;
-          const expDate = new Date(jwtInfo.expirationInfo.expDate);
-          
-          if (isExpired) {
-            expiryDisplay = '已过期';
-            expiryClass = 'expired';
-          } else if (remainingDays <= 7) {
-            expiryDisplay = `${remainingDays}天后过期`;
-            expiryClass = 'warning';
-          } else {
-            const year = expDate.getFullYear();
-            const month = String(expDate.getMonth() + 1).padStart(2, '0');
-            const day = String(expDate.getDate()).padStart(2, '0');
-            expiryDisplay = `${year}-${month}-${day} (${remainingDays}天)`;
-            expiryClass = 'normal';
-          }
+        expirationInfo = jwtInfo ? jwtInfo.expirationInfo : null;
+      }
+
+      if (expirationInfo) {
+        const { remainingDays, isExpired } = expirationInfo;
+        const expDate = new Date(expirationInfo.expDate);
+        
+        if (isExpired) {
+          expiryDisplay = '已过期';
+          expiryClass = 'expired';
+        } else if (remainingDays <= 7) {
+          expiryDisplay = `${remainingDays}天后过期`;
+          expiryClass = 'warning';
+        } else {
+          const year = expDate.getFullYear();
+          const month = String(expDate.getMonth() + 1).padStart(2, '0');
+          const day = String(expDate.getDate()).padStart(2, '0');
+          expiryDisplay = `${year}-${month}-${day} (${remainingDays}天)`;
+          expiryClass = 'normal';
         }
       }
 
@@ -756,17 +766,18 @@ const AccountManager = {
     }
     
     try {
-      const accountList = AppState.getState('accountList');
-      const filteredList = accountList.filter(acc => 
-        !(acc.email === email && acc.userid === userid)
-      );
+      const response = await chrome.runtime.sendMessage({
+        action: 'removeAccount',
+        data: { email, userid }
+      });
       
-      await chrome.storage.local.set({ accountList: filteredList });
+      if (!response?.success) {
+        throw new Error(response?.error || '删除失败');
+      }
       
       // 如果删除的是当前账户，清除当前账户状态
       const currentAccount = AppState.getState('currentAccount');
       if (currentAccount && currentAccount.email === email && currentAccount.userid === userid) {
-        await chrome.storage.local.remove(['currentAccount']);
         AppState.setState('currentAccount', null);
       }
       
@@ -1054,7 +1065,8 @@ const EventManager = {
     }
     
     try {
-      // 清空本地存储
+      // 清空原生账户存储和本地存储
+      await chrome.runtime.sendMessage({ action: 'clearAccountStore' });
       await chrome.storage.local.clear();
       
       // 清空Cookie
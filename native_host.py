@@ -1,4 +1,9 @@
 #!/usr/bin/env python3
+import time
+
+# 模块开始加载的时间，追踪中用来区分进程启动和导入/初始化耗时
+HOST_PROCESS_STARTED_AT = time.time()
+
 import json
 import sys
 import struct
@@ -6,14 +11,22 @@ import sqlite3
 import os
 import platform
 import stat
-import time
 import uuid
 import secrets
 import hashlib
 import base64
+import threading
+import zlib
+import functools
+import re
+from bisect import bisect_left
+from contextlib import contextmanager
 import requests
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, Callable, Tuple
+from typing import Dict, Any, Optional, Callable, Tuple, List, Iterator, TypeVar
+from urllib.parse import urlparse
 from abc import ABC, abstractmethod
 
 try:
@@ -22,22 +35,892 @@ try:
 except ImportError:
     NATIVEMESSAGING_AVAILABLE = False
 
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.exceptions import InvalidTag
+    CRYPTOGRAPHY_AVAILABLE = True
+except ImportError:
+    CRYPTOGRAPHY_AVAILABLE = False
+
+try:
+    import keyring
+    KEYRING_AVAILABLE = True
+except ImportError:
+    KEYRING_AVAILABLE = False
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    import msvcrt
+    fcntl = None
+
 
 class BaseActionHandler(ABC):
     """Action处理器基类"""
-    
+
+    # 流式action通过端口发送中间消息（进度事件等）、读取后续消息；由NativeHostServer在调用前绑定
+    emit: Callable[[Dict[str, Any]], None] = staticmethod(lambda message: None)
+    receive: Callable[[], Optional[Dict[str, Any]]] = staticmethod(lambda: None)
+
+    def bind_port(self, emit: Callable[[Dict[str, Any]], None],
+                  receive: Callable[[], Optional[Dict[str, Any]]]) -> None:
+        """绑定当前连接的发送/接收函数"""
+        self.emit = emit
+        self.receive = receive
+
     @abstractmethod
     def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """处理请求并返回响应"""
         pass
 
 
+class HostLogger:
+    """
+    结构化日志
+
+    - 低于当前级别的调用在第一次比较后直接返回，参数不会被格式化，关闭调试时热路径几乎没有开销；
+    - 记录以 (时间, 级别, 模板, 参数, 字段) 存入内存环形缓冲，读取或写出时才格式化，并自动脱敏token；
+    - CURSOR_DEBUG=1 时由后台线程批量写入日志文件，文件只打开一次、每批只flush一次。
+    """
+
+    DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+    LEVEL_NAMES = {10: "DEBUG", 20: "INFO", 30: "WARNING", 40: "ERROR"}
+    DEFAULT_FILE = "/tmp/cursor_native_host_chrome.log"
+    RING_SIZE = 500
+    BATCH_INTERVAL = 0.5
+    MAX_STRING = 2000
+    SECRET_KEYS = frozenset({
+        "accessToken", "refreshToken", "WorkosCursorSessionToken", "deepToken",
+        "cookie", "Cookie", "verifier"
+    })
+    TOKEN_PATTERNS = (
+        re.compile(r"eyJ[A-Za-z0-9_-]{5,}\.[A-Za-z0-9_-]{5,}\.[A-Za-z0-9_-]*"),
+        re.compile(r"(?<=%3A%3A)[A-Za-z0-9._-]{20,}|(?<=::)[A-Za-z0-9._-]{20,}")
+    )
+
+    _shared: Optional["HostLogger"] = None
+
+    def __init__(self, level: Optional[int] = None, file_path: Optional[str] = None,
+                 write_to_file: Optional[bool] = None, ring_size: int = RING_SIZE):
+        debug = os.getenv("CURSOR_DEBUG") == "1"
+        env_level = self.parse_level(os.getenv("CURSOR_LOG_LEVEL"))
+        self.level = level or env_level or (self.DEBUG if debug else self.INFO)
+        self.file_path = file_path or os.getenv("CURSOR_LOG_FILE") or self.DEFAULT_FILE
+        self.write_to_file = debug if write_to_file is None else write_to_file
+        self._ring: deque = deque(maxlen=ring_size)
+        self._queue: List[Tuple[Any, ...]] = []
+        self._cond = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
+        self._closing = False
+
+    @classmethod
+    def shared(cls) -> "HostLogger":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @classmethod
+    def parse_level(cls, name: Optional[str]) -> Optional[int]:
+        if not name:
+            return None
+        for level, level_name in cls.LEVEL_NAMES.items():
+            if level_name == str(name).upper():
+                return level
+        return None
+
+    def enabled_for(self, level: int) -> bool:
+        return level >= self.level
+
+    def _log(self, level: int, template: str, args: Tuple[Any, ...], fields: Dict[str, Any]) -> None:
+        record = (time.time(), level, template, args, fields)
+        self._ring.append(record)
+        if self.write_to_file:
+            with self._cond:
+                self._queue.append(record)
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="log-writer", daemon=True)
+                    self._writer.start()
+
+    def debug(self, template: str, *args: Any, **fields: Any) -> None:
+        if self.level > self.DEBUG:
+            return
+        self._log(self.DEBUG, template, args, fields)
+
+    def info(self, template: str, *args: Any, **fields: Any) -> None:
+        if self.level > self.INFO:
+            return
+        self._log(self.INFO, template, args, fields)
+
+    def warning(self, template: str, *args: Any, **fields: Any) -> None:
+        if self.level > self.WARNING:
+            return
+        self._log(self.WARNING, template, args, fields)
+
+    def error(self, template: str, *args: Any, **fields: Any) -> None:
+        self._log(self.ERROR, template, args, fields)
+
+    @classmethod
+    def redact(cls, value: Any, depth: int = 0) -> Any:
+        """脱敏：敏感字段只保留长度，字符串中的JWT和会话token替换为占位符，超长字符串截断"""
+        if depth > 6:
+            return "<...>"
+        if isinstance(value, dict):
+            return {
+                key: f"<redacted len={len(item)}>" if key in cls.SECRET_KEYS and isinstance(item, str) and item
+                else cls.redact(item, depth + 1)
+                for key, item in value.items()
+            }
+        if isinstance(value, (list, tuple)):
+            return [cls.redact(item, depth + 1) for item in value]
+        if isinstance(value, str):
+            for pattern in cls.TOKEN_PATTERNS:
+                value = pattern.sub("<redacted>", value)
+            if len(value) > cls.MAX_STRING:
+                value = f"{value[:cls.MAX_STRING]}...<{len(value) - cls.MAX_STRING} more>"
+            return value
+        return value
+
+    def format(self, record: Tuple[Any, ...]) -> Dict[str, Any]:
+        timestamp, level, template, args, fields = record
+        try:
+            message = template % tuple(self.redact(arg) for arg in args) if args else template
+        except (TypeError, ValueError):
+            message = f"{template} {self.redact(list(args))}"
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds"),
+            "level": self.LEVEL_NAMES.get(level, str(level)),
+            "message": self.redact(message)
+        }
+        if fields:
+            entry["fields"] = self.redact(fields)
+        return entry
+
+    def _format_line(self, record: Tuple[Any, ...]) -> str:
+        entry = self.format(record)
+        line = f"[{entry['time']}] {entry['level']} {entry['message']}"
+        if "fields" in entry:
+            line += " " + json.dumps(entry["fields"], ensure_ascii=False, default=str)
+        return line + "\n"
+
+    def _write_loop(self) -> None:
+        """后台批量写入：每BATCH_INTERVAL秒（或关闭时）把积累的记录一次写出"""
+        try:
+            log_file = open(self.file_path, "a", encoding="utf-8")
+        except OSError:
+            self.write_to_file = False
+            return
+        with log_file:
+            while True:
+                with self._cond:
+                    if not self._queue and not self._closing:
+                        self._cond.wait(self.BATCH_INTERVAL)
+                    batch, self._queue = self._queue, []
+                    closing = self._closing
+                if batch:
+                    try:
+                        log_file.write("".join(self._format_line(record) for record in batch))
+                        log_file.flush()
+                    except OSError:
+                        pass  # 日志写入失败不影响主流程
+                if closing and not self._queue:
+                    return
+
+    def close(self, timeout: float = 2.0) -> None:
+        """写出剩余记录并停止后台线程"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            writer = self._writer
+        if writer is not None:
+            writer.join(timeout)
+
+    def recent(self, limit: int = 200, min_level: int = DEBUG) -> List[Dict[str, Any]]:
+        """环形缓冲中最近的记录（已格式化、脱敏）"""
+        records = [record for record in list(self._ring) if record[1] >= min_level]
+        return [self.format(record) for record in records[-limit:]]
+
+    def tail_file(self, max_lines: int = 200, max_bytes: int = 64 * 1024) -> List[str]:
+        """日志文件末尾的若干行（每条消息启动一个进程时，之前进程的日志只在文件里）"""
+        try:
+            with open(self.file_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                f.seek(max(0, size - max_bytes))
+                lines = f.read().decode("utf-8", errors="replace").splitlines()
+        except OSError:
+            return []
+        if size > max_bytes and lines:
+            lines = lines[1:]  # 第一行可能不完整
+        return lines[-max_lines:]
+
+
+class HostTracer:
+    """
+    请求链路追踪
+
+    扩展在消息中附带 trace: {id, sentAt}（sentAt为Date.now()毫秒）时，主机为这条消息建立一棵
+    span树：进程启动到读到首字节、解码、处理器，以及处理器内每次数据库/文件操作和HTTP调用，
+    随响应一起返回。没有trace的消息只多一次属性判断。
+    """
+
+    _shared: Optional["HostTracer"] = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._trace_id: Optional[str] = None
+        self._origin = 0.0
+        self._root: Optional[Dict[str, Any]] = None
+        # 其他线程（如处理器内的线程池）没有自己的span栈时挂到这个span下
+        self._anchor: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def shared(cls) -> "HostTracer":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @property
+    def active(self) -> bool:
+        return self._root is not None
+
+    def _new_span(self, name: str, kind: str, start: float, end: Optional[float] = None,
+                  **attrs: Any) -> Dict[str, Any]:
+        span: Dict[str, Any] = {
+            "name": name,
+            "kind": kind,
+            "startMs": round((start - self._origin) * 1000, 3),
+            "durationMs": None if end is None else round((end - start) * 1000, 3),
+            "children": []
+        }
+        if attrs:
+            span["attrs"] = attrs
+        return span
+
+    def begin(self, trace_id: str, sent_at_ms: Any, timing: Dict[str, float]) -> None:
+        """
+        开始一次追踪
+
+        Args:
+            trace_id: 扩展生成的追踪ID
+            sent_at_ms: 扩展发送消息的时间（毫秒时间戳），缺失时以读到首字节的时间为起点
+            timing: 读取消息的时间点：firstByteAt、decodedAt，
+                    进程处理的第一条消息还有processStartedAt、serverInitAt、serverReadyAt
+        """
+        first_byte = timing["firstByteAt"]
+        sent_at = sent_at_ms / 1000.0 if isinstance(sent_at_ms, (int, float)) and sent_at_ms > 0 else None
+        self._trace_id = trace_id
+        self._origin = sent_at if sent_at is not None else first_byte
+        self._local = threading.local()
+        root = self._new_span("nativeMessage", "message", self._origin)
+
+        if sent_at is not None:
+            wait = self._new_span("spawnToFirstByte", "startup", sent_at, first_byte)
+            if "processStartedAt" in timing:
+                # 同一台机器上Chrome与主机共用时钟；进程启动早于发送时间时按0处理
+                started = max(timing["processStartedAt"], sent_at)
+                phases = (("processSpawn", sent_at, started),
+                          ("imports", started, timing["serverInitAt"]),
+                          ("serverInit", timing["serverInitAt"], timing["serverReadyAt"]),
+                          ("awaitMessage", timing["serverReadyAt"], first_byte))
+                for name, start, end in phases:
+                    wait["children"].append(self._new_span(name, "startup", start, max(start, end)))
+            root["children"].append(wait)
+        root["children"].append(self._new_span("decode", "decode", first_byte, timing["decodedAt"]))
+        with self._lock:
+            self._root = self._anchor = root
+
+    @contextmanager
+    def span(self, name: str, kind: str, **attrs: Any) -> Iterator[Optional[Dict[str, Any]]]:
+        """在当前线程的span下记录一个子span；未在追踪时什么也不做"""
+        root = self._root
+        if root is None:
+            yield None
+            return
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        start = time.time()
+        span = self._new_span(name, kind, start, **attrs)
+        parent = stack[-1] if stack else self._anchor or root
+        with self._lock:
+            parent["children"].append(span)
+            if not stack and parent is root:
+                self._anchor = span
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+            span["durationMs"] = round((time.time() - start) * 1000, 3)
+            with self._lock:
+                if self._anchor is span:
+                    self._anchor = root
+
+    def annotate(self, **attrs: Any) -> None:
+        """给当前线程正在进行的span补充属性（如HTTP状态码）"""
+        stack = getattr(self._local, "stack", None)
+        if self._root is not None and stack:
+            stack[-1].setdefault("attrs", {}).update(attrs)
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """结束追踪，返回 {id, originMs, spans}"""
+        with self._lock:
+            root, self._root, self._anchor = self._root, None, None
+        if root is None:
+            return None
+        root["durationMs"] = round((time.time() - self._origin) * 1000, 3)
+        return {"id": self._trace_id, "originMs": round(self._origin * 1000, 3), "spans": root}
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class HostMetrics:
+    """
+    原生主机运行指标
+
+    按action统计调用次数、错误次数和延迟直方图（固定分桶），并按类别（db / file / http）
+    累计子阶段耗时。记录只是几次加法；每条消息处理完后把增量追加到滚动的指标文件，
+    每条消息启动一个进程时也能跨进程汇总。
+    """
+
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+    METRICS_FILE = "metrics.jsonl"
+    MAX_FILE_BYTES = 1024 * 1024
+    ROTATE_KEEP = 3
+
+    _shared: Optional["HostMetrics"] = None
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # 主机串行处理消息，子阶段（包括处理器内线程池中的）都记到当前action下
+        self.current_action: Optional[str] = None
+        self._totals: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self.started_at = time.time()
+
+    @classmethod
+    def shared(cls) -> "HostMetrics":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @classmethod
+    def timed(cls, kind: str) -> Callable[[F], F]:
+        """装饰器：把函数耗时记为kind类子阶段"""
+        def decorator(fn: F) -> F:
+            @functools.wraps(fn)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with cls.shared().span(kind, fn.__qualname__):
+                    return fn(*args, **kwargs)
+            return wrapper  # type: ignore[return-value]
+        return decorator
+
+    @property
+    def path(self) -> str:
+        if self._path is None:
+            self._path = HostPaths.file(self.METRICS_FILE)
+        return self._path
+
+    @classmethod
+    def _new_entry(cls) -> Dict[str, Any]:
+        return {"count": 0, "errors": 0, "totalMs": 0.0, "maxMs": 0.0,
+                "buckets": [0] * (len(cls.BUCKETS_MS) + 1), "spans": {}}
+
+    def record_action(self, action: str, elapsed_ms: float, error: bool) -> None:
+        bucket = bisect_left(self.BUCKETS_MS, elapsed_ms)
+        with self._lock:
+            for table in (self._totals, self._pending):
+                entry = table.get(action)
+                if entry is None:
+                    entry = table[action] = self._new_entry()
+                entry["count"] += 1
+                entry["errors"] += 1 if error else 0
+                entry["totalMs"] += elapsed_ms
+                entry["maxMs"] = max(entry["maxMs"], elapsed_ms)
+                entry["buckets"][bucket] += 1
+
+    def record_span(self, kind: str, elapsed_ms: float) -> None:
+        action = self.current_action or "_idle"
+        with self._lock:
+            for table in (self._totals, self._pending):
+                entry = table.get(action)
+                if entry is None:
+                    entry = table[action] = self._new_entry()
+                span = entry["spans"].get(kind)
+                if span is None:
+                    span = entry["spans"][kind] = {"count": 0, "totalMs": 0.0}
+                span["count"] += 1
+                span["totalMs"] += elapsed_ms
+
+    @contextmanager
+    def span(self, kind: str, name: Optional[str] = None) -> Iterator[None]:
+        """计时一个子阶段；同类子阶段嵌套时只记录最外层。正在追踪时同时记一个追踪span"""
+        depth = getattr(self._local, kind, 0)
+        setattr(self._local, kind, depth + 1)
+        started = time.perf_counter()
+        try:
+            with HostTracer.shared().span(name or kind, kind):
+                yield
+        finally:
+            setattr(self._local, kind, depth)
+            if depth == 0:
+                self.record_span(kind, (time.perf_counter() - started) * 1000)
+
+    @classmethod
+    def _merge(cls, target: Dict[str, Dict[str, Any]], source: Dict[str, Dict[str, Any]]) -> None:
+        for action, delta in source.items():
+            entry = target.get(action)
+            if entry is None:
+                entry = target[action] = cls._new_entry()
+            entry["count"] += delta.get("count", 0)
+            entry["errors"] += delta.get("errors", 0)
+            entry["totalMs"] += delta.get("totalMs", 0.0)
+            entry["maxMs"] = max(entry["maxMs"], delta.get("maxMs", 0.0))
+            for i, value in enumerate(delta.get("buckets", [])[:len(entry["buckets"])]):
+                entry["buckets"][i] += value
+            for kind, span in delta.get("spans", {}).items():
+                merged = entry["spans"].setdefault(kind, {"count": 0, "totalMs": 0.0})
+                merged["count"] += span.get("count", 0)
+                merged["totalMs"] += span.get("totalMs", 0.0)
+
+    def flush(self) -> bool:
+        """把未写入的增量追加到指标文件（超过MAX_FILE_BYTES时滚动），没有增量时不写"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return False
+        line = json.dumps({"ts": round(time.time(), 3), "pid": os.getpid(), "actions": pending},
+                          separators=(",", ":")) + "\n"
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.MAX_FILE_BYTES:
+                for index in range(self.ROTATE_KEEP - 1, 0, -1):
+                    older = f"{self.path}.{index}"
+                    if os.path.exists(older):
+                        os.replace(older, f"{self.path}.{index + 1}")
+                os.replace(self.path, f"{self.path}.1")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            HostLogger.shared().warning("写入指标文件失败: %s", e)
+            return False  # 指标写入失败不影响主流程
+        return True
+
+    def _read_files(self) -> Tuple[Dict[str, Dict[str, Any]], int]:
+        merged: Dict[str, Dict[str, Any]] = {}
+        launches = 0
+        paths = [f"{self.path}.{index}" for index in range(self.ROTATE_KEEP, 0, -1)] + [self.path]
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            self._merge(merged, json.loads(line)["actions"])
+                            launches += 1
+                        except (ValueError, KeyError, TypeError):
+                            continue
+            except OSError:
+                continue
+        return merged, launches
+
+    def _percentile(self, entry: Dict[str, Any], q: float) -> Optional[float]:
+        """按分桶估算分位数，返回该分位所在桶的上界（毫秒）"""
+        if not entry["count"]:
+            return None
+        target = q * entry["count"]
+        cumulative = 0
+        for index, value in enumerate(entry["buckets"]):
+            cumulative += value
+            if cumulative >= target:
+                if index < len(self.BUCKETS_MS):
+                    return round(min(float(self.BUCKETS_MS[index]), entry["maxMs"]), 3)
+                return round(entry["maxMs"], 3)
+        return round(entry["maxMs"], 3)
+
+    def _summarize(self, table: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        summary = {}
+        for action, entry in sorted(table.items()):
+            summary[action] = {
+                "count": entry["count"],
+                "errors": entry["errors"],
+                "meanMs": round(entry["totalMs"] / entry["count"], 3) if entry["count"] else None,
+                "maxMs": round(entry["maxMs"], 3),
+                "p50Ms": self._percentile(entry, 0.5),
+                "p90Ms": self._percentile(entry, 0.9),
+                "p99Ms": self._percentile(entry, 0.99),
+                "histogram": list(entry["buckets"]),
+                "spans": {kind: {"count": span["count"], "totalMs": round(span["totalMs"], 3)}
+                          for kind, span in entry["spans"].items()}
+            }
+        return summary
+
+    def snapshot(self, include_files: bool = True) -> Dict[str, Any]:
+        """当前进程的指标；include_files为True时再汇总指标文件中各次启动的记录"""
+        with self._lock:
+            totals = json.loads(json.dumps(self._totals))
+            pending = json.loads(json.dumps(self._pending))
+        result: Dict[str, Any] = {
+            "bucketsMs": list(self.BUCKETS_MS) + ["+Inf"],
+            "process": {"pid": os.getpid(), "startedAt": datetime.fromtimestamp(self.started_at).isoformat(),
+                        "actions": self._summarize(totals)}
+        }
+        if include_files:
+            merged, launches = self._read_files()
+            # 文件里已经包含本进程写入过的部分，只需再加上尚未写入的增量
+            self._merge(merged, pending)
+            result["aggregate"] = {"flushes": launches, "actions": self._summarize(merged)}
+        return result
+
+
+class RequestProfiler:
+    """
+    按action开启的cProfile采样
+
+    CURSOR_PROFILE=getClientCurrentData,getDeepToken（或 * 表示全部）选中的action在处理时
+    用cProfile包裹，结果写成 .pstats 文件放到数据目录的 profiles/ 下，只保留最新的
+    CURSOR_PROFILE_KEEP 个（默认20）。未选中的action只多一次集合判断，cProfile也不会被导入。
+    注意cProfile只记录处理器所在线程，线程池中的工作会显示为等待。
+    """
+
+    ENV = "CURSOR_PROFILE"
+    KEEP_ENV = "CURSOR_PROFILE_KEEP"
+    DEFAULT_KEEP = 20
+    DIR_NAME = "profiles"
+    SUFFIX = ".pstats"
+    # 时间戳_进程号_action.pstats，见_save
+    NAME_PATTERN = re.compile(r"^(\d{8}-\d{6}-\d{6})_(\d+)_(.+)\.pstats$")
+
+    _shared: Optional["RequestProfiler"] = None
+
+    def __init__(self, actions: Optional[str] = None, keep: Optional[int] = None,
+                 directory: Optional[str] = None):
+        raw = os.getenv(self.ENV, "") if actions is None else actions
+        self.actions = frozenset(name.strip() for name in raw.split(",") if name.strip())
+        self.profile_all = "*" in self.actions
+        if keep is None:
+            try:
+                keep = int(os.getenv(self.KEEP_ENV, self.DEFAULT_KEEP))
+            except ValueError:
+                keep = self.DEFAULT_KEEP
+        self.keep = max(1, keep)
+        self._directory = directory
+
+    @classmethod
+    def shared(cls) -> "RequestProfiler":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            self._directory = HostPaths.file(self.DIR_NAME)
+        os.makedirs(self._directory, exist_ok=True)
+        return self._directory
+
+    def selects(self, action: str) -> bool:
+        return bool(self.actions) and (self.profile_all or action in self.actions)
+
+    def run(self, action: str, fn: Callable[..., Dict[str, Any]], *args: Any) -> Dict[str, Any]:
+        """在cProfile下执行fn，无论成功与否都保存一份剖析结果"""
+        import cProfile
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return fn(*args)
+        finally:
+            profile.disable()
+            self._save(action, profile)
+
+    def _save(self, action: str, profile: Any) -> Optional[str]:
+        name = f"{datetime.now():%Y%m%d-%H%M%S-%f}_{os.getpid()}_{action}{self.SUFFIX}"
+        try:
+            path = os.path.join(self.directory, name)
+            temp_path = f"{path}.tmp"
+            profile.dump_stats(temp_path)
+            os.replace(temp_path, path)
+            self._rotate()
+        except OSError as e:
+            HostLogger.shared().warning("保存性能剖析失败: %s", e)
+            return None  # 剖析失败不影响本次请求
+        HostLogger.shared().info("已保存性能剖析: %s", path)
+        return path
+
+    def _parse_name(self, name: str) -> Optional[Tuple[datetime, int, str]]:
+        """解析剖析文件名为 (创建时间, 进程号, action)，不是_save生成的文件名时返回None"""
+        match = self.NAME_PATTERN.match(name)
+        if match is None:
+            return None
+        try:
+            created = datetime.strptime(match.group(1), "%Y%m%d-%H%M%S-%f")
+        except ValueError:
+            return None
+        return created, int(match.group(2)), match.group(3)
+
+    def _files(self) -> List[str]:
+        """
+        按时间从新到旧排列的剖析文件名（文件名以时间戳开头）
+
+        只包含_save生成的文件名，目录中其他文件（手动改名、拷入的）既不列出也不会被轮转删除。
+        """
+        try:
+            names = [name for name in os.listdir(self.directory) if self._parse_name(name) is not None]
+        except OSError:
+            return []
+        return sorted(names, reverse=True)
+
+    def _rotate(self) -> None:
+        for name in self._files()[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+
+    @staticmethod
+    def _top_functions(path: str, limit: int) -> List[Dict[str, Any]]:
+        """按累计耗时排序的前limit个函数"""
+        import pstats
+
+        rows = []
+        for (filename, line, func), (_, calls, total, cumulative, _) in pstats.Stats(path).stats.items():
+            rows.append({
+                "function": f"{os.path.basename(filename)}:{line}({func})",
+                "calls": calls,
+                "totalMs": round(total * 1000, 3),
+                "cumulativeMs": round(cumulative * 1000, 3)
+            })
+        rows.sort(key=lambda row: row["cumulativeMs"], reverse=True)
+        return rows[:limit]
+
+    def list(self, action: Optional[str] = None, limit: int = 50, top: int = 0) -> List[Dict[str, Any]]:
+        """列出剖析文件；top大于0时附带每个文件累计耗时最高的函数"""
+        entries = []
+        for name in self._files():
+            created, pid, rest = self._parse_name(name)
+            if action and rest != action:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            entry: Dict[str, Any] = {
+                "file": name,
+                "path": path,
+                "action": rest,
+                "pid": pid,
+                "createdAt": created.isoformat(),
+                "sizeBytes": size
+            }
+            if top > 0:
+                try:
+                    entry["top"] = self._top_functions(path, top)
+                except (OSError, ValueError, EOFError) as e:
+                    entry["topError"] = str(e)
+            entries.append(entry)
+            if len(entries) >= limit:
+                break
+        return entries
+
+
+class MemoryInspector:
+    """
+    基于tracemalloc的内存分析
+
+    常驻主机会缓存会话、账户索引等状态，内存可能缓慢增长。运行时可开关tracemalloc，
+    拍摄快照查看分配最多的代码位置，并与之前的快照对比找出增长点；同时报告RSS和GC统计。
+    CURSOR_TRACEMALLOC=N 时启动即开始跟踪（N为保存的调用栈帧数，1也可以）。
+
+    跟踪状态和快照只存在于当前进程：sendNativeMessage每条消息启动一个新进程，快照无法在消息间对比。
+    需要通过同一个connectNative端口发送 memorySnapshot / memoryDiff（见 debug_native_host.html 的内存分析）。
+    """
+
+    ENV = "CURSOR_TRACEMALLOC"
+    MAX_SNAPSHOTS = 5
+    KEY_TYPES = ("lineno", "filename", "traceback")
+
+    _shared: Optional["MemoryInspector"] = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 快照只保留最近几个，避免分析工具本身成为泄漏源
+        self._snapshots: "OrderedDict[int, Tuple[str, Any]]" = OrderedDict()
+        self._next_id = 1
+        frames = os.getenv(self.ENV)
+        if frames and frames != "0":
+            self.start(int(frames) if frames.isdigit() else 1)
+
+    @classmethod
+    def shared(cls) -> "MemoryInspector":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @staticmethod
+    def tracing() -> bool:
+        import tracemalloc
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1) -> None:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, min(frames, 50)))
+
+    def stop(self) -> None:
+        """停止跟踪；tracemalloc停止后旧快照无法再对比，一并丢弃"""
+        import tracemalloc
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+
+    @staticmethod
+    def process_memory() -> Dict[str, Optional[int]]:
+        """进程常驻内存（字节）；Linux读/proc，其他平台只能得到峰值"""
+        result: Dict[str, Optional[int]] = {"rssBytes": None, "peakRssBytes": None}
+        try:
+            with open("/proc/self/status", "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        result["rssBytes"] = int(line.split()[1]) * 1024
+                    elif line.startswith("VmHWM:"):
+                        result["peakRssBytes"] = int(line.split()[1]) * 1024
+            return result
+        except (OSError, ValueError, IndexError):
+            pass
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # macOS以字节为单位，Linux等以KB为单位
+            result["peakRssBytes"] = peak if platform.system() == "Darwin" else peak * 1024
+        except (ImportError, OSError):
+            pass  # Windows没有resource模块
+        return result
+
+    @staticmethod
+    def gc_stats() -> Dict[str, Any]:
+        import gc
+        return {
+            "enabled": gc.isenabled(),
+            "counts": list(gc.get_count()),
+            "thresholds": list(gc.get_threshold()),
+            "generations": gc.get_stats(),
+            "garbage": len(gc.garbage),
+            "trackedObjects": len(gc.get_objects())
+        }
+
+    def status(self) -> Dict[str, Any]:
+        import tracemalloc
+        result: Dict[str, Any] = {
+            "tracing": tracemalloc.is_tracing(),
+            "process": self.process_memory(),
+            "gc": self.gc_stats()
+        }
+        if result["tracing"]:
+            current, peak = tracemalloc.get_traced_memory()
+            result["traced"] = {
+                "currentBytes": current,
+                "peakBytes": peak,
+                "frames": tracemalloc.get_traceback_limit(),
+                "overheadBytes": tracemalloc.get_tracemalloc_memory()
+            }
+        with self._lock:
+            result["snapshots"] = [{"id": snapshot_id, "label": label}
+                                   for snapshot_id, (label, _) in self._snapshots.items()]
+        return result
+
+    @staticmethod
+    def _take() -> Any:
+        import tracemalloc
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>")
+        ))
+
+    @staticmethod
+    def _location(stat: Any, key_type: str) -> Dict[str, Any]:
+        frame = stat.traceback[0]
+        entry: Dict[str, Any] = {"location": f"{frame.filename}:{frame.lineno}" if key_type != "filename"
+                                 else frame.filename}
+        if key_type == "traceback":
+            entry["traceback"] = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+        return entry
+
+    def snapshot(self, label: str = "", limit: int = 20, key_type: str = "lineno") -> Dict[str, Any]:
+        """拍摄并保存快照，返回快照ID和分配最多的位置"""
+        snapshot = self._take()
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = (label, snapshot)
+            while len(self._snapshots) > self.MAX_SNAPSHOTS:
+                self._snapshots.popitem(last=False)
+        stats = snapshot.statistics(key_type)
+        return {
+            "snapshotId": snapshot_id,
+            "totalBytes": sum(stat.size for stat in stats),
+            "top": [{**self._location(stat, key_type), "sizeBytes": stat.size, "count": stat.count}
+                    for stat in stats[:limit]]
+        }
+
+    def diff(self, baseline_id: Optional[int] = None, limit: int = 20, key_type: str = "lineno",
+             label: str = "") -> Dict[str, Any]:
+        """
+        与之前的快照对比
+
+        Args:
+            baseline_id: 对比的快照ID，默认最近一个
+            limit: 返回增长最多的位置个数
+            key_type: 分组方式 lineno / filename / traceback
+            label: 新快照的标签（新快照同样被保存，可作为下次对比的基准）
+
+        Raises:
+            KeyError: 快照不存在（从未拍摄或已被淘汰）
+        """
+        with self._lock:
+            if baseline_id is None:
+                if not self._snapshots:
+                    raise KeyError("没有可对比的快照")
+                baseline_id = next(reversed(self._snapshots))
+            if baseline_id not in self._snapshots:
+                raise KeyError(f"快照 {baseline_id} 不存在或已被淘汰")
+            baseline_label, baseline = self._snapshots[baseline_id]
+        current = self.snapshot(label, limit=0, key_type=key_type)
+        with self._lock:
+            _, latest = self._snapshots[current["snapshotId"]]
+        stats = latest.compare_to(baseline, key_type)
+        return {
+            "baselineId": baseline_id,
+            "baselineLabel": baseline_label,
+            "snapshotId": current["snapshotId"],
+            "totalBytes": current["totalBytes"],
+            "growthBytes": sum(stat.size_diff for stat in stats),
+            "top": [{**self._location(stat, key_type), "sizeBytes": stat.size, "sizeDiffBytes": stat.size_diff,
+                     "count": stat.count, "countDiff": stat.count_diff}
+                    for stat in stats[:limit]]
+        }
+
+
 class CursorDataManager:
     """Cursor数据管理器"""
 
+    # 指向另一个Cursor数据目录（其下为 User/globalStorage/state.vscdb 和 sentry/scope_v3.json），
+    # 用于对 gen_cursor_profile.py 生成的合成数据做测试和压测
+    DATA_DIR_ENV = "CURSOR_APP_DATA_DIR"
+
     @staticmethod
     def get_cursor_db_path() -> str:
         """根据操作系统获取Cursor数据库路径"""
+        override = os.getenv(CursorDataManager.DATA_DIR_ENV)
+        if override:
+            return os.path.join(override, "User", "globalStorage", "state.vscdb")
+
         system = platform.system()
 
         if system == "Windows":
@@ -128,6 +1011,10 @@ class CursorDataManager:
     @staticmethod
     def get_scope_json_path() -> str:
         """根据操作系统获取scope_v3.json路径"""
+        override = os.getenv(CursorDataManager.DATA_DIR_ENV)
+        if override:
+            return os.path.join(override, "sentry", "scope_v3.json")
+
         system = platform.system()
         
         if system == "Windows":
@@ -143,6 +1030,7 @@ class CursorDataManager:
             raise NotImplementedError(f"不支持的操作系统: {system}")
 
     @classmethod
+    @HostMetrics.timed("db")
     def read_access_token(cls) -> Dict[str, Any]:
         """从Cursor数据库读取accessToken"""
         try:
@@ -264,6 +1152,7 @@ class CursorDataManager:
             }
 
     @classmethod
+    @HostMetrics.timed("file")
     def read_scope_json(cls) -> Dict[str, Any]:
         """读取scope_v3.json文件"""
         try:
@@ -428,51 +1317,926 @@ class CursorDataManager:
             }
 
 
-class DeepTokenManager:
-    """深度Token管理器"""
-    
-    @staticmethod
-    def _generate_pkce_pair() -> Tuple[str, str]:
-        """生成PKCE验证对"""
-        code_verifier = secrets.token_urlsafe(43)
-        code_challenge_digest = hashlib.sha256(code_verifier.encode('utf-8')).digest()
-        code_challenge = base64.urlsafe_b64encode(code_challenge_digest).decode('utf-8').rstrip('=')    
-        return code_verifier, code_challenge
-    
+class CursorEndpoints:
+    """Cursor服务端点配置
+
+    默认指向线上服务，可通过环境变量覆盖基础URL，
+    以便指向本地替身服务器（见 fake_cursor_server.py）进行离线测试和压测。
+    """
+
+    WEB_BASE_URL_ENV = "CURSOR_WEB_BASE_URL"
+    API_BASE_URL_ENV = "CURSOR_API_BASE_URL"
+    DEFAULT_WEB_BASE_URL = "https://www.cursor.com"
+    DEFAULT_API_BASE_URL = "https://api2.cursor.sh"
+
     @classmethod
-    def get_deep_token_headless(cls, access_token: str, userid: str, max_attempts: int = 5) -> Dict[str, Any]:
-        """
-        无头模式获取深度token
+    def web_base_url(cls) -> str:
+        """获取网站基础URL（cursor.com）"""
+        return (os.getenv(cls.WEB_BASE_URL_ENV) or cls.DEFAULT_WEB_BASE_URL).rstrip("/")
+
+    @classmethod
+    def api_base_url(cls) -> str:
+        """获取API基础URL（api2.cursor.sh）"""
+        return (os.getenv(cls.API_BASE_URL_ENV) or cls.DEFAULT_API_BASE_URL).rstrip("/")
+
+    @classmethod
+    def deep_login_url(cls) -> str:
+        """深度登录页面URL（不含查询参数）"""
+        return f"{cls.web_base_url()}/cn/loginDeepControl"
+
+    @classmethod
+    def poll_url(cls, uuid_str: str, verifier: str) -> str:
+        """认证轮询URL"""
+        return f"{cls.api_base_url()}/auth/poll?uuid={uuid_str}&verifier={verifier}"
+
+    @classmethod
+    def usage_url(cls, userid: str) -> str:
+        """账户用量查询URL"""
+        return f"{cls.web_base_url()}/api/usage?user={userid}"
+
+    @classmethod
+    def membership_url(cls) -> str:
+        """账户会员信息查询URL"""
+        return f"{cls.web_base_url()}/api/auth/stripe"
+
+
+class HostPaths:
+    """原生主机自身的数据目录（状态文件、数据库等）"""
+
+    DATA_DIR_ENV = "CURSOR_HOST_DATA_DIR"
+
+    @classmethod
+    def data_dir(cls) -> str:
+        """获取数据目录，可通过 CURSOR_HOST_DATA_DIR 覆盖，默认 ~/.cursor_client2login"""
+        path = os.getenv(cls.DATA_DIR_ENV) or os.path.join(os.path.expanduser("~"), ".cursor_client2login")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @classmethod
+    def file(cls, name: str) -> str:
+        """获取数据目录下的文件路径"""
+        return os.path.join(cls.data_dir(), name)
+
+
+class OutboundCallError(Exception):
+    """外部调用被保护器拒绝（熔断或重试预算耗尽）"""
+
+    def __init__(self, code: str, host: str, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.code = code
+        self.host = host
+        self.retry_after = retry_after
+
+    def to_response(self) -> Dict[str, Any]:
+        """转换为统一的错误响应"""
+        return {
+            "success": False,
+            "error": str(self),
+            "errorCode": self.code,
+            "host": self.host,
+            "retryAfter": round(self.retry_after, 1),
+            "suggestions": [
+                "Cursor服务暂时不可用或响应过慢，请稍后重试",
+                "检查网络连接是否正常",
+                "尝试使用浏览器模式获取深度token"
+            ]
+        }
 
-        ========================================
-        此方法暂时被禁用
-        ========================================
-        原因：无头模式实现存在问题，需要完善后再启用
-        恢复方法：修复下面的实现逻辑，并取消相关调用处的注释
-        相关文件：
-        - popup.html 中的无头模式选项
-        - popup.js 中的 handleAutoRead 方法
-        - background.js 中的 getDeepToken 方法
-        ========================================
 
+class CircuitBreaker:
+    """单个主机的熔断器（closed → open → half_open → closed）"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        """
         Args:
-            access_token: 客户端访问token
-            userid: 用户ID
-            max_attempts: 最大尝试次数
+            failure_threshold: 连续失败多少次后熔断
+            recovery_timeout: 熔断后多少秒进入半开状态放行探测请求
+            half_open_max_calls: 半开状态下同时放行的探测请求数
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_in_flight = 0
 
-        Returns:
-            Dict[str, Any]: 包含深度token信息或错误信息的字典
+    def _refresh(self, now: float) -> None:
+        if self.state == self.OPEN and now - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+            self.half_open_in_flight = 0
+
+    def allow_request(self, now: float) -> bool:
+        """是否放行请求，半开状态下会占用一个探测名额"""
+        self._refresh(now)
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and self.half_open_in_flight < self.half_open_max_calls:
+            self.half_open_in_flight += 1
+            return True
+        return False
+
+    def retry_after(self, now: float) -> float:
+        """距离下一次允许探测还有多少秒"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (now - self.opened_at))
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.half_open_in_flight = 0
+
+    def record_failure(self, now: float) -> None:
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = now
+            self.half_open_in_flight = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_at": self.opened_at
+        }
+
+    def load(self, data: Dict[str, Any]) -> None:
+        self.state = data.get("state", self.CLOSED)
+        self.consecutive_failures = int(data.get("consecutive_failures", 0))
+        self.opened_at = float(data.get("opened_at", 0.0))
+        if self.state == self.HALF_OPEN:
+            # 其他进程的探测结果未知，重新从open开始计时
+            self.state = self.OPEN
+
+
+class RetryBudget:
+    """全局重试预算：滑动窗口内重试次数不超过请求数的一定比例"""
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 3, window: float = 60.0):
+        """
+        Args:
+            ratio: 允许的重试/请求比例
+            min_retries: 窗口内始终允许的最少重试次数（低流量时避免完全不能重试）
+            window: 统计窗口(秒)
         """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self.requests: List[float] = []
+        self.retries: List[float] = []
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - self.window
+        self.requests = [t for t in self.requests if t > cutoff]
+        self.retries = [t for t in self.retries if t > cutoff]
+
+    def record_request(self, now: float) -> None:
+        self._trim(now)
+        self.requests.append(now)
+
+    def try_acquire_retry(self, now: float) -> bool:
+        """尝试占用一次重试额度"""
+        self._trim(now)
+        if len(self.retries) >= self.min_retries + self.ratio * len(self.requests):
+            return False
+        self.retries.append(now)
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "retries": self.retries}
+
+    def load(self, data: Dict[str, Any]) -> None:
+        self.requests = [float(t) for t in data.get("requests", [])]
+        self.retries = [float(t) for t in data.get("retries", [])]
+
+
+class OutboundCallGuard:
+    """
+    外部HTTP调用保护器
+
+    为每个主机维护熔断器，并共享一个全局重试预算。
+    由于主机默认每条消息启动一个进程，状态会持久化到数据目录，供后续进程共享。
+    """
+
+    STATE_FILE = "outbound_guard.json"
+    FAILURE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    _shared: Optional["OutboundCallGuard"] = None
+
+    def __init__(self, state_path: Optional[str] = None, failure_threshold: int = 5,
+                 recovery_timeout: float = 30.0, retry_ratio: float = 0.2):
+        self.state_path = state_path
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.budget = RetryBudget(ratio=retry_ratio)
+        self.counters: Dict[str, int] = {"calls": 0, "failures": 0, "rejected_open": 0, "rejected_budget": 0}
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def shared(cls) -> "OutboundCallGuard":
+        """获取进程内共享的保护器实例"""
+        if cls._shared is None:
+            try:
+                state_path = HostPaths.file(cls.STATE_FILE)
+            except OSError:
+                state_path = None
+            cls._shared = cls(state_path=state_path)
+        return cls._shared
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.recovery_timeout)
+            self.breakers[host] = breaker
+        return breaker
+
+    def _load(self) -> None:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
         try:
-            session_cookie = f"{userid}%3A%3A{access_token}"
-            
-            for attempt in range(max_attempts):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for host, breaker_data in data.get("breakers", {}).items():
+                self._breaker(host).load(breaker_data)
+            self.budget.load(data.get("budget", {}))
+        except (OSError, ValueError):
+            pass  # 状态文件损坏时从干净状态开始
+
+    def _save(self) -> None:
+        if not self.state_path:
+            return
+        data = {
+            "breakers": {host: b.to_dict() for host, b in self.breakers.items()},
+            "budget": self.budget.to_dict()
+        }
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError:
+            pass  # 持久化失败不影响本次调用
+
+    @HostMetrics.timed("http")
+    def request(self, method: str, url: str, is_retry: bool = False, **kwargs) -> requests.Response:
+        """
+        经过保护的HTTP请求
+
+        Args:
+            method: HTTP方法
+            url: 请求URL
+            is_retry: 是否为重试请求（消耗重试预算）
+            **kwargs: 透传给requests.request的参数
+
+        Raises:
+            OutboundCallError: 熔断打开或重试预算耗尽时快速失败
+            requests.RequestException: 请求本身失败
+        """
+        host = urlparse(url).netloc
+        now = time.time()
+        with self._lock:
+            breaker = self._breaker(host)
+            if not breaker.allow_request(now):
+                self.counters["rejected_open"] += 1
+                raise OutboundCallError(
+                    "CIRCUIT_OPEN", host,
+                    f"{host} 熔断中，暂停调用",
+                    breaker.retry_after(now)
+                )
+            if is_retry and not self.budget.try_acquire_retry(now):
+                self.counters["rejected_budget"] += 1
+                if breaker.state == CircuitBreaker.HALF_OPEN:
+                    breaker.half_open_in_flight = max(0, breaker.half_open_in_flight - 1)
+                raise OutboundCallError(
+                    "RETRY_BUDGET_EXHAUSTED", host,
+                    "外部调用重试预算已耗尽，放弃重试"
+                )
+            self.budget.record_request(now)
+            self.counters["calls"] += 1
+
+        # 追踪里只记录地址不带查询串（查询参数可能包含用户ID）
+        tracer = HostTracer.shared()
+        tracer.annotate(method=method, url=f"{host}{urlparse(url).path}", retry=is_retry)
+        try:
+            response = requests.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            tracer.annotate(error=type(e).__name__)
+            self._record(host, success=False)
+            raise
+        tracer.annotate(status=response.status_code)
+        self._record(host, success=response.status_code not in self.FAILURE_STATUS_CODES)
+        return response
+
+    def get(self, url: str, is_retry: bool = False, **kwargs) -> requests.Response:
+        return self.request("GET", url, is_retry=is_retry, **kwargs)
+
+    def _record(self, host: str, success: bool) -> None:
+        with self._lock:
+            breaker = self._breaker(host)
+            if success:
+                breaker.record_success()
+            else:
+                self.counters["failures"] += 1
+                breaker.record_failure(time.time())
+            self._save()
+
+    def stats(self) -> Dict[str, Any]:
+        """保护器状态，用于诊断和指标"""
+        now = time.time()
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "breakers": {
+                    host: {**b.to_dict(), "retry_after": round(b.retry_after(now), 1)}
+                    for host, b in self.breakers.items()
+                }
+            }
+
+
+class DeepTokenPollClient:
+    """
+    auth/poll 轮询客户端
+
+    轮询请求是按 uuid/verifier 幂等的只读请求，可选开启对冲：
+    请求在同一主机近期 p90 延迟内未返回时补发一个相同请求，先返回者胜出。
+    对冲请求数量受 max_hedge_ratio 限制（按该主机最近 window 次轮询计算），统计信息通过 stats() 暴露。
+    与 OutboundCallGuard 一样，延迟样本和对冲记录按主机持久化到数据目录，每条消息一个进程时也能积累到足够样本。
+    请求在守护线程中执行，落败的请求不会拖住已经响应完毕的主机进程退出。
+    """
+
+    HEDGE_ENV = "CURSOR_HEDGE_POLLS"
+    STATE_FILE = "poll_client.json"
+    MIN_SAMPLES = 20
+
+    _shared: Optional["DeepTokenPollClient"] = None
+
+    def __init__(self, guard: Optional[OutboundCallGuard] = None, hedge: Optional[bool] = None,
+                 hedge_quantile: float = 0.9, max_hedge_ratio: float = 0.1,
+                 default_hedge_delay: float = 1.0, min_hedge_delay: float = 0.02,
+                 window: int = 200, state_path: Optional[str] = None):
+        """
+        Args:
+            guard: 外部调用保护器
+            hedge: 是否开启对冲，默认读取环境变量 CURSOR_HEDGE_POLLS
+            hedge_quantile: 触发对冲的延迟分位数
+            max_hedge_ratio: 对冲请求数占轮询次数的上限比例
+            default_hedge_delay: 样本不足时使用的对冲等待秒数
+            min_hedge_delay: 对冲等待秒数下限
+            window: 每个主机参与分位数和对冲比例计算的最近样本数
+            state_path: 延迟样本与计数的持久化文件，None表示只保存在进程内
+        """
+        self.guard = guard or OutboundCallGuard.shared()
+        self.hedge = hedge if hedge is not None else os.getenv(self.HEDGE_ENV) == "1"
+        self.hedge_quantile = hedge_quantile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.window = window
+        # 按主机保存最近的延迟样本（秒）和最近每次轮询是否对冲（1/0）
+        self.latencies: Dict[str, deque] = {}
+        self.hedged: Dict[str, deque] = {}
+        self.counters: Dict[str, int] = {"polls": 0, "hedges": 0, "hedge_wins": 0, "hedges_denied": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self.state_path = state_path
+        self._load()
+
+    @classmethod
+    def shared(cls) -> "DeepTokenPollClient":
+        """获取进程内共享的轮询客户端"""
+        if cls._shared is None:
+            try:
+                state_path = HostPaths.file(cls.STATE_FILE)
+            except OSError:
+                state_path = None
+            cls._shared = cls(state_path=state_path)
+        return cls._shared
+
+    def _load(self) -> None:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for host, host_data in data.get("hosts", {}).items():
+                self._samples(host).extend(float(value) for value in host_data.get("latencies", []))
+                self._hedge_window(host).extend(1 if value else 0 for value in host_data.get("hedged", []))
+            for key, value in data.get("counters", {}).items():
+                if key in self.counters:
+                    self.counters[key] = int(value)
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass  # 状态文件损坏时从干净状态开始
+
+    def _save(self) -> None:
+        if not self.state_path:
+            return
+        with self._lock:
+            data = {
+                "hosts": {
+                    host: {"latencies": [round(value, 4) for value in self._samples(host)],
+                           "hedged": list(self._hedge_window(host))}
+                    for host in set(self.latencies) | set(self.hedged)
+                },
+                "counters": dict(self.counters)
+            }
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError:
+            pass  # 持久化失败不影响本次轮询
+
+    def _samples(self, host: str) -> deque:
+        samples = self.latencies.get(host)
+        if samples is None:
+            samples = self.latencies[host] = deque(maxlen=self.window)
+        return samples
+
+    def _hedge_window(self, host: str) -> deque:
+        window = self.hedged.get(host)
+        if window is None:
+            window = self.hedged[host] = deque(maxlen=self.window)
+        return window
+
+    def _quantile(self, host: str, q: float) -> Optional[float]:
+        samples = self.latencies.get(host)
+        if samples is None or len(samples) < self.MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self, host: str) -> float:
+        """该主机当前的对冲等待时间（近期p90延迟）"""
+        with self._lock:
+            observed = self._quantile(host, self.hedge_quantile)
+        if observed is None:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, observed)
+
+    def _record_poll(self, host: str, hedged: bool) -> None:
+        with self._lock:
+            self._hedge_window(host).append(1 if hedged else 0)
+
+    def _try_acquire_hedge(self, host: str) -> bool:
+        """按该主机最近window次轮询（含本次）计算对冲比例，未超上限时记为对冲"""
+        with self._lock:
+            window = self._hedge_window(host)
+            if sum(window) + 1 > self.max_hedge_ratio * (len(window) + 1):
+                window.append(0)
+                self.counters["hedges_denied"] += 1
+                return False
+            window.append(1)
+            self.counters["hedges"] += 1
+            return True
+
+    def _timed_get(self, host: str, url: str, is_retry: bool, **kwargs) -> requests.Response:
+        started = time.perf_counter()
+        response = self.guard.get(url, is_retry=is_retry, **kwargs)
+        with self._lock:
+            self._samples(host).append(time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def _submit(fn, *args, **kwargs) -> Future:
+        """
+        在守护线程中执行fn
+
+        ThreadPoolExecutor的工作线程会在解释器退出时被等待，
+        落败的请求可能让已响应的主机进程再拖满整个请求超时才退出。
+        """
+        future: Future = Future()
+
+        def run() -> None:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="poll-hedge", daemon=True).start()
+        return future
+
+    def poll(self, uuid_str: str, verifier: str, is_retry: bool = False, **kwargs) -> requests.Response:
+        """
+        发起一次轮询（开启对冲时可能发出两个请求），结束后持久化延迟样本与计数
+
+        Raises:
+            OutboundCallError: 保护器拒绝调用
+            requests.RequestException: 所有请求均失败
+        """
+        try:
+            return self._poll(uuid_str, verifier, is_retry, **kwargs)
+        finally:
+            self._save()
+
+    def _poll(self, uuid_str: str, verifier: str, is_retry: bool = False, **kwargs) -> requests.Response:
+        url = CursorEndpoints.poll_url(uuid_str, verifier)
+        host = urlparse(url).netloc
+        with self._lock:
+            self.counters["polls"] += 1
+
+        if not self.hedge:
+            self._record_poll(host, hedged=False)
+            try:
+                return self._timed_get(host, url, is_retry, **kwargs)
+            except requests.RequestException:
+                with self._lock:
+                    self.counters["errors"] += 1
+                raise
+
+        primary = self._submit(self._timed_get, host, url, is_retry, **kwargs)
+        pending = {primary}
+        done, _ = wait_futures(pending, timeout=self.hedge_delay(host))
+        hedge_future = None
+        if done:
+            self._record_poll(host, hedged=False)
+        elif self._try_acquire_hedge(host):
+            hedge_future = self._submit(self._timed_get, host, url, is_retry, **kwargs)
+            pending.add(hedge_future)
+
+        last_error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    if future is hedge_future:
+                        with self._lock:
+                            self.counters["hedge_wins"] += 1
+                    return future.result()
+                last_error = error
+
+        with self._lock:
+            self.counters["errors"] += 1
+        raise last_error
+
+    def stats(self) -> Dict[str, Any]:
+        """轮询及对冲统计，延迟分位数和最近的对冲比例按主机给出"""
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 2) if value is not None else None
+
+        with self._lock:
+            hosts = {}
+            for host in set(self.latencies) | set(self.hedged):
+                window = self._hedge_window(host)
+                hosts[host] = {
+                    "samples": len(self._samples(host)),
+                    "latency_ms": {
+                        "p50": ms(self._quantile(host, 0.5)),
+                        "p90": ms(self._quantile(host, self.hedge_quantile)),
+                        "p99": ms(self._quantile(host, 0.99))
+                    },
+                    "recentPolls": len(window),
+                    "recentHedgeRatio": round(sum(window) / len(window), 3) if window else 0.0
+                }
+            return {
+                "hedging_enabled": self.hedge,
+                "counters": dict(self.counters),
+                "hosts": hosts
+            }
+
+
+class BackgroundWork:
+    """
+    后台任务
+
+    处理器可以提交在响应发送之后继续执行的任务（例如刷新缓存），run() 在发送响应后等待它们完成。
+    注意只有 connectNative 端口下这些任务能可靠完成：sendNativeMessage 读到响应后 Chrome 会
+    结束主机进程，需要结果的处理器应在响应前按截止时间等待（见 UsageService.lookup_many）。
+    """
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    _futures: List[Any] = []
+    _lock = threading.Lock()
+
+    @classmethod
+    def submit(cls, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="background")
+            future = cls._executor.submit(fn, *args, **kwargs)
+            cls._futures = [f for f in cls._futures if not f.done()] + [future]
+        return future
+
+    @classmethod
+    def pending(cls) -> int:
+        with cls._lock:
+            return sum(1 for f in cls._futures if not f.done())
+
+    @classmethod
+    def drain(cls, timeout: float = 20.0) -> bool:
+        """等待所有后台任务完成，返回是否在超时前全部完成"""
+        with cls._lock:
+            futures = list(cls._futures)
+        if not futures:
+            return True
+        _, not_done = wait_futures(futures, timeout=timeout)
+        return not not_done
+
+
+class UsageCache:
+    """账户用量磁盘缓存（按userid），保存响应体及ETag/Last-Modified用于条件请求"""
+
+    CACHE_FILE = "usage_cache.json"
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @property
+    def path(self) -> str:
+        if self._path is None:
+            self._path = HostPaths.file(self.CACHE_FILE)
+        return self._path
+
+    @HostMetrics.timed("file")
+    def _read_file(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, userid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read_file()
+            entry = self._entries.get(userid)
+            return dict(entry) if entry else None
+
+    @HostMetrics.timed("file")
+    def put(self, userid: str, entry: Dict[str, Any]) -> None:
+        """写入单个条目；先合并磁盘上其他进程写入的内容再原子替换"""
+        with self._lock:
+            merged = self._read_file()
+            merged[userid] = entry
+            self._entries = merged
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(merged, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass  # 缓存写入失败不影响查询结果
+
+
+class UsageService:
+    """
+    账户用量/会员信息查询
+
+    - 新鲜缓存直接返回；
+    - 过期缓存条件请求刷新（ETag / If-Modified-Since），在 refresh_wait 秒内完成的直接返回新数据，
+      未完成的先返回旧数据，刷新留在后台（仅 connectNative 下能在响应后继续）；
+    - 无缓存时以有限并发同步拉取。
+    """
+
+    DEFAULT_TTL = 300.0
+    DEFAULT_REFRESH_WAIT = 2.0
+    MAX_CONCURRENCY = 16
+    ENDPOINTS = ("usage", "membership")
+
+    def __init__(self, cache: Optional[UsageCache] = None, guard: Optional[OutboundCallGuard] = None):
+        self.cache = cache or UsageCache()
+        self._guard = guard
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+
+    @property
+    def guard(self) -> OutboundCallGuard:
+        if self._guard is None:
+            self._guard = OutboundCallGuard.shared()
+        return self._guard
+
+    @staticmethod
+    def _account_token(account: Dict[str, Any]) -> Optional[str]:
+        token = account.get("accessToken")
+        if not token and "%3A%3A" in (account.get("WorkosCursorSessionToken") or ""):
+            token = account["WorkosCursorSessionToken"].split("%3A%3A", 1)[1]
+        return token
+
+    def _fetch_endpoint(self, url: str, cookie: str, previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        headers = {
+            "Accept": "application/json",
+            "Cookie": f"WorkosCursorSessionToken={cookie}"
+        }
+        if previous:
+            if previous.get("etag"):
+                headers["If-None-Match"] = previous["etag"]
+            if previous.get("lastModified"):
+                headers["If-Modified-Since"] = previous["lastModified"]
+
+        response = self.guard.get(url, headers=headers, timeout=10)
+        if response.status_code == 304 and previous:
+            return {**previous, "revalidated": True}
+        if response.status_code != 200:
+            raise requests.HTTPError(f"HTTP {response.status_code}: {url}")
+        return {
+            "body": response.json(),
+            "etag": response.headers.get("ETag"),
+            "lastModified": response.headers.get("Last-Modified"),
+            "revalidated": False
+        }
+
+    def refresh(self, userid: str, token: str) -> Dict[str, Any]:
+        """拉取（或条件重新验证）单个账户的用量与会员信息并写入缓存"""
+        previous = self.cache.get(userid) or {}
+        cookie = f"{userid}%3A%3A{token}"
+        urls = {
+            "usage": CursorEndpoints.usage_url(userid),
+            "membership": CursorEndpoints.membership_url()
+        }
+        entry: Dict[str, Any] = {"fetchedAt": time.time()}
+        for name in self.ENDPOINTS:
+            entry[name] = self._fetch_endpoint(urls[name], cookie, previous.get(name))
+        self.cache.put(userid, entry)
+        return entry
+
+    def _background_refresh(self, userid: str, token: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self.refresh(userid, token)
+        except (requests.RequestException, OutboundCallError, ValueError) as e:
+            # 后台刷新失败时保留旧缓存
+            HostLogger.shared().warning("后台刷新用量缓存失败: %s", e, userid=userid)
+            return None
+        finally:
+            with self._lock:
+                self._refreshing.discard(userid)
+
+    @staticmethod
+    def _result(account: Dict[str, Any], userid: str, entry: Dict[str, Any], source: str) -> Dict[str, Any]:
+        return {
+            "email": account.get("email"),
+            "userid": userid,
+            "source": source,
+            "fetchedAt": datetime.fromtimestamp(entry["fetchedAt"]).isoformat(),
+            "ageSeconds": round(time.time() - entry["fetchedAt"], 1),
+            "usage": entry.get("usage", {}).get("body"),
+            "membership": entry.get("membership", {}).get("body")
+        }
+
+    def _resolve_token(self, account: Dict[str, Any],
+                       reveal: Optional[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]]) -> Optional[str]:
+        """取账户token；只有元数据的加密账户通过reveal解密"""
+        token = self._account_token(account)
+        if token is None and reveal is not None and account.get("sealed"):
+            revealed = reveal(account)
+            token = self._account_token(revealed) if revealed else None
+        return token
+
+    def lookup_many(self, accounts: List[Dict[str, Any]], ttl: float = DEFAULT_TTL,
+                    concurrency: int = 4, force_refresh: bool = False,
+                    refresh_wait: float = DEFAULT_REFRESH_WAIT,
+                    reveal: Optional[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = None
+                    ) -> List[Dict[str, Any]]:
+        """
+        查询多个账户的用量，结果顺序与输入一致；过期缓存的刷新最多等待到 refresh_wait 秒
+
+        accounts可以是加密账户的元数据（sealed为True），此时只对需要拉取或刷新的账户调用reveal取token，
+        缓存仍新鲜的账户不解密。
+        """
+        started = time.monotonic()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(accounts)
+        to_fetch: List[Tuple[int, str, str]] = []
+        refreshing: Dict[Any, int] = {}
+
+        for index, account in enumerate(accounts):
+            userid = account.get("userid") if isinstance(account, dict) else None
+            sealed = isinstance(account, dict) and reveal is not None and bool(account.get("sealed"))
+            if not userid or not (sealed or self._account_token(account)):
+                results[index] = {"email": account.get("email") if isinstance(account, dict) else None,
+                                  "userid": userid, "source": "error", "error": "账户缺少userid或accessToken"}
+                continue
+
+            entry = None if force_refresh else self.cache.get(userid)
+            if entry is not None and time.time() - entry["fetchedAt"] <= ttl:
+                results[index] = self._result(account, userid, entry, "cache")
+                continue
+
+            try:
+                token = self._resolve_token(account, reveal)
+            except (VaultError, sqlite3.Error) as e:
+                results[index] = {"email": account.get("email"), "userid": userid,
+                                  "source": "error", "error": f"读取账户token失败: {str(e)}"}
+                continue
+            if not token:
+                results[index] = {"email": account.get("email"), "userid": userid,
+                                  "source": "error", "error": "账户缺少userid或accessToken"}
+                continue
+
+            if entry is None:
+                to_fetch.append((index, userid, token))
+            else:
+                results[index] = self._result(account, userid, entry, "stale")
+                with self._lock:
+                    already = userid in self._refreshing
+                    self._refreshing.add(userid)
+                if not already:
+                    refreshing[BackgroundWork.submit(self._background_refresh, userid, token)] = index
+
+        def fetch(item: Tuple[int, str, str]) -> Tuple[int, Dict[str, Any]]:
+            index, userid, token = item
+            try:
+                return index, self._result(accounts[index], userid, self.refresh(userid, token), "fresh")
+            except OutboundCallError as e:
+                return index, {"email": accounts[index].get("email"), "userid": userid,
+                               "source": "error", "error": str(e), "errorCode": e.code}
+            except (requests.RequestException, ValueError) as e:
+                return index, {"email": accounts[index].get("email"), "userid": userid,
+                               "source": "error", "error": str(e)}
+
+        if to_fetch:
+            workers = max(1, min(int(concurrency), self.MAX_CONCURRENCY, len(to_fetch)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for index, result in executor.map(fetch, to_fetch):
+                    results[index] = result
+
+        if refreshing:
+            done, _ = wait_futures(list(refreshing), timeout=max(0.0, refresh_wait - (time.monotonic() - started)))
+            for future in done:
+                entry = future.result()
+                if entry is not None:
+                    index = refreshing[future]
+                    results[index] = self._result(accounts[index], accounts[index].get("userid"), entry, "fresh")
+        return results
+
+
+class DeepTokenManager:
+    """深度Token管理器"""
+    
+    @staticmethod
+    def _generate_pkce_pair() -> Tuple[str, str]:
+        """生成PKCE验证对"""
+        code_verifier = secrets.token_urlsafe(43)
+        code_challenge_digest = hashlib.sha256(code_verifier.encode('utf-8')).digest()
+        code_challenge = base64.urlsafe_b64encode(code_challenge_digest).decode('utf-8').rstrip('=')    
+        return code_verifier, code_challenge
+    
+    @classmethod
+    def get_deep_token_headless(cls, access_token: str, userid: str, max_attempts: int = 5,
+                                poll_delay: float = 2.0, deadline: float = 45.0,
+                                guard: Optional[OutboundCallGuard] = None,
+                                poll_client: Optional[DeepTokenPollClient] = None) -> Dict[str, Any]:
+        """
+        无头模式获取深度token
+
+        ========================================
+        此方法暂时被禁用
+        ========================================
+        原因：无头模式实现存在问题，需要完善后再启用
+        恢复方法：修复下面的实现逻辑，并取消相关调用处的注释
+        相关文件：
+        - popup.html 中的无头模式选项
+        - popup.js 中的 handleAutoRead 方法
+        - background.js 中的 getDeepToken 方法
+        ========================================
+
+        所有外部请求都经过 OutboundCallGuard：目标主机熔断时立即返回 CIRCUIT_OPEN，
+        全局重试预算耗尽时返回 RETRY_BUDGET_EXHAUSTED，整个过程不超过 deadline 秒。
+
+        Args:
+            access_token: 客户端访问token
+            userid: 用户ID
+            max_attempts: 最大尝试次数
+            poll_delay: 访问深度登录页面后到开始轮询之间的等待秒数
+            deadline: 整个获取过程的最长耗时(秒)
+            guard: 外部调用保护器，默认使用进程共享实例
+            poll_client: 轮询客户端（可开启对冲），默认使用进程共享实例
+
+        Returns:
+            Dict[str, Any]: 包含深度token信息或错误信息的字典
+        """
+        guard = guard or OutboundCallGuard.shared()
+        poll_client = poll_client or DeepTokenPollClient.shared()
+        started = time.monotonic()
+
+        def remaining(cap: float) -> float:
+            return max(0.1, min(cap, deadline - (time.monotonic() - started)))
+
+        try:
+            session_cookie = f"{userid}%3A%3A{access_token}"
+            attempts_made = 0
+            
+            for attempt in range(max_attempts):
+                if time.monotonic() - started >= deadline:
+                    break
+                attempts_made += 1
                 try:
                     verifier, challenge = cls._generate_pkce_pair()
                     uuid_str = str(uuid.uuid4())
                     
                     # 构造深度登录URL
-                    auth_url = f"https://www.cursor.com/cn/loginDeepControl?challenge={challenge}&uuid={uuid_str}&mode=login"
+                    auth_url = f"{CursorEndpoints.deep_login_url()}?challenge={challenge}&uuid={uuid_str}&mode=login"
                     
                     # 设置请求头，模拟浏览器
                     headers = {
@@ -486,21 +2250,22 @@ class DeepTokenManager:
                     }
                     
                     # 访问深度登录页面，模拟自动确认登录
-                    response = requests.get(auth_url, headers=headers, timeout=10, allow_redirects=True)
+                    response = guard.get(auth_url, is_retry=attempt > 0, headers=headers,
+                                         timeout=remaining(10), allow_redirects=True)
                     
                     if response.status_code == 200:
                         # 短暂等待，然后轮询认证状态
-                        time.sleep(2)
+                        time.sleep(min(poll_delay, remaining(poll_delay)))
                         
                         # 轮询认证结果
-                        poll_url = f"https://api2.cursor.sh/auth/poll?uuid={uuid_str}&verifier={verifier}"
                         poll_headers = {
                             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Cursor/0.48.6 Chrome/132.0.6834.210 Electron/34.3.4 Safari/537.36",
                             "Accept": "*/*",
-                            "Referer": "https://www.cursor.com/"
+                            "Referer": f"{CursorEndpoints.web_base_url()}/"
                         }
                         
-                        poll_response = requests.get(poll_url, headers=poll_headers, timeout=30)
+                        poll_response = poll_client.poll(uuid_str, verifier, is_retry=attempt > 0,
+                                                         headers=poll_headers, timeout=remaining(30))
                         
                         if poll_response.status_code == 200:
                             data = poll_response.json()
@@ -534,14 +2299,18 @@ class DeepTokenManager:
                         # 深度登录页面访问失败，静默重试
                         pass
                     
+                except OutboundCallError as e:
+                    # 熔断或重试预算耗尽，立即失败，不再等待
+                    return e.to_response()
                 except requests.RequestException as e:
                     # 请求失败，静默重试
                     if attempt < max_attempts - 1:
-                        time.sleep(2)  # 重试前等待
+                        time.sleep(min(2, remaining(2)))  # 重试前等待
             
             return {
                 "success": False,
-                "error": f"无头模式获取深度token失败，已尝试 {max_attempts} 次",
+                "error": f"无头模式获取深度token失败，已尝试 {attempts_made} 次",
+                "errorCode": "DEEP_TOKEN_FAILED",
                 "suggestions": [
                     "检查网络连接是否正常",
                     "确认客户端token是否有效",
@@ -561,13 +2330,1289 @@ class DeepTokenManager:
             }
 
 
+class JWTClaimsDecoder:
+    """
+    JWT声明解码器（不校验签名，只读取payload）
+
+    解码结果按token的SHA-256摘要缓存在有界LRU中，缓存中不保留token原文。
+    """
+
+    _shared: Optional["JWTClaimsDecoder"] = None
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Optional[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def shared(cls) -> "JWTClaimsDecoder":
+        """获取进程内共享的解码器"""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _decode_payload(token: str) -> Optional[Dict[str, Any]]:
+        parts = token.split(".")
+        if len(parts) != 3:
+            return None
+        try:
+            payload_part = parts[1] + "=" * (-len(parts[1]) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(payload_part))
+        except (ValueError, TypeError):
+            return None
+        return payload if isinstance(payload, dict) else None
+
+    def claims(self, token: str) -> Optional[Dict[str, Any]]:
+        """获取token的payload声明，无法解析时返回None"""
+        if not token or not isinstance(token, str):
+            return None
+        key = self.digest(token)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+        payload = self._decode_payload(token)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = payload
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return payload
+
+    def describe(self, token: str, now: Optional[float] = None) -> Dict[str, Any]:
+        """返回 sub、userid、exp 及剩余时间"""
+        payload = self.claims(token)
+        if payload is None:
+            return {"valid": False, "error": "无法解析的JWT"}
+
+        sub = payload.get("sub") if isinstance(payload.get("sub"), str) else None
+        exp = payload.get("exp")
+        exp = exp if isinstance(exp, (int, float)) and not isinstance(exp, bool) else None
+        expires_time = None
+        if exp is not None:
+            # NaN、超出平台time_t范围的exp只让这一个token无效，不能让批量解码或调用方整体失败
+            try:
+                expires_time = datetime.fromtimestamp(exp).isoformat()
+                exp = int(exp)
+            except (OverflowError, ValueError, OSError) as e:
+                return {"valid": False, "error": f"exp超出范围: {e}"}
+        info: Dict[str, Any] = {
+            "valid": True,
+            "sub": sub,
+            "userid": sub.split("|")[-1] if sub else None,
+            "exp": exp,
+            "tokenType": payload.get("type")
+        }
+        if exp is None:
+            info.update({"remainingSeconds": None, "remainingDays": None, "isExpired": None, "expiresTime": None})
+        else:
+            remaining = int(exp - (time.time() if now is None else now))
+            info.update({
+                "remainingSeconds": remaining,
+                "remainingDays": max(0, -(-remaining // 86400)),  # 向上取整，与前端JWTDecoder一致
+                "isExpired": remaining <= 0,
+                "expiresTime": expires_time
+            })
+        return info
+
+    def describe_many(self, tokens: List[str]) -> List[Dict[str, Any]]:
+        """批量解码，同一批次使用同一个当前时间"""
+        now = time.time()
+        return [self.describe(token, now) for token in tokens]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._cache), "maxEntries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+
+class TokenHistoryLog:
+    """
+    Token历史日志（只追加，逐行校验）
+
+    每行为 "<crc32八位十六进制> <JSON>\n"，记录 userid、email、token摘要、首次出现时间和exp，不保存token原文。
+    内存索引记录 userid -> 行偏移列表 与 (userid, 摘要) -> 偏移，并持久化为.idx旁路文件；
+    新进程加载索引后只需扫描其后新追加的部分，按用户查询只读取该用户的几行。
+    损坏或重复的行（并发追加时可能出现）累计到一定比例、或距上次压缩超过一定时间时重写日志。
+    """
+
+    LOG_FILE = "token_history.log"
+    INDEX_VERSION = 1
+    DIGEST_CHARS = 32
+    INDEX_SAVE_BYTES = 64 * 1024
+    COMPACT_MIN_DEAD = 64
+    COMPACT_DEAD_RATIO = 0.25
+    COMPACT_INTERVAL = 7 * 86400
+    MAX_RECORDS_PER_USER = 200
+
+    _shared: Optional["TokenHistoryLog"] = None
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._reset_index()
+        self._compacted_at = time.time()
+
+    def _reset_index(self) -> None:
+        self._by_user: Dict[str, List[int]] = {}
+        self._seen: Dict[str, int] = {}
+        self._indexed_size = 0
+        self._indexed_head = ""
+        self._indexed_inode: Optional[int] = None
+        self._saved_size = 0
+        self._records = 0
+        self._dead = 0
+
+    @classmethod
+    def shared(cls) -> "TokenHistoryLog":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @property
+    def path(self) -> str:
+        if self._path is None:
+            self._path = HostPaths.file(self.LOG_FILE)
+        return self._path
+
+    @property
+    def index_path(self) -> str:
+        return f"{self.path}.idx"
+
+    @staticmethod
+    def _encode(record: Dict[str, Any]) -> bytes:
+        body = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return b"%08x " % zlib.crc32(body) + body + b"\n"
+
+    @staticmethod
+    def _decode(line: bytes) -> Optional[Dict[str, Any]]:
+        """校验并解析一行，校验失败返回None"""
+        if len(line) < 11 or line[8:9] != b" " or not line.endswith(b"\n"):
+            return None
+        body = line[9:-1]
+        try:
+            if int(line[:8], 16) != zlib.crc32(body):
+                return None
+            record = json.loads(body)
+        except ValueError:
+            return None
+        if not isinstance(record, dict) or not record.get("userid") or not record.get("digest"):
+            return None
+        return record
+
+    def _head(self) -> str:
+        """日志开头的字节，用于判断索引是否对应当前文件（压缩会重写文件）"""
+        return self._probe()[2]
+
+    def _probe(self) -> Tuple[int, Optional[int], str]:
+        """日志的当前大小、inode和开头字节"""
+        try:
+            with open(self.path, "rb") as f:
+                info = os.fstat(f.fileno())
+                return info.st_size, info.st_ino, f.read(64).hex()
+        except OSError:
+            return 0, None, ""
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        """
+        跨进程锁（旁路.lock文件）：追加取共享锁，压缩取排他锁，
+        保证压缩读取旧文件到替换之间没有其他进程的追加落到旧文件上而丢失
+        """
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                yield
+            else:
+                # Windows没有共享锁，追加和压缩都取排他锁
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def _scan(self, start: int) -> None:
+        """从start开始扫描日志，补全索引；末尾未写完的半行留到下次"""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                record = self._decode(line)
+                key = f"{record['userid']} {record['digest']}" if record else None
+                if key is None or key in self._seen:
+                    self._dead += 1
+                else:
+                    self._seen[key] = offset
+                    self._by_user.setdefault(record["userid"], []).append(offset)
+                    self._records += 1
+                offset += len(line)
+        self._indexed_size = offset
+        if len(self._indexed_head) < 128 or self._indexed_inode is None:
+            _, self._indexed_inode, self._indexed_head = self._probe()
+
+    def _load(self) -> None:
+        """首次使用时加载索引文件；与日志不匹配时全量重建"""
+        self._loaded = True
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            _, inode, head = self._probe()
+            if saved.get("version") != self.INDEX_VERSION or saved.get("head") != head \
+                    or saved.get("inode", inode) != inode:
+                raise ValueError("索引与日志不匹配")
+            if os.path.getsize(self.path) < saved["size"]:
+                raise ValueError("日志比索引短")
+            for userid, entries in saved["users"].items():
+                self._by_user[userid] = [offset for offset, _ in entries]
+                for offset, digest in entries:
+                    self._seen[f"{userid} {digest}"] = offset
+            self._indexed_size = self._saved_size = saved["size"]
+            self._records = sum(len(v) for v in self._by_user.values())
+            self._dead = saved.get("dead", 0)
+            self._compacted_at = saved.get("compactedAt", time.time())
+        except (OSError, ValueError, KeyError, TypeError):
+            self._reset_index()
+        self._scan(self._indexed_size)
+        self._save_index_if_behind()
+
+    def _refresh(self) -> None:
+        """加载索引并补上其他进程追加的记录"""
+        if not self._loaded:
+            self._load()
+            return
+        size, inode, head = self._probe()
+        replaced = self._indexed_inode is not None and inode != self._indexed_inode
+        if replaced or size < self._indexed_size or not head.startswith(self._indexed_head):
+            # 文件被其他进程压缩重写：重写后可能已经又长过原来的大小，开头几行也可能与原来相同，
+            # 所以同时比较inode（压缩用os.replace换成新文件）和开头字节
+            self._reset_index()
+            self._load()
+        elif size > self._indexed_size:
+            self._scan(self._indexed_size)
+
+    def _save_index(self) -> None:
+        digests = {offset: key.split(" ", 1)[1] for key, offset in self._seen.items()}
+        saved = {
+            "version": self.INDEX_VERSION,
+            "size": self._indexed_size,
+            "head": self._head(),
+            "inode": self._probe()[1],
+            "dead": self._dead,
+            "compactedAt": self._compacted_at,
+            "users": {userid: [[offset, digests[offset]] for offset in offsets]
+                      for userid, offsets in self._by_user.items()}
+        }
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(saved, f, separators=(",", ":"))
+        os.replace(tmp_path, self.index_path)
+        self._saved_size = self._indexed_size
+
+    def _save_index_if_behind(self) -> None:
+        """索引之后未覆盖的日志超过INDEX_SAVE_BYTES时才重写索引文件，少量尾部由加载时扫描补上"""
+        if self._indexed_size - self._saved_size >= self.INDEX_SAVE_BYTES:
+            self._save_index()
+
+    def _read_at(self, f: Any, offset: int) -> Optional[Dict[str, Any]]:
+        f.seek(offset)
+        return self._decode(f.readline())
+
+    @HostMetrics.timed("file")
+    def observe(self, token: str, userid: Optional[str] = None, email: Optional[str] = None,
+                source: str = "client") -> Optional[Dict[str, Any]]:
+        """记录一次读到的token；首次出现时追加一行并返回该记录，已记录过返回None"""
+        info = JWTClaimsDecoder.shared().describe(token)
+        userid = userid or info.get("userid")
+        if not userid:
+            return None
+        digest = JWTClaimsDecoder.digest(token)[:self.DIGEST_CHARS]
+        with self._lock:
+            self._refresh()
+            if f"{userid} {digest}" in self._seen:
+                return None
+            record = {
+                "userid": userid,
+                "email": email,
+                "digest": digest,
+                "firstSeen": round(time.time(), 3),
+                "exp": info.get("exp"),
+                "source": source
+            }
+            # O_APPEND单次写入一整行，多个主机进程并发追加也不会交错；共享锁与压缩互斥
+            with self._file_lock(exclusive=False):
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                try:
+                    os.write(fd, self._encode(record))
+                finally:
+                    os.close(fd)
+            self._scan(self._indexed_size)
+            if not self._maybe_compact():
+                self._save_index_if_behind()
+            return record
+
+    @HostMetrics.timed("file")
+    def query(self, userid: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """按首次出现时间倒序返回某用户的token记录（只读取索引指向的行）"""
+        with self._lock:
+            self._refresh()
+            offsets = self._by_user.get(userid, [])[-limit:]
+            if not offsets:
+                return []
+            records = []
+            with open(self.path, "rb") as f:
+                for offset in reversed(offsets):
+                    record = self._read_at(f, offset)
+                    if record is not None and record["userid"] == userid:
+                        records.append(record)
+            return records
+
+    def _maybe_compact(self) -> bool:
+        total = self._records + self._dead
+        too_dirty = self._dead >= self.COMPACT_MIN_DEAD and self._dead >= total * self.COMPACT_DEAD_RATIO
+        overdue = (self._dead > 0 or any(len(v) > self.MAX_RECORDS_PER_USER for v in self._by_user.values())) \
+            and time.time() - self._compacted_at >= self.COMPACT_INTERVAL
+        if too_dirty or overdue:
+            self._compact()
+            return True
+        return False
+
+    def compact(self) -> Dict[str, Any]:
+        """重写日志：去掉损坏和重复的行，每个用户只保留最近MAX_RECORDS_PER_USER条"""
+        with self._lock:
+            self._refresh()
+            return self._compact()
+
+    def _compact(self) -> Dict[str, Any]:
+        with self._file_lock(exclusive=True):
+            # 取得锁之前其他进程可能又追加或已经压缩过，先补上
+            self._refresh()
+            return self._compact_locked()
+
+    def _compact_locked(self) -> Dict[str, Any]:
+        before = {"records": self._records, "dead": self._dead, "size": self._indexed_size}
+        tmp_path = f"{self.path}.{os.getpid()}.compact"
+        by_user: Dict[str, List[int]] = {}
+        seen: Dict[str, int] = {}
+        offset = 0
+        with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+            for userid, offsets in self._by_user.items():
+                for old_offset in offsets[-self.MAX_RECORDS_PER_USER:]:
+                    record = self._read_at(src, old_offset)
+                    if record is None:
+                        continue
+                    line = self._encode(record)
+                    dst.write(line)
+                    seen[f"{userid} {record['digest']}"] = offset
+                    by_user.setdefault(userid, []).append(offset)
+                    offset += len(line)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+        self._by_user, self._seen = by_user, seen
+        self._records = sum(len(v) for v in by_user.values())
+        self._dead = 0
+        self._indexed_size = offset
+        _, self._indexed_inode, self._indexed_head = self._probe()
+        self._compacted_at = time.time()
+        self._save_index()
+        return {"before": before, "after": {"records": self._records, "dead": 0, "size": offset}}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            return {
+                "users": len(self._by_user),
+                "records": self._records,
+                "deadRecords": self._dead,
+                "sizeBytes": self._indexed_size,
+                "compactedAt": datetime.fromtimestamp(self._compacted_at).isoformat()
+            }
+
+
+class VaultError(Exception):
+    """账户保险库不可用或解密失败"""
+
+
+class AccountVault:
+    """
+    账户保险库：逐条记录用AES-GCM（AEAD）加密敏感字段
+
+    密钥优先保存在系统钥匙串（keyring），否则保存在数据目录下权限为0600的密钥文件中。
+    记录格式为 版本(1字节) + nonce(12字节) + 密文，email作为附加认证数据，
+    密文无法被挪到其他账户行上解密。
+    """
+
+    KEYRING_SERVICE = "cursor-client2login"
+    KEYRING_USERNAME = "account-vault-key"
+    KEY_FILE = "vault.key"
+    RECORD_VERSION = 1
+    NONCE_SIZE = 12
+
+    def __init__(self, key_file: Optional[str] = None):
+        self._key_file = key_file
+        self._key: Optional[bytes] = None
+        self._backend: Optional[str] = None
+        self._loaded = False
+
+    @property
+    def key_file(self) -> str:
+        if self._key_file is None:
+            self._key_file = HostPaths.file(self.KEY_FILE)
+        return self._key_file
+
+    def _load_key(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if KEYRING_AVAILABLE:
+            try:
+                stored = keyring.get_password(self.KEYRING_SERVICE, self.KEYRING_USERNAME)
+            except Exception:
+                stored = None  # 钥匙串后端不可用时回退到密钥文件
+            if stored:
+                self._key, self._backend = base64.b64decode(stored), "keyring"
+                return
+        if os.path.exists(self.key_file):
+            with open(self.key_file, "rb") as f:
+                self._key, self._backend = base64.b64decode(f.read().strip()), "file"
+
+    @property
+    def enabled(self) -> bool:
+        """已创建密钥即视为启用"""
+        self._load_key()
+        return self._key is not None
+
+    @property
+    def backend(self) -> Optional[str]:
+        self._load_key()
+        return self._backend
+
+    def create_key(self, prefer_keyring: bool = True) -> str:
+        """生成新密钥并保存，返回使用的后端（keyring / file）"""
+        if not CRYPTOGRAPHY_AVAILABLE:
+            raise VaultError("未安装cryptography库，无法启用保险库")
+        if self.enabled:
+            return self._backend or "file"
+
+        key = AESGCM.generate_key(bit_length=256)
+        encoded = base64.b64encode(key).decode("ascii")
+        if prefer_keyring and KEYRING_AVAILABLE:
+            try:
+                keyring.set_password(self.KEYRING_SERVICE, self.KEYRING_USERNAME, encoded)
+                self._key, self._backend = key, "keyring"
+                return "keyring"
+            except Exception:
+                pass  # 没有可用的钥匙串后端（如无桌面会话的Linux），改用密钥文件
+
+        fd = os.open(self.key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w", encoding="ascii") as f:
+            f.write(encoded)
+        self._key, self._backend = key, "file"
+        return "file"
+
+    def _cipher(self) -> "AESGCM":
+        if not CRYPTOGRAPHY_AVAILABLE:
+            raise VaultError("未安装cryptography库，无法读写加密账户")
+        if not self.enabled:
+            raise VaultError("保险库尚未启用")
+        return AESGCM(self._key)
+
+    def seal(self, secrets_dict: Dict[str, Any], email: str) -> bytes:
+        """加密单条记录的敏感字段"""
+        nonce = secrets.token_bytes(self.NONCE_SIZE)
+        plaintext = json.dumps(secrets_dict, ensure_ascii=False).encode("utf-8")
+        ciphertext = self._cipher().encrypt(nonce, plaintext, email.encode("utf-8"))
+        return bytes([self.RECORD_VERSION]) + nonce + ciphertext
+
+    def open(self, record: bytes, email: str) -> Dict[str, Any]:
+        """解密单条记录的敏感字段"""
+        if not record or record[0] != self.RECORD_VERSION:
+            raise VaultError("不支持的加密记录格式")
+        nonce = record[1:1 + self.NONCE_SIZE]
+        try:
+            plaintext = self._cipher().decrypt(nonce, record[1 + self.NONCE_SIZE:], email.encode("utf-8"))
+        except InvalidTag:
+            raise VaultError(f"账户 {email} 解密失败：密钥不匹配或记录已损坏")
+        return json.loads(plaintext.decode("utf-8"))
+
+
+class AccountStore:
+    """
+    账户存储（SQLite）
+
+    每个账户一行，按email唯一，并对userid和过期时间建立索引；
+    写入只影响单行，不再整体读写账户数组。
+    启用保险库后，敏感字段逐行加密存放在sealed列，data列只保留非敏感元数据。
+    """
+
+    SECRET_FIELDS = ("accessToken", "refreshToken", "WorkosCursorSessionToken")
+
+    DB_FILE = "accounts.db"
+    SORT_COLUMNS = {
+        "email": "email",
+        "userid": "userid",
+        "expiresAt": "expires_at",
+        "updatedAt": "updated_at",
+        "createdAt": "created_at"
+    }
+
+    def __init__(self, db_path: Optional[str] = None, vault: Optional[AccountVault] = None):
+        self._db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self.vault = vault or AccountVault()
+
+    @property
+    def db_path(self) -> str:
+        """数据库路径，首次使用时才创建数据目录"""
+        if self._db_path is None:
+            self._db_path = HostPaths.file(self.DB_FILE)
+        return self._db_path
+
+    def connect(self) -> sqlite3.Connection:
+        """打开（必要时初始化）数据库连接"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS accounts (
+                    email TEXT PRIMARY KEY,
+                    userid TEXT,
+                    token_type TEXT,
+                    expires_at INTEGER,
+                    created_at TEXT,
+                    updated_at REAL NOT NULL,
+                    data TEXT NOT NULL,
+                    sub TEXT,
+                    sealed BLOB
+                );
+            """)
+            self._migrate(conn)
+            conn.executescript("""
+                CREATE INDEX IF NOT EXISTS idx_accounts_userid ON accounts(userid);
+                CREATE INDEX IF NOT EXISTS idx_accounts_expires_at ON accounts(expires_at);
+                CREATE INDEX IF NOT EXISTS idx_accounts_urgency ON accounts(expires_at IS NULL, expires_at, email);
+                CREATE TABLE IF NOT EXISTS auth_snapshots (
+                    email TEXT PRIMARY KEY,
+                    rows TEXT,
+                    sealed BLOB,
+                    built_at REAL NOT NULL
+                );
+            """)
+            self._conn = conn
+        return self._conn
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """为旧版数据库补充sub、sealed列，并回填预解码的过期时间与sub"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(accounts)")}
+        if "sealed" not in columns:
+            with conn:
+                conn.execute("ALTER TABLE accounts ADD COLUMN sealed BLOB")
+        if "sub" in columns:
+            return
+        with conn:
+            conn.execute("ALTER TABLE accounts ADD COLUMN sub TEXT")
+            rows = conn.execute("SELECT email, data FROM accounts").fetchall()
+            for row in rows:
+                claims = self._extract_claims(json.loads(row["data"]))
+                conn.execute("UPDATE accounts SET expires_at = ?, sub = ? WHERE email = ?",
+                             (claims["exp"], claims["sub"], row["email"]))
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def _extract_claims(account: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        预解码账户token中的过期时间(exp, epoch秒)和sub
+
+        过期时间优先取JWT的exp，其次取expiresTime；
+        与 JWTClaimsDecoder.describe 的校验一致，无法解析的token或超出范围的exp不写入。
+        """
+        claims: Dict[str, Any] = {"exp": None, "sub": None}
+        info = JWTClaimsDecoder.shared().describe(account.get("accessToken") or "")
+        if info["valid"]:
+            claims["exp"] = info["exp"]
+            claims["sub"] = info["sub"]
+        expires_time = account.get("expiresTime")
+        if claims["exp"] is None and expires_time:
+            try:
+                claims["exp"] = int(datetime.fromisoformat(expires_time.replace("Z", "+00:00")).timestamp())
+            except (ValueError, AttributeError):
+                pass
+        return claims
+
+    def _row_to_account(self, row: sqlite3.Row, reveal: bool = False) -> Dict[str, Any]:
+        """行转账户；加密行默认只返回元数据，reveal为True时解密该行"""
+        account = json.loads(row["data"])
+        if reveal and row["sealed"] is not None:
+            account.update(self.vault.open(row["sealed"], row["email"]))
+            account.pop("sealed", None)
+        return account
+
+    def _split_secrets(self, account: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        """保险库启用时拆出并加密敏感字段，返回 (data列内容, sealed列内容)"""
+        if not self.vault.enabled:
+            return account, None
+        metadata = {k: v for k, v in account.items() if k not in self.SECRET_FIELDS}
+        metadata["sealed"] = True
+        secret_fields = {k: account[k] for k in self.SECRET_FIELDS if k in account}
+        return metadata, self.vault.seal(secret_fields, account["email"])
+
+    def _upsert_row(self, conn: sqlite3.Connection, account: Dict[str, Any]) -> bool:
+        """
+        在调用方的事务中写入单个账户，返回是否为新建
+
+        已有账户时把传入字段合并到原有记录上，缺少的字段（包括token）沿用原值，
+        只含部分字段的记录不会清掉已保存的token。
+        """
+        email = account.get("email")
+        if not email:
+            raise ValueError("账户缺少email字段")
+        # expiryInfo和sealed是查询时附加的派生字段，不入库
+        account = {k: v for k, v in account.items() if k not in ("expiryInfo", "sealed")}
+        row = conn.execute("SELECT email, data, sealed FROM accounts WHERE email = ?", (email,)).fetchone()
+        existed = row is not None
+        if existed:
+            # 传入记录带齐全部敏感字段时无需解密原记录
+            reveal = not all(field in account for field in self.SECRET_FIELDS)
+            previous = self._row_to_account(row, reveal=reveal)
+            previous.pop("sealed", None)
+            previous.pop("expiryInfo", None)
+            account = {**previous, **account}
+        claims = self._extract_claims(account)
+        data, sealed = self._split_secrets(account)
+        conn.execute("""
+            INSERT INTO accounts (email, userid, token_type, expires_at, created_at, updated_at, data, sub, sealed)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(email) DO UPDATE SET
+                userid = excluded.userid,
+                token_type = excluded.token_type,
+                expires_at = excluded.expires_at,
+                created_at = excluded.created_at,
+                updated_at = excluded.updated_at,
+                data = excluded.data,
+                sub = excluded.sub,
+                sealed = excluded.sealed
+        """, (
+            email,
+            account.get("userid"),
+            account.get("tokenType", "client"),
+            claims["exp"],
+            account.get("createdTime"),
+            time.time(),
+            json.dumps(data, ensure_ascii=False),
+            claims["sub"],
+            sealed
+        ))
+        self._save_auth_snapshot(conn, account)
+        return not existed
+
+    @HostMetrics.timed("db")
+    def upsert(self, account: Dict[str, Any]) -> Dict[str, Any]:
+        """插入或更新单个账户，返回是否为新建"""
+        conn = self.connect()
+        with conn:
+            created = self._upsert_row(conn, account)
+        return {"created": created}
+
+    @HostMetrics.timed("db")
+    def upsert_many(self, accounts: List[Dict[str, Any]]) -> Dict[str, int]:
+        """在单个事务中批量写入账户"""
+        created = 0
+        conn = self.connect()
+        with conn:
+            for account in accounts:
+                created += 1 if self._upsert_row(conn, account) else 0
+        return {"created": created, "updated": len(accounts) - created}
+
+    @HostMetrics.timed("db")
+    def count(self) -> int:
+        return self.connect().execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+
+    def iter_ndjson_chunks(self, chunk_chars: int = 128 * 1024,
+                           batch_size: int = 200) -> Iterator[Tuple[str, int]]:
+        """
+        按email顺序把账户导出为NDJSON文本块
+
+        游标分批读取，每块约chunk_chars个字符，产出 (文本块, 累计账户数)。
+        """
+        cursor = self.connect().execute("SELECT email, data, sealed FROM accounts ORDER BY email")
+        parts: List[str] = []
+        size = 0
+        exported = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                if row["sealed"] is None:
+                    # data列本身就是紧凑的JSON，直接作为一行输出
+                    line = row["data"] + "\n"
+                else:
+                    line = json.dumps(self._row_to_account(row, reveal=True), ensure_ascii=False) + "\n"
+                parts.append(line)
+                size += len(line)
+                exported += 1
+                if size >= chunk_chars:
+                    yield "".join(parts), exported
+                    parts, size = [], 0
+        if parts:
+            yield "".join(parts), exported
+
+    def iter_claims(self, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """按email顺序产出每个账户预解码的过期时间、sub和非敏感元数据，不解密任何一行"""
+        cursor = self.connect().execute("SELECT email, expires_at, sub, data FROM accounts ORDER BY email")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                metadata = json.loads(row["data"])
+                metadata.pop("sealed", None)
+                yield {"email": row["email"], "exp": row["expires_at"], "sub": row["sub"], "metadata": metadata}
+
+    @HostMetrics.timed("db")
+    def get(self, email: Optional[str] = None, userid: Optional[str] = None,
+            reveal: bool = False) -> Optional[Dict[str, Any]]:
+        """按email或userid查询单个账户；reveal为True时解密该账户的敏感字段"""
+        conn = self.connect()
+        if email:
+            row = conn.execute("SELECT email, data, sealed FROM accounts WHERE email = ?", (email,)).fetchone()
+        elif userid:
+            row = conn.execute(
+                "SELECT email, data, sealed FROM accounts WHERE userid = ? ORDER BY updated_at DESC LIMIT 1",
+                (userid,)
+            ).fetchone()
+        else:
+            raise ValueError("需要提供email或userid")
+        return self._row_to_account(row, reveal) if row else None
+
+    @HostMetrics.timed("db")
+    def list(self, offset: int = 0, limit: int = 50, sort_by: str = "updatedAt",
+             order: str = "desc", reveal: bool = False) -> Dict[str, Any]:
+        """分页、排序地列出账户；reveal仅供主机内部需要token的功能使用"""
+        column = self.SORT_COLUMNS.get(sort_by)
+        if column is None:
+            raise ValueError(f"不支持的排序字段: {sort_by}")
+        direction = "ASC" if str(order).lower() == "asc" else "DESC"
+        limit = max(1, min(int(limit), 1000))
+        offset = max(0, int(offset))
+
+        conn = self.connect()
+        total = conn.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+        # NULL过期时间始终排在最后，email作为稳定的次级排序
+        rows = conn.execute(
+            f"SELECT email, data, sealed FROM accounts ORDER BY {column} IS NULL, {column} {direction}, email ASC "
+            f"LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+        return {
+            "accounts": [self._row_to_account(row, reveal) for row in rows],
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "hasMore": offset + len(rows) < total
+        }
+
+    @staticmethod
+    def _expiry_info(row: sqlite3.Row, now: float) -> Dict[str, Any]:
+        """根据预解码的列计算过期信息，无需再解析JWT"""
+        exp = row["expires_at"]
+        info: Dict[str, Any] = {"exp": exp, "sub": row["sub"], "tokenType": row["token_type"]}
+        if exp is None:
+            info.update({"remainingSeconds": None, "remainingDays": None, "isExpired": None})
+        else:
+            remaining = int(exp - now)
+            info.update({
+                "remainingSeconds": remaining,
+                "remainingDays": max(0, -(-remaining // 86400)),  # 向上取整，与前端JWTDecoder一致
+                "isExpired": remaining <= 0
+            })
+        return info
+
+    @HostMetrics.timed("db")
+    def list_by_urgency(self, offset: int = 0, limit: int = 50,
+                        current_email: Optional[str] = None) -> Dict[str, Any]:
+        """
+        按紧急程度（过期时间升序，无过期时间的排最后）列出账户，当前账户固定排在首位
+
+        每个账户附带expiryInfo（exp、sub、tokenType及剩余时间），前端无需逐个解码JWT。
+        """
+        limit = max(1, min(int(limit), 1000))
+        offset = max(0, int(offset))
+        now = time.time()
+        conn = self.connect()
+
+        current_row = None
+        if current_email:
+            current_row = conn.execute(
+                "SELECT email, data, sealed, expires_at, sub, token_type FROM accounts WHERE email = ?",
+                (current_email,)
+            ).fetchone()
+        pinned = 1 if current_row is not None else 0
+
+        # 虚拟列表为 [当前账户] + 其余账户按紧急程度排序
+        rows = []
+        if pinned and offset == 0:
+            rows.append(current_row)
+        other_offset = max(0, offset - pinned)
+        other_limit = limit - len(rows)
+        if other_limit > 0:
+            rows.extend(conn.execute("""
+                SELECT email, data, sealed, expires_at, sub, token_type FROM accounts
+                WHERE email IS NOT ?
+                ORDER BY expires_at IS NULL, expires_at, email
+                LIMIT ? OFFSET ?
+            """, (current_email if pinned else None, other_limit, other_offset)).fetchall())
+
+        total = conn.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+        accounts = []
+        for row in rows:
+            account = self._row_to_account(row)
+            account["expiryInfo"] = self._expiry_info(row, now)
+            accounts.append(account)
+        return {
+            "accounts": accounts,
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "currentPinned": bool(pinned),
+            "hasMore": offset + len(rows) < total
+        }
+
+    def _save_auth_snapshot(self, conn: sqlite3.Connection, account: Dict[str, Any]) -> Optional[List[List[str]]]:
+        """
+        预先生成切换客户端账户时要写入的cursorAuth行，与账户在同一事务中保存
+
+        保险库启用时快照同样加密。账户没有token时删除旧快照，返回None。
+        """
+        try:
+            values = ClientAuthWriter.build_values(account)
+        except ValueError:
+            conn.execute("DELETE FROM auth_snapshots WHERE email = ?", (account["email"],))
+            return None
+        rows = [[key, value] for key, value in values.items()]
+        if self.vault.enabled:
+            plain, sealed = None, self.vault.seal({"rows": rows}, account["email"])
+        else:
+            plain, sealed = json.dumps(rows, ensure_ascii=False), None
+        conn.execute(
+            "INSERT OR REPLACE INTO auth_snapshots (email, rows, sealed, built_at) VALUES (?, ?, ?, ?)",
+            (account["email"], plain, sealed, time.time())
+        )
+        return rows
+
+    @HostMetrics.timed("db")
+    def get_auth_snapshot(self, email: Optional[str] = None, userid: Optional[str] = None) -> Optional[List[List[str]]]:
+        """读取账户的cursorAuth快照（[[key, value], ...]）；旧数据没有快照时现场生成并保存"""
+        conn = self.connect()
+        if not email and userid:
+            row = conn.execute(
+                "SELECT email FROM accounts WHERE userid = ? ORDER BY updated_at DESC LIMIT 1", (userid,)
+            ).fetchone()
+            email = row["email"] if row else None
+        if not email:
+            return None
+
+        row = conn.execute("SELECT rows, sealed FROM auth_snapshots WHERE email = ?", (email,)).fetchone()
+        if row is not None:
+            if row["sealed"] is not None:
+                return self.vault.open(row["sealed"], email)["rows"]
+            if row["rows"] is not None:
+                return json.loads(row["rows"])
+
+        account = self.get(email=email, reveal=True)
+        if account is None:
+            return None
+        with conn:
+            return self._save_auth_snapshot(conn, account)
+
+    @HostMetrics.timed("db")
+    def seal_existing(self, batch_size: int = 200) -> int:
+        """把尚未加密的账户行逐条加密，返回处理的行数"""
+        if not self.vault.enabled:
+            raise VaultError("保险库尚未启用")
+        conn = self.connect()
+        sealed_count = 0
+        while True:
+            rows = conn.execute(
+                "SELECT email, data FROM accounts WHERE sealed IS NULL LIMIT ?", (batch_size,)
+            ).fetchall()
+            if not rows:
+                return sealed_count
+            with conn:
+                for row in rows:
+                    data, sealed = self._split_secrets(json.loads(row["data"]))
+                    conn.execute("UPDATE accounts SET data = ?, sealed = ? WHERE email = ?",
+                                 (json.dumps(data, ensure_ascii=False), sealed, row["email"]))
+                # 明文快照直接丢弃，下次切换时按加密方式重新生成
+                conn.execute("DELETE FROM auth_snapshots WHERE sealed IS NULL")
+            sealed_count += len(rows)
+
+    @HostMetrics.timed("db")
+    def vault_status(self) -> Dict[str, Any]:
+        conn = self.connect()
+        sealed, plaintext = conn.execute(
+            "SELECT COUNT(sealed), COUNT(*) - COUNT(sealed) FROM accounts"
+        ).fetchone()
+        return {
+            "enabled": self.vault.enabled,
+            "backend": self.vault.backend,
+            "cryptographyAvailable": CRYPTOGRAPHY_AVAILABLE,
+            "keyringAvailable": KEYRING_AVAILABLE,
+            "sealedCount": sealed,
+            "plaintextCount": plaintext
+        }
+
+    @HostMetrics.timed("db")
+    def delete(self, email: Optional[str] = None, userid: Optional[str] = None, delete_all: bool = False) -> int:
+        """删除账户，返回删除的行数"""
+        conn = self.connect()
+        with conn:
+            if delete_all:
+                cursor = conn.execute("DELETE FROM accounts")
+            elif email and userid:
+                cursor = conn.execute("DELETE FROM accounts WHERE email = ? AND userid = ?", (email, userid))
+            elif email:
+                cursor = conn.execute("DELETE FROM accounts WHERE email = ?", (email,))
+            elif userid:
+                cursor = conn.execute("DELETE FROM accounts WHERE userid = ?", (userid,))
+            else:
+                raise ValueError("需要提供email或userid")
+            conn.execute("DELETE FROM auth_snapshots WHERE email NOT IN (SELECT email FROM accounts)")
+        return cursor.rowcount
+
+
+class AccountImporter:
+    """
+    NDJSON账户流式导入
+
+    按块喂入文本，逐行校验，并按email和userid去重（同一次导入中先出现的保留）；
+    每满一批在单个事务中写入。去重集合存放在临时SQLite库（可落盘）中，内存占用与导入规模无关。
+    """
+
+    BATCH_SIZE = 200
+    MAX_LINE_CHARS = 1024 * 1024
+    MAX_REPORTED_ERRORS = 20
+
+    def __init__(self, store: AccountStore, dry_run: bool = False):
+        self.store = store
+        self.dry_run = dry_run
+        self._seen = sqlite3.connect("")
+        self._seen.executescript("""
+            CREATE TABLE seen_email (value TEXT PRIMARY KEY);
+            CREATE TABLE seen_userid (value TEXT PRIMARY KEY);
+        """)
+        self._carry = ""
+        self._skipping_long_line = False
+        self._batch: List[Dict[str, Any]] = []
+        self.line_number = 0
+        self.stats = {"lines": 0, "created": 0, "updated": 0, "duplicates": 0, "invalid": 0}
+        self.errors: List[Dict[str, Any]] = []
+
+    def _record_error(self, reason: str) -> None:
+        self.stats["invalid"] += 1
+        if len(self.errors) < self.MAX_REPORTED_ERRORS:
+            self.errors.append({"line": self.line_number, "error": reason})
+
+    @staticmethod
+    def _validate(record: Any) -> Optional[str]:
+        """返回错误原因，合法时返回None"""
+        if not isinstance(record, dict):
+            return "不是JSON对象"
+        email = record.get("email")
+        if not isinstance(email, str) or "@" not in email:
+            return "email缺失或格式不正确"
+        if not isinstance(record.get("userid"), str) or not record["userid"]:
+            return "userid缺失"
+        if not record.get("accessToken") and not record.get("WorkosCursorSessionToken"):
+            return "缺少accessToken或WorkosCursorSessionToken"
+        return None
+
+    def _is_duplicate(self, email: str, userid: str) -> bool:
+        email_key = email.strip().lower()
+        seen = self._seen.execute(
+            "SELECT EXISTS(SELECT 1 FROM seen_email WHERE value = ?) OR "
+            "EXISTS(SELECT 1 FROM seen_userid WHERE value = ?)", (email_key, userid)
+        ).fetchone()[0]
+        if seen:
+            return True
+        self._seen.execute("INSERT INTO seen_email (value) VALUES (?)", (email_key,))
+        self._seen.execute("INSERT OR IGNORE INTO seen_userid (value) VALUES (?)", (userid,))
+        return False
+
+    def _process_line(self, line: str) -> None:
+        self.line_number += 1
+        line = line.strip()
+        if not line:
+            return
+        self.stats["lines"] += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            self._record_error(f"JSON解析失败: {e}")
+            return
+        reason = self._validate(record)
+        if reason:
+            self._record_error(reason)
+            return
+        if self._is_duplicate(record["email"], record["userid"]):
+            self.stats["duplicates"] += 1
+            return
+        self._batch.append(record)
+        if len(self._batch) >= self.BATCH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._batch:
+            return
+        if self.dry_run:
+            self.stats["created"] += len(self._batch)
+        else:
+            result = self.store.upsert_many(self._batch)
+            self.stats["created"] += result["created"]
+            self.stats["updated"] += result["updated"]
+        self._batch = []
+
+    def feed(self, text: str) -> None:
+        """喂入一段文本（可在任意位置截断，不完整的行留到下一块）"""
+        lines = (self._carry + text).split("\n")
+        self._carry = lines.pop()
+        for line in lines:
+            if self._skipping_long_line:
+                # 超长行的剩余部分，到换行为止整体丢弃
+                self._skipping_long_line = False
+                self.line_number += 1
+                continue
+            self._process_line(line)
+        if len(self._carry) > self.MAX_LINE_CHARS:
+            self.stats["lines"] += 1
+            self._record_error(f"单行超过{self.MAX_LINE_CHARS}个字符")
+            self._carry = ""
+            self._skipping_long_line = True
+
+    def finish(self) -> Dict[str, Any]:
+        """处理剩余内容并写入最后一批，返回导入统计"""
+        if self._carry and not self._skipping_long_line:
+            self._process_line(self._carry)
+        self._carry = ""
+        self._flush()
+        self._seen.close()
+        return {**self.stats, "errors": self.errors, "dryRun": self.dry_run}
+
+
+class ClientAuthWriter:
+    """
+    写入Cursor客户端登录状态（state.vscdb中ItemTable的cursorAuth/*键）
+
+    - 所有键值在事务外准备好，BEGIN IMMEDIATE 事务里只做重新读取旧值和一次批量写入，持锁时间尽量短；
+    - 等待Cursor自身写锁的时间有上限（lock_timeout），超时返回 CLIENT_DB_BUSY；
+    - 写入前的旧值在加锁前暂存为临时文件，COMMIT成功后才替换备份文件，rollback() 用同样的短事务一次写回。
+    """
+
+    AUTH_KEYS = (
+        "cursorAuth/accessToken",
+        "cursorAuth/refreshToken",
+        "cursorAuth/cachedEmail",
+        "cursorAuth/cachedSignUpType"
+    )
+    BACKUP_FILE = "client_auth_backup.json"
+
+    def __init__(self, db_path: Optional[str] = None, backup_path: Optional[str] = None,
+                 lock_timeout: float = 2.0):
+        self._db_path = db_path
+        self._backup_path = backup_path
+        self.lock_timeout = lock_timeout
+
+    @property
+    def db_path(self) -> str:
+        if self._db_path is None:
+            self._db_path = CursorDataManager.get_cursor_db_path()
+        return self._db_path
+
+    @property
+    def backup_path(self) -> str:
+        if self._backup_path is None:
+            self._backup_path = HostPaths.file(self.BACKUP_FILE)
+        return self._backup_path
+
+    @classmethod
+    def build_values(cls, account: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        """根据账户生成要写入的cursorAuth键值"""
+        access_token = account.get("accessToken")
+        if not access_token and "%3A%3A" in (account.get("WorkosCursorSessionToken") or ""):
+            access_token = account["WorkosCursorSessionToken"].split("%3A%3A", 1)[1]
+        if not access_token:
+            raise ValueError("账户缺少accessToken")
+        return {
+            "cursorAuth/accessToken": access_token,
+            # 客户端用refreshToken续期；深度token没有单独的refreshToken时与accessToken相同
+            "cursorAuth/refreshToken": account.get("refreshToken") or access_token,
+            "cursorAuth/cachedEmail": account.get("email"),
+            "cursorAuth/cachedSignUpType": "Auth_0"
+        }
+
+    @staticmethod
+    def _select(conn: sqlite3.Connection, keys: List[str]) -> Dict[str, Optional[str]]:
+        rows = conn.execute(
+            f"SELECT key, value FROM ItemTable WHERE key IN ({','.join('?' * len(keys))})", keys
+        ).fetchall()
+        current: Dict[str, Optional[str]] = {key: None for key in keys}
+        current.update({key: value for key, value in rows})
+        return current
+
+    @HostMetrics.timed("db")
+    def _write(self, values: Dict[str, Optional[str]], backup: bool = False) -> Dict[str, Any]:
+        """
+        在一个BEGIN IMMEDIATE事务中写入键值（值为None表示删除该键）
+
+        backup为True时在加锁前读取旧值并写入临时备份文件，COMMIT成功后才替换正式备份，
+        加锁超时或写入失败时丢弃临时文件，上一次切换留下的备份保持不变。
+        持锁后总会重新读取旧值（只是一次查询），与加锁前不同则COMMIT后按持锁时的值重写备份，
+        备份记录的始终是实际被覆盖的值。
+        返回等待与持锁耗时及写入前的旧值（previous）。
+        """
+        if not os.path.exists(self.db_path):
+            raise FileNotFoundError(f"文件不存在: {self.db_path}")
+        keys = list(values)
+        upserts = [(key, value) for key, value in values.items() if value is not None]
+        deletes = [(key,) for key, value in values.items() if value is None]
+
+        conn = sqlite3.connect(self.db_path, timeout=self.lock_timeout, isolation_level=None)
+        staged: Optional[str] = None
+        try:
+            before = self._select(conn, keys)
+            staged = self._stage_backup(before) if backup else None
+            started = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            locked = time.perf_counter()
+            try:
+                previous = self._select(conn, keys)
+                conn.executemany("INSERT OR REPLACE INTO ItemTable (key, value) VALUES (?, ?)", upserts)
+                if deletes:
+                    conn.executemany("DELETE FROM ItemTable WHERE key = ?", deletes)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            finished = time.perf_counter()
+        except BaseException:
+            if staged:
+                self._discard_backup(staged)
+            raise
+        finally:
+            conn.close()
+
+        if staged:
+            if previous != before:
+                # 读取与加锁之间Cursor改写了这些键，备份应记录实际被覆盖的值
+                self._discard_backup(staged)
+                staged = self._stage_backup(previous)
+            self._commit_backup(staged)
+        return {
+            "waitedMs": round((locked - started) * 1000, 3),
+            "lockHeldMs": round((finished - locked) * 1000, 3),
+            "previous": previous
+        }
+
+    @HostMetrics.timed("file")
+    def _stage_backup(self, previous: Dict[str, Optional[str]]) -> str:
+        """把旧值写入临时备份文件并落盘，返回临时文件路径"""
+        tmp_path = f"{self.backup_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"savedAt": time.time(), "dbPath": self.db_path, "values": previous}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp_path
+
+    def _commit_backup(self, tmp_path: str) -> None:
+        os.replace(tmp_path, self.backup_path)
+
+    @staticmethod
+    def _discard_backup(tmp_path: str) -> None:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    def _apply(self, values: Dict[str, Optional[str]], backup: bool) -> Dict[str, Any]:
+        result = self._write(values, backup=backup)
+        previous = result.pop("previous")
+        return {
+            **result,
+            "keys": list(values),
+            "previousEmail": previous.get("cursorAuth/cachedEmail"),
+            "backupSaved": backup
+        }
+
+    def apply(self, account: Dict[str, Any], backup: bool = True) -> Dict[str, Any]:
+        """把账户写入客户端，返回耗时及写入前的登录邮箱"""
+        return self._apply(self.build_values(account), backup)
+
+    def apply_snapshot(self, rows: List[List[str]], backup: bool = True) -> Dict[str, Any]:
+        """
+        用预生成的快照切换客户端账户
+
+        省去的是解密账户和生成键值，写入路径与 apply() 相同（持锁后重新读取旧值）。
+        """
+        return {**self._apply({key: value for key, value in rows}, backup), "fromSnapshot": True}
+
+    def rollback(self) -> Dict[str, Any]:
+        """把最近一次写入前的旧值写回，成功后删除备份"""
+        try:
+            with open(self.backup_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            raise ValueError("没有可回滚的客户端登录备份")
+        timing = self._write(saved["values"])
+        timing.pop("previous")
+        os.remove(self.backup_path)
+        return {**timing, "restoredEmail": saved["values"].get("cursorAuth/cachedEmail"),
+                "savedAt": datetime.fromtimestamp(saved["savedAt"]).isoformat()}
+
+
+def record_token_history(token: str, userid: Optional[str] = None, email: Optional[str] = None) -> None:
+    """把从客户端读到的token记入历史日志；日志写入失败不影响读取结果"""
+    try:
+        TokenHistoryLog.shared().observe(token, userid=userid, email=email)
+    except Exception as e:
+        HostLogger.shared().warning("写入token历史失败: %s", e)
+
+
 class GetAccessTokenHandler(BaseActionHandler):
     """获取AccessToken处理器"""
 
     def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
         # params参数保留用于未来扩展，当前不使用
         _ = params  # 显式标记参数已知但未使用
-        return CursorDataManager.read_access_token()
+        result = CursorDataManager.read_access_token()
+        if result.get("accessToken"):
+            record_token_history(result["accessToken"])
+        return result
 
 
 class GetScopeDataHandler(BaseActionHandler):
@@ -647,7 +3692,7 @@ class GetDeepTokenHandler(BaseActionHandler):
                 "createdTime": created_time.isoformat(),
                 "tokenType": "client",
                 "needBrowserAction": True,  # 标识需要浏览器操作
-                "deepLoginUrl": f"https://www.cursor.com/cn/loginDeepControl"
+                "deepLoginUrl": CursorEndpoints.deep_login_url()
             }
 
 
@@ -721,6 +3766,10 @@ class GetClientCurrentDataHandler(BaseActionHandler):
                 "component": "userid"
             }
 
+        # 解码token声明（sub、exp、剩余时间），随响应一起返回
+        token_info = JWTClaimsDecoder.shared().describe(access_token)
+        record_token_history(access_token, userid=userid, email=email)
+
         # 根据模式处理
         if mode == "client":
             # 返回客户端token（不预设有效期）
@@ -733,6 +3782,7 @@ class GetClientCurrentDataHandler(BaseActionHandler):
                 "WorkosCursorSessionToken": f"{userid}%3A%3A{access_token}",
                 "createdTime": created_time.isoformat(),
                 "tokenType": "client",
+                "tokenInfo": token_info,
                 "success": True
             }
         #
@@ -763,7 +3813,8 @@ class GetClientCurrentDataHandler(BaseActionHandler):
                 "createdTime": created_time.isoformat(),
                 "tokenType": "client",
                 "needBrowserAction": True,
-                "deepLoginUrl": f"https://www.cursor.com/cn/loginDeepControl",
+                "deepLoginUrl": CursorEndpoints.deep_login_url(),
+                "tokenInfo": token_info,
                 "success": True
             }
         else:
@@ -838,6 +3889,796 @@ class TestConnectionHandler(BaseActionHandler):
             }
 
 
+class DecodeTokensHandler(BaseActionHandler):
+    """批量解码JWT声明处理器"""
+
+    MAX_TOKENS = 1000
+
+    def __init__(self, decoder: Optional[JWTClaimsDecoder] = None):
+        self.decoder = decoder or JWTClaimsDecoder.shared()
+
+    def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params应包含:
+        - tokens: list[str], 待解码的token列表（最多1000个）
+
+        返回与输入顺序一致的 sub、exp 和剩余时间，不回传token原文
+        """
+        tokens = params.get("tokens")
+        if not isinstance(tokens, list):
+            return {"success": False, "error": "tokens参数应为数组"}
+        if len(tokens) > self.MAX_TOKENS:
+            return {"success": False, "error": f"单次最多解码 {self.MAX_TOKENS} 个token"}
+        return {
+            "success": True,
+            "results": self.decoder.describe_many([t if isinstance(t, str) else "" for t in tokens])
+        }
+
+
+class AuditAccountsHandler(BaseActionHandler):
+    """
+    账户健康检查处理器（仅使用本地数据：JWT声明 + 客户端数据库）
+
+    分类是纯Python的CPU计算，受GIL限制放进线程池也不会更快，所以单次遍历完成。
+    """
+
+    def __init__(self, store: Optional[AccountStore] = None, decoder: Optional[JWTClaimsDecoder] = None):
+        self._store = store
+        self.decoder = decoder or JWTClaimsDecoder.shared()
+
+    @staticmethod
+    def _account_token(account: Dict[str, Any]) -> Optional[str]:
+        token = account.get("accessToken")
+        if not token and "%3A%3A" in (account.get("WorkosCursorSessionToken") or ""):
+            token = account["WorkosCursorSessionToken"].split("%3A%3A", 1)[1]
+        return token
+
+    @staticmethod
+    def _set_expiry(result: Dict[str, Any], exp: int, now: float, soon_seconds: float) -> None:
+        remaining = int(exp - now)
+        result.update({
+            "exp": exp,
+            "remainingDays": max(0, -(-remaining // 86400)),  # 向上取整，与describe一致
+            "status": "expired" if remaining <= 0
+            else "expiring_soon" if remaining < soon_seconds
+            else "valid"
+        })
+
+    def _classify_account(self, index: int, account: Any, now: float, soon_seconds: float) -> Dict[str, Any]:
+        """按token本身分类单个账户"""
+        result: Dict[str, Any] = {"index": index, "flags": []}
+        if not isinstance(account, dict):
+            result.update({"status": "malformed", "reason": "账户记录不是对象"})
+            return result
+
+        # 字段类型异常的记录单独标为malformed，不能让一条坏记录导致整个检查失败
+        bad_fields = [field for field in ("email", "userid", "accessToken", "WorkosCursorSessionToken")
+                      if account.get(field) is not None and not isinstance(account[field], str)]
+        if bad_fields:
+            result.update({"status": "malformed", "reason": f"字段类型错误: {', '.join(bad_fields)}"})
+            return result
+
+        result["email"] = account.get("email")
+        token = self._account_token(account)
+        info = self.decoder.describe(token or "", now)
+        result["userid"] = info.get("userid") or account.get("userid")
+        result["digest"] = self.decoder.digest(token) if token else None
+
+        if not result["email"]:
+            result.update({"status": "malformed", "reason": "缺少email"})
+        elif not info["valid"]:
+            result.update({"status": "malformed", "reason": "accessToken不是有效的JWT", "detail": info["error"]})
+        elif info["exp"] is None:
+            result.update({"status": "malformed", "reason": "JWT缺少exp"})
+        else:
+            self._set_expiry(result, info["exp"], now, soon_seconds)
+            if account.get("userid") and info["userid"] and account["userid"] != info["userid"]:
+                result["flags"].append("userid_mismatch")
+        return result
+
+    def _classify_store(self, store: AccountStore, now: float, soon_seconds: float,
+                        client_userid: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        按账户存储中预解码的过期时间和sub分类，不解密账户
+
+        只有两种情况解密单行：预解码列缺失（需要检查token格式并给出原因），
+        或与客户端是同一用户（需要比较token摘要判断是否为客户端当前账户）。
+        """
+        results = []
+        for index, row in enumerate(store.iter_claims()):
+            if row["exp"] is None or row["sub"] is None:
+                account = store.get(email=row["email"], reveal=True) or row["metadata"]
+                results.append(self._classify_account(index, account, now, soon_seconds))
+                continue
+
+            metadata = row["metadata"]
+            userid = row["sub"].split("|")[-1]
+            result: Dict[str, Any] = {"index": index, "flags": [], "email": row["email"], "userid": userid}
+            if metadata.get("userid") is not None and not isinstance(metadata["userid"], str):
+                result.update({"status": "malformed", "reason": "字段类型错误: userid"})
+                results.append(result)
+                continue
+            self._set_expiry(result, row["exp"], now, soon_seconds)
+            if metadata.get("userid") and metadata["userid"] != userid:
+                result["flags"].append("userid_mismatch")
+            if client_userid and userid == client_userid:
+                token = self._account_token(store.get(email=row["email"], reveal=True) or {})
+                result["digest"] = self.decoder.digest(token) if token else None
+            results.append(result)
+        return results
+
+    def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params可包含:
+        - accounts: list, 要检查的账户列表（默认读取账户存储中的全部账户）
+        - expiringSoonDays: float, 剩余多少天内视为即将过期，默认7
+        - checkClient: bool, 是否对比客户端当前token，默认True
+
+        每个账户的status为 valid / expiring_soon / expired / malformed，
+        flags中可能包含 duplicate_userid、client_current、same_user_as_client、userid_mismatch；
+        检查账户存储时按预解码的列分类，只解密确有需要的行（见_classify_store）
+        """
+        started = time.perf_counter()
+        accounts = params.get("accounts")
+        if accounts is not None and not isinstance(accounts, list):
+            return {"success": False, "error": "accounts参数应为数组"}
+
+        soon_seconds = float(params.get("expiringSoonDays", 7)) * 86400
+        now = time.time()
+        client_result = CursorDataManager.read_access_token() if params.get("checkClient", True) else None
+        client_token = client_result.get("accessToken") if client_result else None
+        client_userid = self.decoder.describe(client_token, now).get("userid") if client_token else None
+
+        if accounts is None:
+            try:
+                results = self._classify_store(self._store or AccountStore(), now, soon_seconds, client_userid)
+            except (sqlite3.Error, VaultError) as e:
+                return {"success": False, "error": f"读取账户存储失败: {str(e)}"}
+        else:
+            results = [self._classify_account(index, account, now, soon_seconds)
+                       for index, account in enumerate(accounts)]
+
+        # 重复userid
+        by_userid: Dict[str, List[Dict[str, Any]]] = {}
+        for result in results:
+            if result.get("userid"):
+                by_userid.setdefault(result["userid"], []).append(result)
+        for group in by_userid.values():
+            if len(group) > 1:
+                for result in group:
+                    result["flags"].append("duplicate_userid")
+
+        # 与客户端当前token对比
+        client: Dict[str, Any] = {"checked": client_result is not None}
+        if client_result is not None:
+            if client_token:
+                client_digest = self.decoder.digest(client_token)
+                client.update({"available": True, "userid": client_userid})
+                for result in results:
+                    if result.get("digest") == client_digest:
+                        result["flags"].append("client_current")
+                    elif client_userid and result.get("userid") == client_userid:
+                        result["flags"].append("same_user_as_client")
+            else:
+                client.update({"available": False, "error": client_result.get("error")})
+
+        summary = {"total": len(results), "valid": 0, "expiring_soon": 0, "expired": 0, "malformed": 0,
+                   "duplicate_userid": 0, "client_current": 0}
+        for result in results:
+            summary[result["status"]] += 1
+            for flag in ("duplicate_userid", "client_current"):
+                if flag in result["flags"]:
+                    summary[flag] += 1
+            result.pop("digest", None)
+
+        return {
+            "success": True,
+            "summary": summary,
+            "results": results,
+            "client": client,
+            "elapsedMs": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+
+class GetAccountUsageHandler(BaseActionHandler):
+    """批量查询账户用量/会员信息处理器"""
+
+    def __init__(self, store: Optional[AccountStore] = None, service: Optional[UsageService] = None):
+        self._store = store
+        self.service = service or UsageService()
+
+    def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params可包含:
+        - accounts: list, 要查询的账户（需含userid和accessToken）；默认按email分页读取账户存储
+        - offset: int, 读取账户存储时的偏移，默认0
+        - limit: int, 读取账户存储时的每页数量，默认200，最大1000
+        - maxAge: float, 缓存有效秒数，默认300；超过后条件请求刷新
+        - refreshWait: float, 等待过期缓存刷新的秒数，默认2；超时的先返回旧数据
+        - concurrency: int, 无缓存账户的并发拉取数，默认4，最大16
+        - forceRefresh: bool, 忽略缓存同步拉取
+
+        读取账户存储时响应附带 total / offset / hasMore，调用方按offset翻页直到hasMore为false
+        """
+        accounts = params.get("accounts")
+        page: Dict[str, Any] = {}
+        reveal: Optional[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]] = None
+        if accounts is None:
+            store = self._store or AccountStore()
+            try:
+                # 只读元数据，需要拉取或刷新的账户再逐个解密
+                listing = store.list(offset=params.get("offset", 0), limit=params.get("limit", 200),
+                                     sort_by="email", order="asc")
+            except (sqlite3.Error, VaultError) as e:
+                return {"success": False, "error": f"读取账户存储失败: {str(e)}"}
+            except (TypeError, ValueError) as e:
+                return {"success": False, "error": f"分页参数无效: {str(e)}"}
+            accounts = listing.pop("accounts")
+            page = listing
+
+            def reveal(account: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+                return store.get(email=account.get("email"), reveal=True)
+        if not isinstance(accounts, list):
+            return {"success": False, "error": "accounts参数应为数组"}
+
+        started = time.perf_counter()
+        results = self.service.lookup_many(
+            accounts,
+            ttl=float(params.get("maxAge", UsageService.DEFAULT_TTL)),
+            concurrency=int(params.get("concurrency", 4)),
+            force_refresh=bool(params.get("forceRefresh", False)),
+            refresh_wait=float(params.get("refreshWait", UsageService.DEFAULT_REFRESH_WAIT)),
+            reveal=reveal
+        )
+        sources: Dict[str, int] = {}
+        for result in results:
+            sources[result["source"]] = sources.get(result["source"], 0) + 1
+        return {
+            "success": True,
+            "results": results,
+            "sources": sources,
+            **page,
+            "backgroundRefreshes": BackgroundWork.pending(),
+            "elapsedMs": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+
+class GetTokenHistoryHandler(BaseActionHandler):
+    """查询某用户出现过的token（历史日志）处理器"""
+
+    MAX_LIMIT = 500
+
+    def __init__(self, store: Optional[AccountStore] = None, history: Optional[TokenHistoryLog] = None):
+        self._store = store
+        self.history = history or TokenHistoryLog.shared()
+
+    def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params应包含:
+        - userid: str；或 email: str（通过账户存储查找userid）
+        可选:
+        - limit: int, 默认50，最大500
+        - compact: bool, 查询前压缩日志
+
+        记录中只有token的SHA-256摘要（前32位），不含token原文
+        """
+        userid = params.get("userid")
+        if not userid and params.get("email"):
+            try:
+                account = (self._store or AccountStore()).get(email=params["email"])
+            except sqlite3.Error as e:
+                return {"success": False, "error": f"读取账户存储失败: {str(e)}"}
+            userid = account.get("userid") if account else None
+            if not userid:
+                return {"success": False, "error": "账户不存在", "errorCode": "NOT_FOUND"}
+        if not userid:
+            return {"success": False, "error": "需要提供userid或email"}
+
+        limit = max(1, min(int(params.get("limit", 50)), self.MAX_LIMIT))
+        try:
+            compaction = self.history.compact() if params.get("compact") is True else None
+            records = self.history.query(userid, limit)
+        except OSError as e:
+            return {"success": False, "error": f"读取token历史失败: {str(e)}"}
+
+        now = time.time()
+        for record in records:
+            record["firstSeenTime"] = datetime.fromtimestamp(record["firstSeen"]).isoformat()
+            record["isExpired"] = record["exp"] <= now if record.get("exp") else None
+        response = {"success": True, "userid": userid, "records": records, "stats": self.history.stats()}
+        if compaction:
+            response["compaction"] = compaction
+        return response
+
+
+class GetMetricsHandler(BaseActionHandler):
+    """运行指标查询处理器"""
+
+    def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params可包含:
+        - aggregate: bool, 是否汇总指标文件中历次启动的记录，默认True
+
+        每个action返回 count、errors、meanMs、maxMs、p50/p90/p99（分桶上界估算）、
+        直方图（各桶计数，桶上界见bucketsMs）以及 db / file / http 子阶段的次数与累计耗时；
+        pollClient 为 auth/poll 轮询按主机的延迟分位数、最近对冲比例及对冲计数（跨进程持久化）
+        """
+        return {
+            "success": True,
+            **HostMetrics.shared().snapshot(include_files=params.get("aggregate", True) is not False),
+            "pollClient": DeepTokenPollClient.shared().stats()
+        }
+
+
+class ListProfilesHandler(BaseActionHandler):
+    """性能剖析文件列表处理器"""
+
+    def __init__(self, profiler: Optional[RequestProfiler] = None):
+        self.profiler = profiler or RequestProfiler.shared()
+
+    def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params可包含:
+        - action: str, 只列出该action的剖析
+        - limit: int, 最多返回个数，默认50
+        - top: int, 附带每个文件累计耗时最高的前N个函数，默认0（不解析文件）
+
+        剖析由环境变量 CURSOR_PROFILE 开启，文件可用 python3 -m pstats 打开或用snakeviz查看
+        """
+        try:
+            limit = max(1, int(params.get("limit", 50)))
+            top = max(0, min(int(params.get("top", 0)), 100))
+        except (TypeError, ValueError):
+            return {"success": False, "error": "limit和top必须为整数"}
+        return {
+            "success": True,
+            "enabledFor": sorted(self.profiler.actions),
+            "keep": self.profiler.keep,
+            "directory": self.profiler.directory,
+            "profiles": self.profiler.list(params.get("action") or None, limit, top)
+        }
+
+
+class MemoryHandler(BaseActionHandler):
+    """内存分析处理器基类"""
+
+    def __init__(self, inspector: Optional[MemoryInspector] = None):
+        self.inspector = inspector or MemoryInspector.shared()
+
+    def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        tracing = params.get("tracing")
+        if tracing is False:
+            self.inspector.stop()
+        elif tracing is True:
+            self.inspector.start(int(params.get("frames", 1)))
+        if params.get("collect") is True:
+            import gc
+            gc.collect()
+
+        key_type = params.get("keyType", "lineno")
+        if key_type not in MemoryInspector.KEY_TYPES:
+            return {"success": False, "error": f"keyType必须为 {' / '.join(MemoryInspector.KEY_TYPES)} 之一"}
+        limit = max(0, min(int(params.get("limit", 20)), 200))
+
+        response: Dict[str, Any] = {"success": True}
+        if self.inspector.tracing():
+            try:
+                response.update(self.analyze(params, limit, key_type))
+            except KeyError as e:
+                return {"success": False, "error": str(e.args[0]), "errorCode": "SNAPSHOT_NOT_FOUND",
+                        "suggestions": ["先调用 memorySnapshot 拍摄基准快照", f"最多保留最近 {MemoryInspector.MAX_SNAPSHOTS} 个快照"]}
+        elif tracing is not False:
+            response["hint"] = "tracemalloc未开启，传入 tracing: true 开始跟踪（之后的分配才会被记录）"
+        response.update(self.inspector.status())
+        return response
+
+    @abstractmethod
+    def analyze(self, params: Dict[str, Any], limit: int, key_type: str) -> Dict[str, Any]:
+        """跟踪开启时执行具体分析"""
+
+
+class MemorySnapshotHandler(MemoryHandler):
+    """内存快照处理器"""
+
+    def analyze(self, params: Dict[str, Any], limit: int, key_type: str) -> Dict[str, Any]:
+        """
+        params可包含:
+        - tracing: bool, 开启/关闭tracemalloc（关闭时丢弃已有快照）
+        - frames: int, 开启时每次分配保存的调用栈帧数，默认1
+        - collect: bool, 拍摄前先执行一次完整GC
+        - label: str, 快照标签
+        - limit: int, 返回分配最多的位置个数，默认20
+        - keyType: 'lineno' | 'filename' | 'traceback'，默认lineno
+
+        未开启跟踪时只返回RSS和GC统计
+        """
+        return self.inspector.snapshot(str(params.get("label", "")), limit, key_type)
+
+
+class MemoryDiffHandler(MemoryHandler):
+    """内存增长对比处理器"""
+
+    def analyze(self, params: Dict[str, Any], limit: int, key_type: str) -> Dict[str, Any]:
+        """
+        params可包含:
+        - baseline: int, 作为基准的快照ID，默认最近一个
+        - 其余参数同 memorySnapshot；本次拍摄的快照也会保存，可作为下次对比的基准
+        """
+        baseline = params.get("baseline")
+        return self.inspector.diff(int(baseline) if baseline is not None else None, limit, key_type,
+                                   str(params.get("label", "")))
+
+
+class DumpLogsHandler(BaseActionHandler):
+    """返回最近日志处理器"""
+
+    def __init__(self, logger: Optional[HostLogger] = None):
+        self.logger = logger or HostLogger.shared()
+
+    def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params可包含:
+        - limit: int, 最多返回条数，默认200
+        - level: 'DEBUG' | 'INFO' | 'WARNING' | 'ERROR'，最低级别，默认DEBUG
+        - includeFile: bool, 同时返回日志文件末尾的行（记录之前启动的进程），默认False
+        """
+        limit = max(1, min(int(params.get("limit", 200)), HostLogger.RING_SIZE))
+        min_level = HostLogger.parse_level(params.get("level")) or HostLogger.DEBUG
+        response: Dict[str, Any] = {
+            "success": True,
+            "level": HostLogger.LEVEL_NAMES.get(self.logger.level),
+            "fileLogging": self.logger.write_to_file,
+            "entries": self.logger.recent(limit, min_level)
+        }
+        if params.get("includeFile") is True:
+            response["logFile"] = self.logger.file_path
+            response["fileTail"] = self.logger.tail_file(limit)
+        return response
+
+
+class AccountStoreHandler(BaseActionHandler):
+    """账户存储处理器基类，统一处理数据库异常"""
+
+    def __init__(self, store: Optional[AccountStore] = None):
+        self._store = store
+
+    @property
+    def store(self) -> AccountStore:
+        if self._store is None:
+            self._store = AccountStore()
+        return self._store
+
+    def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return self.handle_store(params)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        except VaultError as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "errorCode": "VAULT_ERROR",
+                "suggestions": [
+                    "安装加密依赖: pip3 install cryptography",
+                    f"确认密钥文件或系统钥匙串中的密钥未被删除: {HostPaths.data_dir()}"
+                ]
+            }
+        except sqlite3.Error as e:
+            return {
+                "success": False,
+                "error": f"账户数据库错误: {str(e)}",
+                "suggestions": [
+                    "稍后重试",
+                    f"检查数据目录权限: {HostPaths.data_dir()}"
+                ],
+                "technical_error": str(e)
+            }
+
+    @abstractmethod
+    def handle_store(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        pass
+
+
+class UpsertAccountHandler(AccountStoreHandler):
+    """保存账户处理器"""
+
+    def handle_store(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params应包含:
+        - account: dict, 单个账户；或
+        - accounts: list, 批量账户（用于从chrome.storage迁移），在单个事务中写入；
+          缺少email的条目不写入，按原下标在rejected中返回，由调用方保留
+        """
+        accounts = params.get("accounts")
+        if accounts is None:
+            account = params.get("account")
+            if not isinstance(account, dict):
+                return {"success": False, "error": "缺少account参数"}
+            result = self.store.upsert(account)
+            return {"success": True, "created": result["created"], "email": account.get("email"),
+                    "sealed": self.store.vault.enabled}
+
+        if not isinstance(accounts, list):
+            return {"success": False, "error": "accounts参数应为数组"}
+        valid = []
+        rejected = []
+        for index, account in enumerate(accounts):
+            if not isinstance(account, dict):
+                rejected.append({"index": index, "error": "账户应为对象"})
+            elif not isinstance(account.get("email"), str) or not account["email"]:
+                rejected.append({"index": index, "error": "账户缺少email字段"})
+            else:
+                valid.append(account)
+        result = self.store.upsert_many(valid) if valid else {"created": 0, "updated": 0}
+        return {
+            "success": True,
+            "count": len(valid),
+            "created": result["created"],
+            "updated": result["updated"],
+            "rejected": rejected,
+            "sealed": self.store.vault.enabled
+        }
+
+
+class GetAccountHandler(AccountStoreHandler):
+    """查询单个账户处理器"""
+
+    def handle_store(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params应包含:
+        - email / userid: 要查询的账户
+        - reveal: bool, 为true时解密敏感字段（切换账户时使用）
+        """
+        account = self.store.get(email=params.get("email"), userid=params.get("userid"),
+                                 reveal=params.get("reveal") is True)
+        if account is None:
+            return {"success": False, "error": "账户不存在", "errorCode": "NOT_FOUND"}
+        return {"success": True, "account": account}
+
+
+class ListAccountsHandler(AccountStoreHandler):
+    """分页列出账户处理器"""
+
+    def handle_store(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params可包含:
+        - offset: int, 默认0
+        - limit: int, 默认50，最大1000
+        - sortBy: 'email' | 'userid' | 'expiresAt' | 'updatedAt' | 'createdAt'，默认'updatedAt'
+        - order: 'asc' | 'desc'，默认'desc'
+        """
+        page = self.store.list(
+            offset=params.get("offset", 0),
+            limit=params.get("limit", 50),
+            sort_by=params.get("sortBy", "updatedAt"),
+            order=params.get("order", "desc")
+        )
+        return {"success": True, **page}
+
+
+class ListAccountsByUrgencyHandler(AccountStoreHandler):
+    """按紧急程度列出账户处理器（当前账户置顶，附带预计算的过期信息）"""
+
+    def handle_store(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params可包含:
+        - offset: int, 默认0
+        - limit: int, 默认50，最大1000
+        - currentEmail: str, 当前账户email，置顶显示
+        """
+        page = self.store.list_by_urgency(
+            offset=params.get("offset", 0),
+            limit=params.get("limit", 50),
+            current_email=params.get("currentEmail")
+        )
+        return {"success": True, **page}
+
+
+class DeleteAccountHandler(AccountStoreHandler):
+    """删除账户处理器"""
+
+    def handle_store(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params应包含:
+        - email / userid: 要删除的账户；或
+        - all: bool, 为true时清空全部账户
+        """
+        deleted = self.store.delete(email=params.get("email"), userid=params.get("userid"),
+                                    delete_all=params.get("all") is True)
+        return {"success": True, "deleted": deleted}
+
+
+class VaultStatusHandler(AccountStoreHandler):
+    """保险库状态处理器"""
+
+    def handle_store(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {"success": True, **self.store.vault_status()}
+
+
+class EnableVaultHandler(AccountStoreHandler):
+    """启用保险库并加密已有账户处理器"""
+
+    def handle_store(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params可包含:
+        - preferKeyring: bool, 优先把密钥存入系统钥匙串，默认True
+        """
+        backend = self.store.vault.create_key(prefer_keyring=params.get("preferKeyring", True) is not False)
+        sealed = self.store.seal_existing()
+        return {"success": True, "backend": backend, "sealed": sealed, **self.store.vault_status()}
+
+
+class ClientAuthHandler(AccountStoreHandler):
+    """客户端登录状态写入处理器基类，统一处理客户端数据库的锁等待与文件错误"""
+
+    def __init__(self, store: Optional[AccountStore] = None, writer: Optional[ClientAuthWriter] = None):
+        super().__init__(store)
+        self.writer = writer or ClientAuthWriter()
+
+    def handle_store(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return self.handle_client(params)
+        except FileNotFoundError as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "suggestions": ["确保Cursor已安装并至少运行过一次"]
+            }
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e).lower() or "busy" in str(e).lower():
+                return {
+                    "success": False,
+                    "error": f"Cursor数据库繁忙，{self.writer.lock_timeout}秒内未能获得写锁",
+                    "errorCode": "CLIENT_DB_BUSY",
+                    "suggestions": ["稍后重试", "关闭Cursor后重试"],
+                    "technical_error": str(e)
+                }
+            raise
+
+    @abstractmethod
+    def handle_client(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        pass
+
+
+class SetClientAuthHandler(ClientAuthHandler):
+    """把已保存的账户写入Cursor客户端处理器"""
+
+    def handle_client(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params应包含:
+        - email / userid: 账户存储中的账户；或
+        - account: dict, 直接提供的账户（需含email和accessToken）
+        可选:
+        - backup: bool, 保存旧值以便回滚，默认True
+
+        写入后需重启Cursor客户端才会生效。
+        """
+        backup = params.get("backup", True) is not False
+        account = params.get("account")
+        if isinstance(account, dict):
+            result = self.writer.apply(account, backup=backup)
+            return {"success": True, "email": account.get("email"), **result}
+
+        # 已保存的账户使用预生成的快照，无需解密账户和生成键值
+        rows = self.store.get_auth_snapshot(email=params.get("email"), userid=params.get("userid"))
+        if rows is None:
+            return {"success": False, "error": "账户不存在或缺少accessToken", "errorCode": "NOT_FOUND"}
+        result = self.writer.apply_snapshot(rows, backup=backup)
+        email = next((value for key, value in rows if key == "cursorAuth/cachedEmail"), None)
+        return {"success": True, "email": email, **result}
+
+
+class RollbackClientAuthHandler(ClientAuthHandler):
+    """回滚最近一次setClientAuth处理器"""
+
+    def handle_client(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {"success": True, **self.writer.rollback()}
+
+
+class ExportAccountsHandler(AccountStoreHandler):
+    """流式导出账户（NDJSON）处理器"""
+
+    def handle_store(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params可包含:
+        - path: str, 导出到本机文件；省略时通过端口以chunk消息分块发送
+        - chunkChars: int, 每块字符数，默认131072
+
+        每个文本块发送后会附带进度事件 {"type": "progress", "processed", "total"}。
+        """
+        chunk_chars = max(1024, min(int(params.get("chunkChars", 128 * 1024)), 256 * 1024))
+        total = self.store.count()
+        path = params.get("path")
+        exported = 0
+
+        if not path:
+            for text, exported in self.store.iter_ndjson_chunks(chunk_chars):
+                self.emit({"type": "chunk", "action": "exportAccounts", "data": text,
+                           "processed": exported, "total": total})
+            return {"success": True, "type": "result", "exported": exported, "total": total}
+
+        path = os.path.expanduser(path)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for text, exported in self.store.iter_ndjson_chunks(chunk_chars):
+                    f.write(text)
+                    self.emit({"type": "progress", "action": "exportAccounts",
+                               "processed": exported, "total": total})
+            os.replace(tmp_path, path)
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return {"success": False, "error": f"写入导出文件失败: {str(e)}",
+                    "suggestions": ["检查目标目录是否存在且可写"]}
+        return {"success": True, "type": "result", "exported": exported, "total": total, "path": path}
+
+
+class ImportAccountsHandler(AccountStoreHandler):
+    """流式导入账户（NDJSON）处理器"""
+
+    READ_CHUNK_CHARS = 64 * 1024
+    PROGRESS_INTERVAL = 0.2
+
+    def handle_store(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        params三选一:
+        - path: str, 从本机文件读取
+        - stream: bool, 为true时先回复ready事件，随后通过端口逐条读取 {"chunk": str, "done": bool} 消息
+        - content: str, 直接携带的NDJSON文本（小数据量）
+        可选:
+        - dryRun: bool, 只校验和去重，不写入
+        """
+        importer = AccountImporter(self.store, dry_run=params.get("dryRun") is True)
+        processed_chars = 0
+        last_progress = 0.0
+
+        def progress(force: bool = False) -> None:
+            nonlocal last_progress
+            now = time.monotonic()
+            if force or now - last_progress >= self.PROGRESS_INTERVAL:
+                last_progress = now
+                self.emit({"type": "progress", "action": "importAccounts",
+                           "processedChars": processed_chars, **importer.stats})
+
+        if params.get("path"):
+            path = os.path.expanduser(params["path"])
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    while True:
+                        text = f.read(self.READ_CHUNK_CHARS)
+                        if not text:
+                            break
+                        importer.feed(text)
+                        processed_chars += len(text)
+                        progress()
+            except OSError as e:
+                return {"success": False, "error": f"读取导入文件失败: {str(e)}",
+                        "suggestions": ["检查文件路径是否正确", "确认文件为UTF-8编码的NDJSON"]}
+        elif params.get("stream") is True:
+            self.emit({"type": "ready", "action": "importAccounts"})
+            while True:
+                message = self.receive()
+                if message is None:
+                    return {"success": False, "error": "导入流在结束前断开", **importer.finish()}
+                text = message.get("chunk") or ""
+                importer.feed(text)
+                processed_chars += len(text)
+                if message.get("done"):
+                    break
+                # 每块都回复进度，扩展端据此发送下一块
+                progress(force=True)
+        elif isinstance(params.get("content"), str):
+            importer.feed(params["content"])
+            processed_chars = len(params["content"])
+        else:
+            return {"success": False, "error": "需要提供path、stream或content参数"}
+
+        result = importer.finish()
+        progress(force=True)
+        return {"success": True, "type": "result", "processedChars": processed_chars, **result}
+
+
 class ActionRegistry:
     """Action注册表"""
     
@@ -861,9 +4702,16 @@ class NativeHostServer:
     """原生主机服务器"""
 
     def __init__(self):
+        init_at = time.time()
         self.registry = ActionRegistry()
         self._register_default_handlers()
         self.use_nativemessaging = NATIVEMESSAGING_AVAILABLE
+        # 读取消息的时间点，供追踪使用；进程的第一条消息附带启动阶段
+        self._read_timing: Dict[str, float] = {
+            "processStartedAt": HOST_PROCESS_STARTED_AT,
+            "serverInitAt": init_at,
+            "serverReadyAt": time.time()
+        }
 
     def _register_default_handlers(self):
         """注册默认的处理器"""
@@ -872,6 +4720,28 @@ class NativeHostServer:
         self.registry.register("getScopeData", GetScopeDataHandler())
         self.registry.register("getClientCurrentData", GetClientCurrentDataHandler())
         self.registry.register("getDeepToken", GetDeepTokenHandler())
+        self.registry.register("decodeTokens", DecodeTokensHandler())
+
+        account_store = AccountStore()
+        self.registry.register("upsertAccount", UpsertAccountHandler(account_store))
+        self.registry.register("getAccount", GetAccountHandler(account_store))
+        self.registry.register("listAccounts", ListAccountsHandler(account_store))
+        self.registry.register("listAccountsByUrgency", ListAccountsByUrgencyHandler(account_store))
+        self.registry.register("deleteAccount", DeleteAccountHandler(account_store))
+        self.registry.register("auditAccounts", AuditAccountsHandler(account_store))
+        self.registry.register("getAccountUsage", GetAccountUsageHandler(account_store))
+        self.registry.register("exportAccounts", ExportAccountsHandler(account_store))
+        self.registry.register("importAccounts", ImportAccountsHandler(account_store))
+        self.registry.register("vaultStatus", VaultStatusHandler(account_store))
+        self.registry.register("enableVault", EnableVaultHandler(account_store))
+        self.registry.register("setClientAuth", SetClientAuthHandler(account_store))
+        self.registry.register("rollbackClientAuth", RollbackClientAuthHandler(account_store))
+        self.registry.register("getTokenHistory", GetTokenHistoryHandler(account_store))
+        self.registry.register("getMetrics", GetMetricsHandler())
+        self.registry.register("dumpLogs", DumpLogsHandler())
+        self.registry.register("listProfiles", ListProfilesHandler())
+        self.registry.register("memorySnapshot", MemorySnapshotHandler())
+        self.registry.register("memoryDiff", MemoryDiffHandler())
 
     def add_handler(self, action: str, handler: BaseActionHandler) -> None:
         """添加新的action处理器"""
@@ -880,16 +4750,20 @@ class NativeHostServer:
     def get_message(self) -> Dict[str, Any]:
         """从Chrome读取消息"""
         if self.use_nativemessaging:
-            # 使用 nativemessaging 库
-            return nativemessaging.get_message()
+            # 使用 nativemessaging 库（无法区分首字节和解码，两者记为同一时刻）
+            message = nativemessaging.get_message()
+            self._read_timing["firstByteAt"] = self._read_timing["decodedAt"] = time.time()
+            return message
         else:
             # 回退到手动实现
             raw_length = sys.stdin.buffer.read(4)
             if len(raw_length) == 0:
                 sys.exit(0)
+            self._read_timing["firstByteAt"] = time.time()
             message_length = struct.unpack('@I', raw_length)[0]
-            message = sys.stdin.buffer.read(message_length).decode('utf-8')
-            return json.loads(message)
+            message = json.loads(sys.stdin.buffer.read(message_length).decode('utf-8'))
+            self._read_timing["decodedAt"] = time.time()
+            return message
 
     def send_message(self, message: Dict[str, Any]) -> None:
         """发送消息到Chrome"""
@@ -906,7 +4780,25 @@ class NativeHostServer:
             sys.stdout.buffer.flush()
     
     def handle_request(self, message: Dict[str, Any]) -> Dict[str, Any]:
-        """处理请求"""
+        """处理请求；消息带trace时在响应中附上本次请求的span树"""
+        timing, self._read_timing = self._read_timing, {}
+        trace = message.get("trace")
+        if not isinstance(trace, dict) or not trace.get("id"):
+            return self._dispatch(message)
+
+        # 直接调用（测试、命令行）时没有读取时间点，以当前时刻为首字节
+        timing.setdefault("firstByteAt", time.time())
+        timing.setdefault("decodedAt", timing["firstByteAt"])
+        tracer = HostTracer.shared()
+        tracer.begin(str(trace["id"]), trace.get("sentAt"), timing)
+        try:
+            response = self._dispatch(message)
+        finally:
+            result = tracer.finish()
+        response["trace"] = result
+        return response
+
+    def _dispatch(self, message: Dict[str, Any]) -> Dict[str, Any]:
         action = message.get("action")
         params = message.get("params", {})
         
@@ -921,47 +4813,59 @@ class NativeHostServer:
                 "available_actions": available_actions
             }
         
+        handler.bind_port(self.send_message, self._receive_stream_message)
+        metrics = HostMetrics.shared()
+        metrics.current_action = action
+        started = time.perf_counter()
         try:
-            return handler.handle(params)
+            with HostTracer.shared().span("handler", "handler", action=action):
+                profiler = RequestProfiler.shared()
+                if profiler.selects(action):
+                    response = profiler.run(action, handler.handle, params)
+                else:
+                    response = handler.handle(params)
         except Exception as e:
-            return {"error": f"处理action '{action}' 时发生错误: {str(e)}"}
+            response = {"error": f"处理action '{action}' 时发生错误: {str(e)}"}
+        finally:
+            metrics.current_action = None
+        metrics.record_action(action, (time.perf_counter() - started) * 1000,
+                              error="error" in response or response.get("success") is False)
+        return response
+
+    def _receive_stream_message(self) -> Optional[Dict[str, Any]]:
+        """流式action读取后续消息，连接关闭时返回None"""
+        try:
+            return self.get_message()
+        except SystemExit:
+            return None
     
     def run(self) -> None:
         """运行服务器"""
+        logger = HostLogger.shared()
         try:
-            # 添加调试日志
-            self.log_debug(f"原生主机启动 (使用nativemessaging: {self.use_nativemessaging})")
+            logger.debug("原生主机启动 (使用nativemessaging: %s)", self.use_nativemessaging)
 
-            # get_message方法已经处理了nativemessaging的选择逻辑
-            self.log_debug(f"使用{'nativemessaging库' if self.use_nativemessaging else '手动实现'}处理消息")
-            message = self.get_message()
+            # 逐条处理消息直到Chrome关闭连接（get_message读到EOF时退出）；
+            # sendNativeMessage只发一条消息，connectNative端口可连续发送多条
+            while True:
+                message = self.get_message()
+                logger.debug("收到消息: %s", message)
 
-            self.log_debug(f"收到消息: {message}")
+                response = self.handle_request(message)
+                logger.debug("生成响应: %s", response)
 
-            response = self.handle_request(message)
-            self.log_debug(f"生成响应: {response}")
+                self.send_message(response)
+                logger.debug("响应已发送")
 
-            self.send_message(response)
-            self.log_debug("响应已发送")
+                # 响应已发出，等待后台任务（如缓存刷新）完成，并把本条消息的指标追加到指标文件
+                BackgroundWork.drain()
+                HostMetrics.shared().flush()
         except Exception as e:
             error_response = {"error": f"处理请求时发生错误: {str(e)}"}
-            self.log_debug(f"发生错误: {str(e)}")
+            logger.error("发生错误: %s", e)
             self.send_message(error_response)
-    
-    @staticmethod
-    def log_debug(message: str) -> None:
-        """记录调试信息到文件（仅在需要时启用）"""
-        try:
-            # 检查是否启用调试模式
-            debug_file = "/tmp/cursor_native_host_chrome.log"
-            if os.getenv("CURSOR_DEBUG") == "1":
-                with open(debug_file, "a", encoding="utf-8") as f:
-                    from datetime import datetime
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    f.write(f"[{timestamp}] {message}\n")
-                    f.flush()
-        except:
-            pass  # 忽略日志记录错误
+        finally:
+            logger.close()
 
 
 def main():
@@ -978,6 +4882,9 @@ def main():
             # 帮助信息
             print_help()
             return
+        elif sys.argv[1] in ("export", "import"):
+            # 账户导出/导入（NDJSON）
+            sys.exit(run_account_transfer(sys.argv[1], sys.argv[2:]))
     
     # 正常的原生主机模式
     server = NativeHostServer()
@@ -1027,6 +4934,59 @@ def test_native_host():
         traceback.print_exc()
 
 
+def run_account_transfer(command: str, args: List[str]) -> int:
+    """命令行导出/导入账户，进度输出到stderr；返回退出码"""
+    dry_run = "--dry-run" in args
+    paths = [arg for arg in args if arg != "--dry-run"]
+    target = paths[0] if paths else "-"
+
+    def show_progress(event: Dict[str, Any]) -> None:
+        if event.get("type") != "progress":
+            return
+        if command == "export":
+            sys.stderr.write(f"\r📤 已导出 {event['processed']}/{event['total']}")
+        else:
+            sys.stderr.write(f"\r📥 已处理 {event['lines']} 行，新增 {event['created']}，"
+                             f"更新 {event['updated']}，重复 {event['duplicates']}，无效 {event['invalid']}")
+        sys.stderr.flush()
+
+    store = AccountStore()
+    try:
+        if command == "export":
+            if target == "-":
+                exported = 0
+                for text, exported in store.iter_ndjson_chunks():
+                    sys.stdout.write(text)
+                sys.stdout.flush()
+                result: Dict[str, Any] = {"success": True, "exported": exported}
+            else:
+                handler: AccountStoreHandler = ExportAccountsHandler(store)
+                handler.bind_port(show_progress, lambda: None)
+                result = handler.handle({"path": target})
+        else:
+            if target == "-":
+                importer = AccountImporter(store, dry_run=dry_run)
+                for line in sys.stdin:
+                    importer.feed(line)
+                result = {"success": True, **importer.finish()}
+                show_progress({"type": "progress", **result})
+            else:
+                handler = ImportAccountsHandler(store)
+                handler.bind_port(show_progress, lambda: None)
+                result = handler.handle({"path": target, "dryRun": dry_run})
+    finally:
+        store.close()
+
+    sys.stderr.write("\n")
+    if not result.get("success"):
+        print(f"❌ {result.get('error')}", file=sys.stderr)
+        return 1
+    for error in result.get("errors", []):
+        print(f"⚠️ 第{error['line']}行: {error['error']}", file=sys.stderr)
+    print("✅ 完成", file=sys.stderr)
+    return 0
+
+
 def print_help():
     """打印帮助信息"""
     print("""
@@ -1036,6 +4996,8 @@ def print_help():
   python3 native_host.py           # 正常运行模式（由Chrome调用）
   python3 native_host.py test      # 测试模式
   python3 native_host.py help      # 显示此帮助信息
+  python3 native_host.py export [文件|-]              # 导出账户为NDJSON（默认输出到stdout）
+  python3 native_host.py import [文件|-] [--dry-run]  # 从NDJSON导入账户（按email/userid去重）
 
 测试模式:
   测试原生主机的各项功能，包括:
@@ -1043,6 +5005,16 @@ def print_help():
   - 客户端数据获取
   - 深度Token功能测试
 
+环境变量:
+  CURSOR_DEBUG=1            # 开启调试日志（后台批量写入日志文件，token自动脱敏）
+  CURSOR_LOG_LEVEL=INFO     # 日志级别: DEBUG / INFO / WARNING / ERROR
+  CURSOR_LOG_FILE=路径      # 日志文件，默认 /tmp/cursor_native_host_chrome.log
+  CURSOR_PROFILE=a,b        # 用cProfile剖析指定action（* 表示全部），结果见 listProfiles
+  CURSOR_PROFILE_KEEP=20    # 最多保留的 .pstats 文件数
+  CURSOR_APP_DATA_DIR=目录  # 从指定的Cursor数据目录读取（如 gen_cursor_profile.py 生成的合成数据）
+  CURSOR_TRACEMALLOC=1      # 启动即开启tracemalloc（数值为调用栈帧数），也可用 memorySnapshot 运行时开关
+                            # 快照只在同一进程内有效，需通过connectNative长连接发送 memorySnapshot / memoryDiff
+
 注意:
   - 正常情况下，此程序由Chrome浏览器自动调用
   - 直接运行时，程序会等待来自stdin的二进制消息
@@ -100,6 +100,7 @@ const QuickActions = {
     }
     
     try {
+      await chrome.runtime.sendMessage({ action: 'clearAccountStore' });
       await chrome.storage.local.clear();
       await chrome.runtime.sendMessage({ action: 'clearCookie' });
       SimpleToast.show('数据已清空', 'success');
@@ -12,15 +12,19 @@ find . -name "__pycache__" -type d -exec rm -rf {} + 2>/dev/null || true
 find . -name "*.pyc" -exec rm -f {} + 2>/dev/null || true
 
 # 运行测试
-echo "🚀 运行优化功能测试..."
-cd tests
-python3 test_optimizations.py
+echo "🚀 运行测试..."
+PYTHONDONTWRITEBYTECODE=1 python3 -B -m pytest tests -q --benchmark-disable
+status=$?
 
 # 再次清理，确保Chrome扩展加载不受影响
 echo "🧹 清理测试产生的缓存文件..."
-cd ..
 find . -name "__pycache__" -type d -exec rm -rf {} + 2>/dev/null || true
 find . -name "*.pyc" -exec rm -f {} + 2>/dev/null || true
 
+if [ $status -ne 0 ]; then
+    echo "❌ 测试失败"
+    exit $status
+fi
+
 echo "✅ 测试完成！现在可以安全地将扩展加载到Chrome中。"
 echo "=================================="
@@ -36,34 +36,26 @@ class TestManager:
         print("✅ 缓存清理完成")
     
     def run_tests(self):
-        """运行测试"""
-        print("🚀 运行优化功能测试...")
-        
-        # 确保tests目录存在
-        self.tests_dir.mkdir(exist_ok=True)
-        
-        # 运行测试脚本
-        test_script = self.tests_dir / "test_optimizations.py"
-        if test_script.exists():
-            try:
-                # 设置PYTHONDONTWRITEBYTECODE环境变量，防止生成.pyc文件
-                env = os.environ.copy()
-                env['PYTHONDONTWRITEBYTECODE'] = '1'
-                
-                result = subprocess.run([
-                    sys.executable, str(test_script)
-                ], cwd=str(self.tests_dir), env=env, capture_output=True, text=True)
-                
-                print(result.stdout)
-                if result.stderr:
-                    print("错误输出:", result.stderr)
-                    
-                return result.returncode == 0
-            except Exception as e:
-                print(f"❌ 测试运行失败: {e}")
-                return False
-        else:
-            print(f"❌ 测试脚本不存在: {test_script}")
+        """运行测试（基准测试用例各执行一次，只检查正确性不计时）"""
+        print("🚀 运行测试...")
+        return self._run_python(["-m", "pytest", str(self.tests_dir), "-q", "--benchmark-disable"])
+
+    def run_benchmarks(self, extra_args=None):
+        """运行基准测试并与tests/baselines中的基线对比，有退化时返回False"""
+        print("⏱️  运行基准测试并与基线对比...")
+        return self._run_python([str(self.tests_dir / "compare_benchmarks.py"), "run"] + list(extra_args or []))
+
+    def _run_python(self, args):
+        """以不写字节码的方式运行Python命令"""
+        try:
+            # 设置PYTHONDONTWRITEBYTECODE环境变量，防止生成.pyc文件
+            env = os.environ.copy()
+            env['PYTHONDONTWRITEBYTECODE'] = '1'
+
+            result = subprocess.run([sys.executable, "-B"] + args, cwd=str(self.project_root), env=env)
+            return result.returncode == 0
+        except Exception as e:
+            print(f"❌ 测试运行失败: {e}")
             return False
     
     def check_chrome_compatibility(self):
@@ -93,17 +85,9 @@ class TestManager:
         # 设置环境变量防止生成.pyc文件
         os.environ['PYTHONDONTWRITEBYTECODE'] = '1'
         
-        # 确保tests目录存在且在.gitignore中
+        # 确保tests目录存在（测试不写字节码，不会留下__pycache__）
         self.tests_dir.mkdir(exist_ok=True)
         
-        gitignore_path = self.project_root / ".gitignore"
-        if gitignore_path.exists():
-            content = gitignore_path.read_text()
-            if "tests/" not in content:
-                with gitignore_path.open("a") as f:
-                    f.write("\n# 测试目录（避免Chrome扩展加载时的__pycache__问题）\ntests/\n")
-                print("✅ 已更新.gitignore文件")
-        
         print("✅ 测试环境设置完成")
     
     def run_full_test_cycle(self):
@@ -143,13 +127,17 @@ def main():
         if command == "clean":
             manager.clean_pycache()
         elif command == "test":
-            manager.run_tests()
+            sys.exit(0 if manager.run_tests() else 1)
+        elif command == "bench":
+            success = manager.run_benchmarks(sys.argv[2:])
+            manager.clean_pycache()
+            sys.exit(0 if success else 1)
         elif command == "check":
             manager.check_chrome_compatibility()
         elif command == "setup":
             manager.setup_test_environment()
         else:
-            print("用法: python3 test_manager.py [clean|test|check|setup]")
+            print("用法: python3 test_manager.py [clean|test|bench|check|setup]")
             print("或直接运行进行完整测试周期")
             manager.run_full_test_cycle()
     else:
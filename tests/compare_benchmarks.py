@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+基准测试结果与JSON基线对比
+
+基线按 平台-解释器-版本 分文件保存在 tests/baselines/ 下（如 linux-cpython-3.11.json），
+只保留每个用例的统计值（秒）。中位数比基线慢超过阈值、且绝对差值超过下限时判为退化，退出码为1。
+
+用法:
+  python3 tests/compare_benchmarks.py run [--save] [--threshold 0.2] [-- 额外的pytest参数]
+  python3 tests/compare_benchmarks.py compare 结果.json [--baseline 路径] [--json]
+  python3 tests/compare_benchmarks.py save 结果.json [--baseline 路径]
+
+结果文件由 pytest --benchmark-json=结果.json 生成；run 会自动生成并对比。
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(TESTS_DIR, "baselines")
+STAT_KEYS = ("min", "median", "mean", "stddev", "iqr", "ops", "rounds")
+
+
+def default_baseline_path() -> str:
+    implementation = platform.python_implementation().lower()
+    version = "%d.%d" % sys.version_info[:2]
+    return os.path.join(BASELINE_DIR, f"{platform.system().lower()}-{implementation}-{version}.json")
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    """把pytest-benchmark的结果文件精简为基线格式"""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    machine = raw.get("machine_info", {})
+    return {
+        "version": 1,
+        "createdAt": raw.get("datetime") or datetime.now().isoformat(),
+        "machine": {
+            "python": machine.get("python_version"),
+            "implementation": machine.get("python_implementation"),
+            "system": machine.get("system"),
+            "machine": machine.get("machine"),
+            "cpu": (machine.get("cpu") or {}).get("brand_raw")
+        },
+        "commit": (raw.get("commit_info") or {}).get("id"),
+        "benchmarks": {
+            bench["fullname"].split("::", 1)[-1]: {
+                "group": bench.get("group"),
+                **{key: bench["stats"][key] for key in STAT_KEYS if key in bench["stats"]}
+            }
+            for bench in raw.get("benchmarks", [])
+        }
+    }
+
+
+def save_baseline(results: Dict[str, Any], path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False, sort_keys=True)
+        f.write("\n")
+    os.replace(temp_path, path)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float,
+            min_delta_us: float, metric: str = "median") -> Dict[str, Any]:
+    """逐个用例对比，状态为 regression / improvement / ok / new / missing"""
+    rows: List[Dict[str, Any]] = []
+    base_benchmarks = baseline.get("benchmarks", {})
+    current_benchmarks = current.get("benchmarks", {})
+    for name in sorted(set(base_benchmarks) | set(current_benchmarks)):
+        before = base_benchmarks.get(name, {}).get(metric)
+        after = current_benchmarks.get(name, {}).get(metric)
+        row: Dict[str, Any] = {"name": name, "baselineUs": None, "currentUs": None, "change": None}
+        if before is None:
+            row["status"] = "new"
+        elif after is None:
+            row["status"] = "missing"
+        else:
+            change = (after - before) / before if before else 0.0
+            delta_us = (after - before) * 1e6
+            if change > threshold and delta_us > min_delta_us:
+                row["status"] = "regression"
+            elif change < -threshold and -delta_us > min_delta_us:
+                row["status"] = "improvement"
+            else:
+                row["status"] = "ok"
+            row["change"] = round(change, 4)
+        row["baselineUs"] = round(before * 1e6, 3) if before is not None else None
+        row["currentUs"] = round(after * 1e6, 3) if after is not None else None
+        rows.append(row)
+    return {
+        "metric": metric,
+        "threshold": threshold,
+        "minDeltaUs": min_delta_us,
+        "baselineMachine": baseline.get("machine"),
+        "currentMachine": current.get("machine"),
+        "regressions": [row["name"] for row in rows if row["status"] == "regression"],
+        "results": rows
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    icons = {"regression": "🔴", "improvement": "🟢", "ok": "⚪", "new": "🆕", "missing": "❔"}
+    if report["baselineMachine"] != report["currentMachine"]:
+        print("⚠️ 基线与当前结果来自不同的机器或Python版本，对比仅供参考")
+    print(f"对比指标: {report['metric']}，阈值 ±{report['threshold']:.0%}（且差值 > {report['minDeltaUs']}us）")
+    for row in report["results"]:
+        change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+        before = f"{row['baselineUs']:.3f}" if row["baselineUs"] is not None else "-"
+        after = f"{row['currentUs']:.3f}" if row["currentUs"] is not None else "-"
+        print(f"{icons[row['status']]} {row['name']:<60} {before:>12} -> {after:>12} us  {change:>8}")
+    if report["regressions"]:
+        print(f"\n❌ {len(report['regressions'])} 个用例性能退化")
+    else:
+        print("\n✅ 没有性能退化")
+
+
+def run_pytest(result_path: str, extra_args: List[str]) -> int:
+    env = os.environ.copy()
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    command = [sys.executable, "-B", "-m", "pytest", TESTS_DIR, "-q",
+               f"--benchmark-json={result_path}",
+               f"--benchmark-storage=file://{tempfile.gettempdir()}/cursor_host_benchmarks"] + extra_args
+    return subprocess.call(command, env=env)
+
+
+def compare_and_report(results: Dict[str, Any], args: argparse.Namespace) -> int:
+    if not os.path.exists(args.baseline):
+        print(f"⚠️ 基线不存在: {args.baseline}，使用 --save 或 save 命令创建")
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if os.getenv("CURSOR_APP_DATA_DIR"):
+        print("⚠️ 设置了CURSOR_APP_DATA_DIR，读取路径的用例使用的是该目录的数据，与基线不可直接对比")
+    report = compare(baseline, results, args.threshold, args.min_delta_us, args.metric)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+    return 1 if report["regressions"] else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="原生主机基准测试基线对比")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(p: argparse.ArgumentParser) -> None:
+        p.add_argument("--baseline", default=default_baseline_path(), help="基线文件路径")
+        p.add_argument("--threshold", type=float, default=0.2, help="判为退化的相对变化，默认0.2（20%%）")
+        p.add_argument("--min-delta-us", type=float, default=2.0, help="绝对差值下限（微秒），过滤纳秒级抖动")
+        p.add_argument("--metric", default="median", choices=["median", "mean", "min"], help="对比的统计量")
+        p.add_argument("--json", action="store_true", help="输出JSON报告")
+
+    run_parser = sub.add_parser("run", help="运行基准测试并与基线对比")
+    add_common(run_parser)
+    run_parser.add_argument("--save", action="store_true", help="运行后把结果保存为新的基线（不做对比）")
+    run_parser.add_argument("pytest_args", nargs=argparse.REMAINDER, help="透传给pytest的参数（放在 -- 之后）")
+
+    compare_parser = sub.add_parser("compare", help="对比已有的结果文件")
+    add_common(compare_parser)
+    compare_parser.add_argument("result", help="pytest --benchmark-json 生成的结果文件")
+
+    save_parser = sub.add_parser("save", help="把结果文件保存为基线")
+    save_parser.add_argument("result", help="pytest --benchmark-json 生成的结果文件")
+    save_parser.add_argument("--baseline", default=default_baseline_path(), help="基线文件路径")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "save":
+        save_baseline(load_results(args.result), args.baseline)
+        print(f"✅ 基线已保存: {args.baseline}")
+        return 0
+
+    if args.command == "compare":
+        return compare_and_report(load_results(args.result), args)
+
+    extra_args = [arg for arg in args.pytest_args if arg != "--"]
+    with tempfile.TemporaryDirectory(prefix="cursor_host_bench_") as work_dir:
+        result_path = os.path.join(work_dir, "results.json")
+        exit_code = run_pytest(result_path, extra_args)
+        if exit_code != 0 or not os.path.exists(result_path):
+            print(f"❌ 基准测试运行失败（退出码 {exit_code}）")
+            return exit_code or 1
+        results = load_results(result_path)
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f"✅ 基线已保存: {args.baseline}")
+        return 0
+    return compare_and_report(results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+原生主机基准测试的公共夹具
+
+- 主机数据目录指向临时目录，不读写真实的 ~/.cursor_client2login；
+- cursor_profile 让 CursorDataManager 读取合成的Cursor数据目录：默认用 gen_cursor_profile.py
+  生成1×规模的小目录；运行前设置 CURSOR_APP_DATA_DIR 则直接读取该目录，
+  可用 gen_cursor_profile.py --scale 100 生成大规模数据后再运行同一套基准测试。
+"""
+
+import os
+import sys
+import tempfile
+from typing import NamedTuple
+
+# 扩展目录下不能出现__pycache__，必须在导入项目模块之前设置
+sys.dont_write_bytecode = True
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+os.environ.setdefault("CURSOR_HOST_DATA_DIR", tempfile.mkdtemp(prefix="cursor_host_bench_"))
+
+import pytest  # noqa: E402
+
+import native_host  # noqa: E402
+from gen_cursor_profile import generate_profile  # noqa: E402
+
+
+class CursorProfile(NamedTuple):
+    db_path: str
+    scope_path: str
+    email: str
+    userid: str
+
+
+@pytest.fixture(scope="session")
+def host():
+    """native_host模块"""
+    return native_host
+
+
+@pytest.fixture(scope="session")
+def cursor_profile(tmp_path_factory):
+    """CursorDataManager读取的Cursor数据目录"""
+    if not os.getenv(native_host.CursorDataManager.DATA_DIR_ENV):
+        data_dir = str(tmp_path_factory.mktemp("cursor_profile"))
+        os.environ[native_host.CursorDataManager.DATA_DIR_ENV] = data_dir
+        generate_profile(data_dir, rows=1000, breadcrumbs=100)
+    scope = native_host.CursorDataManager.read_scope_json()
+    if "error" in scope:
+        pytest.fail(f"Cursor数据目录不可用: {scope['error']}")
+    return CursorProfile(
+        native_host.CursorDataManager.get_cursor_db_path(),
+        native_host.CursorDataManager.get_scope_json_path(),
+        scope["email"],
+        scope["userid"]
+    )
@@ -0,0 +1,376 @@
+"""
+账户存储相关的行为测试（不计时）
+
+覆盖保险库加解密与篡改检测、客户端登录状态的切换/回滚及写锁繁忙时的备份、
+NDJSON导入的去重与dry-run，以及畸形token不会让批量操作整体失败。
+  python3 -B -m pytest tests/test_account_store.py --benchmark-disable
+"""
+
+import base64
+import glob
+import json
+import math
+import os
+import sqlite3
+
+import pytest
+
+from fake_cursor_server import make_fake_jwt
+from gen_cursor_profile import create_state_db
+
+
+def fake_jwt(payload):
+    """用任意payload拼出JWT（签名无效）"""
+    def encode(part):
+        raw = json.dumps(part).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+    return f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode(payload)}.signature"
+
+
+def make_account(index, valid_days=30):
+    userid = f"user_{index:04d}"
+    return {"email": f"user{index}@example.com", "userid": userid, "accessToken": make_fake_jwt(userid, valid_days)}
+
+
+@pytest.fixture
+def store(host, tmp_path):
+    store = host.AccountStore(db_path=str(tmp_path / "accounts.db"),
+                              vault=host.AccountVault(key_file=str(tmp_path / "vault.key")))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def sealed_store(host, store):
+    if not host.CRYPTOGRAPHY_AVAILABLE:
+        pytest.skip("未安装cryptography")
+    store.vault.create_key(prefer_keyring=False)
+    return store
+
+
+@pytest.fixture
+def client_db(tmp_path):
+    path = str(tmp_path / "state.vscdb")
+    create_state_db(path, 20, make_fake_jwt("client_user", 30), email="client@example.com")
+    return path
+
+
+@pytest.fixture
+def writer(host, client_db, tmp_path):
+    return host.ClientAuthWriter(db_path=client_db, backup_path=str(tmp_path / "client_auth_backup.json"),
+                                 lock_timeout=0.2)
+
+
+def client_email(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT value FROM ItemTable WHERE key = 'cursorAuth/cachedEmail'").fetchone()[0]
+    finally:
+        conn.close()
+
+
+# ---------- 保险库 ----------
+
+def test_vault_round_trip(host, sealed_store):
+    account = make_account(1)
+    sealed_store.upsert(account)
+
+    row = sealed_store.connect().execute("SELECT data, sealed FROM accounts WHERE email = ?",
+                                         (account["email"],)).fetchone()
+    assert row["sealed"] is not None
+    assert account["accessToken"] not in row["data"]
+
+    metadata = sealed_store.get(email=account["email"])
+    assert metadata["sealed"] is True and "accessToken" not in metadata
+    assert sealed_store.get(email=account["email"], reveal=True)["accessToken"] == account["accessToken"]
+    assert sealed_store.get_auth_snapshot(email=account["email"])[0] == ["cursorAuth/accessToken",
+                                                                         account["accessToken"]]
+    assert os.stat(sealed_store.vault.key_file).st_mode & 0o777 == 0o600
+
+
+def test_vault_rejects_tampered_record(host, sealed_store):
+    account = make_account(2)
+    sealed_store.upsert(account)
+    conn = sealed_store.connect()
+    record = bytearray(conn.execute("SELECT sealed FROM accounts WHERE email = ?", (account["email"],)).fetchone()[0])
+    record[-1] ^= 0x01
+    with conn:
+        conn.execute("UPDATE accounts SET sealed = ? WHERE email = ?", (bytes(record), account["email"]))
+
+    with pytest.raises(host.VaultError):
+        sealed_store.get(email=account["email"], reveal=True)
+    result = host.GetAccountHandler(sealed_store).handle({"email": account["email"], "reveal": True})
+    assert result["success"] is False and result["errorCode"] == "VAULT_ERROR"
+
+
+def test_vault_record_is_bound_to_email(host, sealed_store):
+    first, second = make_account(3), make_account(4)
+    sealed_store.upsert_many([first, second])
+    conn = sealed_store.connect()
+    with conn:
+        conn.execute("UPDATE accounts SET sealed = (SELECT sealed FROM accounts WHERE email = ?) WHERE email = ?",
+                     (first["email"], second["email"]))
+    with pytest.raises(host.VaultError):
+        sealed_store.get(email=second["email"], reveal=True)
+
+
+def test_enable_vault_seals_existing_accounts(host, store):
+    if not host.CRYPTOGRAPHY_AVAILABLE:
+        pytest.skip("未安装cryptography")
+    accounts = [make_account(i) for i in range(5)]
+    store.upsert_many(accounts)
+    store.get_auth_snapshot(email=accounts[0]["email"])
+
+    result = host.EnableVaultHandler(store).handle({"preferKeyring": False})
+    assert result["success"] and result["backend"] == "file"
+    assert result["sealedCount"] == 5 and result["plaintextCount"] == 0
+    assert store.connect().execute("SELECT COUNT(*) FROM auth_snapshots WHERE sealed IS NULL").fetchone()[0] == 0
+    assert store.get(email=accounts[0]["email"], reveal=True)["accessToken"] == accounts[0]["accessToken"]
+
+
+@pytest.mark.parametrize("sealed", [False, True])
+def test_partial_upsert_keeps_existing_secrets(host, store, sealed):
+    if sealed:
+        if not host.CRYPTOGRAPHY_AVAILABLE:
+            pytest.skip("未安装cryptography")
+        store.vault.create_key(prefer_keyring=False)
+    account = {**make_account(1), "refreshToken": "refresh-1", "createdTime": "2026-01-01T00:00:00Z"}
+    store.upsert(account)
+    assert store.upsert({"email": account["email"], "userid": account["userid"], "note": "x"})["created"] is False
+
+    content = ndjson([{"email": account["email"], "userid": account["userid"], "WorkosCursorSessionToken": "session"}])
+    assert host.ImportAccountsHandler(store).handle({"content": content})["updated"] == 1
+
+    stored = store.get(email=account["email"], reveal=True)
+    assert (stored["accessToken"], stored["refreshToken"]) == (account["accessToken"], "refresh-1")
+    assert (stored["WorkosCursorSessionToken"], stored["note"]) == ("session", "x")
+    assert stored["createdTime"] == account["createdTime"]
+
+
+def test_batch_upsert_reports_rejected_records(host, store):
+    accounts = [make_account(1), {"userid": "user_no_email"}, "not an object", make_account(2)]
+    result = host.UpsertAccountHandler(store).handle({"accounts": accounts})
+    assert result["success"] and (result["count"], result["created"]) == (2, 2)
+    assert [item["index"] for item in result["rejected"]] == [1, 2]
+    assert store.count() == 2
+
+
+# ---------- 客户端登录状态切换与回滚 ----------
+
+def test_set_and_rollback_client_auth(host, store, writer, client_db):
+    account = make_account(5)
+    store.upsert(account)
+
+    result = host.SetClientAuthHandler(store, writer).handle({"email": account["email"]})
+    assert result["success"] and result["previousEmail"] == "client@example.com"
+    assert client_email(client_db) == account["email"]
+
+    rollback = host.RollbackClientAuthHandler(store, writer).handle({})
+    assert rollback["success"] and rollback["restoredEmail"] == "client@example.com"
+    assert client_email(client_db) == "client@example.com"
+    assert not os.path.exists(writer.backup_path)
+
+    again = host.RollbackClientAuthHandler(store, writer).handle({})
+    assert again["success"] is False and "没有可回滚" in again["error"]
+
+
+def test_set_client_auth_missing_account_and_db(host, store, writer, tmp_path):
+    result = host.SetClientAuthHandler(store, writer).handle({"email": "nobody@example.com"})
+    assert result["success"] is False and result["errorCode"] == "NOT_FOUND"
+
+    missing = host.ClientAuthWriter(db_path=str(tmp_path / "missing.vscdb"),
+                                    backup_path=str(tmp_path / "backup.json"))
+    result = host.SetClientAuthHandler(store, missing).handle({"account": make_account(6)})
+    assert result["success"] is False and "suggestions" in result
+
+
+@pytest.mark.parametrize("use_snapshot", [False, True])
+def test_busy_client_db_keeps_previous_backup(host, store, writer, client_db, use_snapshot):
+    """写锁被占用时切换失败，上一次切换留下的备份不被覆盖，回滚仍回到最初的账户"""
+    first, second = make_account(7), make_account(8)
+    store.upsert_many([first, second])
+    handler = host.SetClientAuthHandler(store, writer)
+    assert handler.handle({"email": first["email"]})["success"]
+
+    blocker = sqlite3.connect(client_db, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        params = {"email": second["email"]} if use_snapshot else {"account": second}
+        result = handler.handle(params)
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+
+    assert result["success"] is False and result["errorCode"] == "CLIENT_DB_BUSY"
+    assert glob.glob(writer.backup_path + ".*.tmp") == []
+    assert client_email(client_db) == first["email"]
+    assert host.RollbackClientAuthHandler(store, writer).handle({})["restoredEmail"] == "client@example.com"
+
+
+@pytest.mark.parametrize("use_snapshot", [False, True])
+def test_backup_records_values_overwritten_under_lock(host, store, writer, client_db, monkeypatch, use_snapshot):
+    """暂存备份与获取写锁之间客户端改写了登录状态，回滚应恢复被覆盖的值而不是暂存时的旧值"""
+    account = make_account(9)
+    store.upsert(account)
+    stage_backup = writer._stage_backup
+
+    def stage_then_client_writes(previous):
+        staged = stage_backup(previous)
+        conn = sqlite3.connect(client_db)
+        with conn:
+            conn.execute("UPDATE ItemTable SET value = 'changed@example.com' WHERE key = 'cursorAuth/cachedEmail'")
+        conn.close()
+        return staged
+
+    monkeypatch.setattr(writer, "_stage_backup", stage_then_client_writes)
+    handler = host.SetClientAuthHandler(store, writer)
+    params = {"email": account["email"]} if use_snapshot else {"account": account}
+    assert handler.handle(params)["previousEmail"] == "changed@example.com"
+    monkeypatch.undo()
+    assert host.RollbackClientAuthHandler(store, writer).handle({})["restoredEmail"] == "changed@example.com"
+
+
+# ---------- NDJSON导入 ----------
+
+def ndjson(records):
+    return "".join((record if isinstance(record, str) else json.dumps(record)) + "\n" for record in records)
+
+
+def test_import_dedup_and_dry_run(host, store):
+    accounts = [make_account(i) for i in range(3)]
+    content = ndjson([
+        *accounts,
+        {**accounts[0], "email": accounts[0]["email"].upper()},   # 同一email（大小写不同）
+        {**make_account(9), "userid": accounts[1]["userid"]},      # 同一userid
+        {"email": "no-token@example.com", "userid": "user_x"},
+        "{not json",
+        [1, 2]
+    ])
+    handler = host.ImportAccountsHandler(store)
+
+    dry = handler.handle({"content": content, "dryRun": True})
+    assert dry["success"] and dry["dryRun"] is True
+    assert (dry["created"], dry["duplicates"], dry["invalid"]) == (3, 2, 3)
+    assert store.count() == 0
+
+    result = handler.handle({"content": content})
+    assert (result["created"], result["updated"], result["duplicates"]) == (3, 0, 2)
+    assert [error["line"] for error in result["errors"]] == [6, 7, 8]
+    assert store.count() == 3
+
+    again = handler.handle({"content": content})
+    assert (again["created"], again["updated"]) == (0, 3)
+
+
+def test_import_chunks_split_anywhere(host, store):
+    accounts = [make_account(i) for i in range(20)]
+    content = ndjson(accounts)
+    importer = host.AccountImporter(store)
+    for start in range(0, len(content), 7):
+        importer.feed(content[start:start + 7])
+    result = importer.finish()
+    assert (result["lines"], result["created"], result["invalid"]) == (20, 20, 0)
+
+
+def test_export_import_round_trip(host, store, tmp_path):
+    accounts = [make_account(i) for i in range(10)]
+    store.upsert_many(accounts)
+    path = str(tmp_path / "accounts.ndjson")
+    assert host.ExportAccountsHandler(store).handle({"path": path})["exported"] == 10
+
+    target = host.AccountStore(db_path=str(tmp_path / "target.db"),
+                               vault=host.AccountVault(key_file=str(tmp_path / "target.key")))
+    try:
+        result = host.ImportAccountsHandler(target).handle({"path": path})
+        assert result["created"] == 10
+        assert target.get(email=accounts[4]["email"], reveal=True)["accessToken"] == accounts[4]["accessToken"]
+    finally:
+        target.close()
+
+
+# ---------- 畸形token ----------
+
+@pytest.mark.parametrize("exp", [1e20, -1e20, math.nan, math.inf])
+def test_describe_out_of_range_exp(host, exp):
+    info = host.JWTClaimsDecoder().describe(fake_jwt({"sub": "auth0|user_1", "exp": exp}))
+    assert info["valid"] is False and "exp" in info["error"]
+
+
+@pytest.mark.parametrize("token", ["", "not-a-jwt", "a.b.c", fake_jwt(["list"]), fake_jwt({"exp": True})])
+def test_describe_malformed_tokens(host, token):
+    info = host.JWTClaimsDecoder().describe(token)
+    assert info["valid"] is False or info["exp"] is None
+
+
+def test_audit_classifies_malformed_records(host):
+    accounts = [
+        make_account(1),
+        {"email": 123, "userid": "user_2", "accessToken": make_fake_jwt("user_2")},
+        {"email": "user3@example.com", "userid": "user_3", "accessToken": ["not", "a", "token"]},
+        {"email": "user4@example.com", "userid": "user_4", "accessToken": fake_jwt({"sub": "auth0|user_4", "exp": 1e20})},
+        {"email": "user5@example.com", "userid": "user_5", "accessToken": "garbage"},
+        "not an object"
+    ]
+    result = host.AuditAccountsHandler(decoder=host.JWTClaimsDecoder()).handle(
+        {"accounts": accounts, "checkClient": False})
+    assert result["success"]
+    assert [item["status"] for item in result["results"]] == ["valid"] + ["malformed"] * 5
+    assert result["summary"]["malformed"] == 5
+
+
+def count_vault_opens(monkeypatch, store):
+    opened = []
+    original = store.vault.open
+
+    def counting_open(sealed, email):
+        opened.append(email)
+        return original(sealed, email)
+
+    monkeypatch.setattr(store.vault, "open", counting_open)
+    return opened
+
+
+def test_audit_store_decrypts_only_needed_rows(host, sealed_store, monkeypatch):
+    accounts = [make_account(i) for i in range(4)] + [
+        {"email": "garbage@example.com", "userid": "user_g", "accessToken": "garbage"},
+        {**make_account(5, valid_days=-1), "email": "expired@example.com"}
+    ]
+    sealed_store.upsert_many(accounts)
+    client_token = accounts[0]["accessToken"]
+    monkeypatch.setattr(host.CursorDataManager, "read_access_token",
+                        staticmethod(lambda: {"accessToken": client_token}))
+    opened = count_vault_opens(monkeypatch, sealed_store)
+
+    result = host.AuditAccountsHandler(sealed_store).handle({})
+    assert result["success"]
+    by_email = {item["email"]: item for item in result["results"]}
+    assert by_email["garbage@example.com"]["status"] == "malformed"
+    assert by_email["expired@example.com"]["status"] == "expired"
+    assert by_email[accounts[1]["email"]]["status"] == "valid"
+    assert "client_current" in by_email[accounts[0]["email"]]["flags"]
+    # 只解密token格式无法预解码的一行和与客户端同一用户的一行
+    assert sorted(opened) == sorted(["garbage@example.com", accounts[0]["email"]])
+
+
+def test_usage_from_fresh_cache_does_not_decrypt(host, sealed_store, monkeypatch, tmp_path):
+    accounts = [make_account(i) for i in range(3)]
+    sealed_store.upsert_many(accounts)
+    cache = host.UsageCache(path=str(tmp_path / "usage_cache.json"))
+    for account in accounts:
+        cache.put(account["userid"], {"fetchedAt": host.time.time(), "usage": {"body": {"n": 1}}})
+    opened = count_vault_opens(monkeypatch, sealed_store)
+
+    result = host.GetAccountUsageHandler(sealed_store, host.UsageService(cache=cache)).handle({})
+    assert result["success"] and result["sources"] == {"cache": 3}
+    assert opened == []
+
+
+def test_get_access_token_survives_history_errors(host, monkeypatch):
+    token = make_fake_jwt("user_history")
+    monkeypatch.setattr(host.CursorDataManager, "read_access_token", staticmethod(lambda: {"accessToken": token}))
+
+    def broken_history():
+        raise RuntimeError("history unavailable")
+
+    monkeypatch.setattr(host.TokenHistoryLog, "shared", classmethod(lambda cls: broken_history()))
+    assert host.GetAccessTokenHandler().handle({}) == {"accessToken": token}
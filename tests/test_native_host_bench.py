@@ -0,0 +1,187 @@
+"""
+原生主机热路径基准测试（pytest-benchmark）
+
+运行并与基线对比:
+  python3 tests/compare_benchmarks.py run
+在大规模合成数据上运行（不与默认基线对比）:
+  python3 gen_cursor_profile.py --scale 100 --wal-rows 1000 --out /tmp/cursor_x100
+  CURSOR_APP_DATA_DIR=/tmp/cursor_x100 python3 -B -m pytest tests
+只做冒烟测试（每个用例执行一次，不计时）:
+  python3 -B -m pytest tests --benchmark-disable
+"""
+
+import io
+import json
+import os
+import shutil
+import struct
+import sys
+import types
+
+import pytest
+
+from fake_cursor_server import make_fake_jwt
+from gen_cursor_profile import create_state_db
+
+SMALL_MESSAGE = {"action": "testConnection"}
+LARGE_MESSAGE = {
+    "action": "importAccounts",
+    "params": {"content": "\n".join(
+        json.dumps({"email": f"user{i}@example.com", "userid": f"user_{i:06d}", "accessToken": "x" * 400})
+        for i in range(500)
+    )}
+}
+MESSAGES = {"small": SMALL_MESSAGE, "large": LARGE_MESSAGE}
+FRAMING_PATHS = ["manual", "nativemessaging"]
+
+
+def frame(message):
+    content = json.dumps(message).encode("utf-8")
+    return struct.pack("@I", len(content)) + content
+
+
+@pytest.fixture
+def server(host):
+    return host.NativeHostServer()
+
+
+@pytest.fixture
+def framing_server(host, request):
+    """按参数选择手动实现或nativemessaging库的分帧路径"""
+    server = host.NativeHostServer()
+    if request.param == "nativemessaging":
+        if not host.NATIVEMESSAGING_AVAILABLE:
+            pytest.skip("未安装nativemessaging")
+        server.use_nativemessaging = True
+    else:
+        server.use_nativemessaging = False
+    return server
+
+
+# ---------- 分帧编解码 ----------
+
+@pytest.mark.benchmark(group="framing-encode")
+@pytest.mark.parametrize("framing_server", FRAMING_PATHS, indirect=True)
+@pytest.mark.parametrize("size", sorted(MESSAGES))
+def test_encode(benchmark, framing_server, size, monkeypatch):
+    stdout = types.SimpleNamespace(buffer=io.BytesIO())
+    monkeypatch.setattr(sys, "stdout", stdout)
+    message = MESSAGES[size]
+
+    def send():
+        stdout.buffer.seek(0)
+        stdout.buffer.truncate()
+        framing_server.send_message(message)
+
+    benchmark(send)
+    assert stdout.buffer.getvalue() == frame(message)
+
+
+@pytest.mark.benchmark(group="framing-decode")
+@pytest.mark.parametrize("framing_server", FRAMING_PATHS, indirect=True)
+@pytest.mark.parametrize("size", sorted(MESSAGES))
+def test_decode(benchmark, framing_server, size, monkeypatch):
+    stdin = types.SimpleNamespace(buffer=io.BytesIO(frame(MESSAGES[size])))
+    monkeypatch.setattr(sys, "stdin", stdin)
+
+    def receive():
+        stdin.buffer.seek(0)
+        return framing_server.get_message()
+
+    assert benchmark(receive) == MESSAGES[size]
+
+
+# ---------- action分发 ----------
+
+@pytest.mark.benchmark(group="dispatch")
+def test_dispatch_known_action(benchmark, server):
+    assert benchmark(server.handle_request, {"action": "testConnection"})["status"] == "connected"
+
+
+@pytest.mark.benchmark(group="dispatch")
+def test_dispatch_unknown_action(benchmark, server):
+    assert "error" in benchmark(server.handle_request, {"action": "noSuchAction"})
+
+
+@pytest.mark.benchmark(group="dispatch")
+def test_dispatch_traced(benchmark, server):
+    message = {"action": "testConnection", "trace": {"id": "bench"}}
+    assert "trace" in benchmark(server.handle_request, message)
+
+
+# ---------- 读取客户端数据 ----------
+
+@pytest.mark.benchmark(group="client-read")
+def test_read_access_token(benchmark, host, cursor_profile):
+    assert benchmark(host.CursorDataManager.read_access_token).get("accessToken")
+
+
+@pytest.mark.benchmark(group="client-read")
+def test_read_scope_json(benchmark, host, cursor_profile):
+    assert benchmark(host.CursorDataManager.read_scope_json)["userid"] == cursor_profile.userid
+
+
+@pytest.mark.benchmark(group="client-read")
+def test_read_access_token_cold_file(benchmark, host, cursor_profile, tmp_path, monkeypatch):
+    """每轮读取一个新复制的数据库文件（SQLite没有打开过，但内容仍在操作系统页缓存中）"""
+    counter = iter(range(10 ** 9))
+
+    def setup():
+        path = str(tmp_path / f"state_{next(counter)}.vscdb")
+        shutil.copyfile(cursor_profile.db_path, path)
+        if os.path.exists(cursor_profile.db_path + "-wal"):
+            shutil.copyfile(cursor_profile.db_path + "-wal", path + "-wal")
+        monkeypatch.setattr(host.CursorDataManager, "get_cursor_db_path", staticmethod(lambda: path))
+
+    result = benchmark.pedantic(host.CursorDataManager.read_access_token, setup=setup, rounds=50)
+    assert result.get("accessToken")
+
+
+# ---------- getClientCurrentData端到端 ----------
+
+def reset_process_caches(host):
+    """回到新进程第一次处理消息时的状态：JWT解码缓存和token历史索引都未加载"""
+    host.JWTClaimsDecoder._shared = None
+    host.TokenHistoryLog._shared = None
+
+
+@pytest.mark.benchmark(group="client-current-data")
+def test_client_current_data_warm(benchmark, host, cursor_profile):
+    handler = host.GetClientCurrentDataHandler()
+    handler.handle({"mode": "client"})
+    result = benchmark(handler.handle, {"mode": "client"})
+    assert result["success"] and result["email"] == cursor_profile.email
+
+
+@pytest.mark.benchmark(group="client-current-data")
+def test_client_current_data_cold(benchmark, host, cursor_profile):
+    handler = host.GetClientCurrentDataHandler()
+    result = benchmark.pedantic(handler.handle, args=({"mode": "client"},),
+                                setup=lambda: reset_process_caches(host), rounds=50)
+    assert result["success"] and result["userid"] == cursor_profile.userid
+
+
+@pytest.mark.benchmark(group="client-current-data")
+def test_client_current_data_token_rotation(benchmark, host, cursor_profile, tmp_path, monkeypatch):
+    """每轮客户端都换了新token：解码缓存未命中，token历史追加新记录"""
+    db_path = str(tmp_path / "rotating.vscdb")
+    create_state_db(db_path, 50, make_fake_jwt(cursor_profile.userid, 30))
+    monkeypatch.setattr(host.CursorDataManager, "get_cursor_db_path", staticmethod(lambda: db_path))
+    handler = host.GetClientCurrentDataHandler()
+
+    def rotate():
+        conn = host.sqlite3.connect(db_path)
+        with conn:
+            conn.execute("UPDATE ItemTable SET value = ? WHERE key = 'cursorAuth/accessToken'",
+                         (make_fake_jwt(cursor_profile.userid, 30),))
+        conn.close()
+
+    result = benchmark.pedantic(handler.handle, args=({"mode": "client"},), setup=rotate, rounds=50)
+    assert result["success"]
+
+
+@pytest.mark.benchmark(group="client-current-data")
+def test_client_current_data_request(benchmark, server, cursor_profile):
+    """经过handle_request（指标、追踪判断）的完整一次请求"""
+    message = {"action": "getClientCurrentData", "params": {"mode": "client"}}
+    assert benchmark(server.handle_request, message)["success"]